@@ -4,13 +4,13 @@ import requests
 import os
 import time
 import signal
-from colorama import Fore, Style, init
-from multiprocessing import Process, Manager
+import threading
 import argparse
 import yaml
 from logger import (
     init_logger, set_run_log, close_run_log, log
 )
+from cmd_runner import run_cmd
 # --- Parse CLI arguments ---
 parser = argparse.ArgumentParser(description="Automated XDP profiling runner")
 parser.add_argument("--branch", required=True, help="Tên nhánh (ví dụ: knn_threshold)")
@@ -45,65 +45,81 @@ LOG_FILE = os.path.join(BASEDIR, cfg["logging"]["main_log"])
 # --- Init logger ---
 init_logger(LOG_FILE)
 
-# --- Logging setup ---
-g_system_log = open(LOG_FILE, "a", buffering=1)
-g_log_file = None
-
-# --- Run shell command ---
-def run_cmd(cmd, desc, check=True):
-    log('DEBUG', f"{desc}: {' '.join(cmd)}")
-    try:
-        result = subprocess.run(cmd, check=check, capture_output=True, text=True)
-        if result.stdout.strip():
-            for line in result.stdout.splitlines():
-                log('INFO', f"  {line}", to_file=False)
-        if result.stderr.strip():
-            for line in result.stderr.splitlines():
-                log('WARN', f"  {line}", to_file=False)
-        return result
-    except subprocess.CalledProcessError as e:
-        log('ERROR', f"Command failed ({desc}): {e}")
-        if check:
-            raise
-        return None
-
 # --- Unload all XDP programs ---
 def unload_xdp():
     run_cmd(["sudo", "xdp-loader", "unload", iface, "--all"], "Unload all XDP programs", check=False)
     time.sleep(2)
 
-# --- Run xdp_stats (until stop signal) ---
-def run_xdp_stats(log_file_path, iface, stop_flag):
+# --- Run xdp_stats (until stop event) ---
+def run_xdp_stats(iface, stop_event, out):
+    """
+    Chạy xdp_stats tới khi stop_event được set. Mỗi dòng output kèm time.time() lúc đọc được
+    vào out["lines"] để cắt đúng cửa sổ replay sau đó; out["stopped_at"] = lúc gửi SIGINT.
+    """
     log('DEBUG', f"Starting xdp_stats on {iface} (wait until API done)...", to_file=False)
-    cmd = ["sudo", XDP_STATS_BIN, "--dev", iface, "--load-csv"]
-    with open(log_file_path, "a", buffering=1) as f:
-        proc = subprocess.Popen(cmd, stdout=f, stderr=subprocess.STDOUT, preexec_fn=os.setsid)
-        log('INFO', f"[XDP_STATS] Started (PID={proc.pid})", to_file=False)
-        try:
-            # Poll every 1s, stop when API done
-            while not stop_flag["done"]:
-                time.sleep(1)
-        finally:
-            if proc.poll() is None:
-                log('DEBUG', "[XDP_STATS] Stopping after API completed...", to_file=False)
-                os.killpg(proc.pid, signal.SIGINT)
-                time.sleep(1)
-                if proc.poll() is None:
-                    log('WARN', "[XDP_STATS] Forcing kill...", to_file=False)
-                    os.killpg(proc.pid, signal.SIGKILL)
-            log('INFO', "[XDP_STATS] Finished.", to_file=False)
+    # stdbuf -oL: xdp_stats ghi vào pipe theo từng dòng, timestamp mới khớp lúc in
+    cmd = ["sudo", "stdbuf", "-oL", XDP_STATS_BIN, "--dev", iface, "--load-csv"]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+                            errors="replace", bufsize=1, preexec_fn=os.setsid)
+    log('INFO', f"[XDP_STATS] Started (PID={proc.pid})", to_file=False)
+
+    def pump():
+        for line in proc.stdout:
+            out["lines"].append((time.time(), line))
+
+    reader = threading.Thread(target=pump, daemon=True)
+    reader.start()
+    try:
+        # Chặn tới khi API xong (threading.Event, không poll)
+        stop_event.wait()
+    finally:
+        out["stopped_at"] = time.time()
+        if proc.poll() is None:
+            log('DEBUG', "[XDP_STATS] Stopping after API completed...", to_file=False)
+            os.killpg(proc.pid, signal.SIGINT)
+            try:
+                proc.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                log('WARN', "[XDP_STATS] Forcing kill...", to_file=False)
+                os.killpg(proc.pid, signal.SIGKILL)
+                proc.wait()
+        reader.join(timeout=1)
+        log('INFO', "[XDP_STATS] Finished.", to_file=False)
+
+
+def write_replay_window(f, stats, start_wall, end_wall):
+    """
+    Ghi vào log của run các dòng xdp_stats trong cửa sổ replay [start_wall, end_wall];
+    output lúc thoát (sau SIGINT) giữ lại sau marker XDP_STATS_EXIT. Trả về (giữ, bỏ).
+    """
+    stopped_at = stats["stopped_at"] or end_wall
+    window = [line for ts, line in stats["lines"] if start_wall <= ts <= end_wall]
+    exit_lines = [line for ts, line in stats["lines"] if ts >= stopped_at]
+    f.write(f"=== REPLAY_WINDOW START={start_wall:.6f} END={end_wall:.6f} "
+            f"ELAPSED={end_wall - start_wall:.3f} ===\n")
+    f.writelines(window)
+    if exit_lines:
+        f.write("=== XDP_STATS_EXIT ===\n")
+        f.writelines(exit_lines)
+    kept = len(window) + len(exit_lines)
+    return kept, len(stats["lines"]) - kept
 
 # --- Call tcpreplay API (blocking) ---
 def call_tcpreplay_api(api_url):
-    print(f"[INFO] Gọi tcpreplay API {api_url} ...")
-    resp = requests.post(f"{api_url}", timeout=None)  # chờ đến khi xong
-    if resp.status_code == 200:
-        print("[INFO] tcpreplay hoàn tất, kết quả:")
-        print(resp.json())
-    else:
-        print(f"[ERROR] API trả mã lỗi {resp.status_code}: {resp.text}")
-
-    print("[INFO] Tiếp tục thực hiện phần tính toán...")
+    """Trả về JSON của API (có elapsed_s = thời gian replay thật) hoặc None nếu lỗi."""
+    log('INFO', f"Gọi tcpreplay API {api_url} ...")
+    try:
+        resp = requests.post(f"{api_url}", timeout=None)  # chờ đến khi xong
+    except requests.RequestException as e:
+        log('ERROR', f"tcpreplay API request failed: {e}")
+        return None
+    if resp.status_code != 200:
+        log('ERROR', f"API trả mã lỗi {resp.status_code}: {resp.text}")
+        return None
+    result = resp.json()
+    log('INFO', f"tcpreplay hoàn tất, kết quả: {result}")
+    log('INFO', "Tiếp tục thực hiện phần tính toán...")
+    return result
 
 def evaluate_results(file_pred, file_true, output_csv):
     """
@@ -189,8 +205,7 @@ for run_idx in range(1, NUM_RUNS + 1):
     log_file_bpf = os.path.join(ACC_DIR, f"{branch}_{param}_{run_idx}.log")
 
     # mở file log riêng cho run này
-    # global g_log_file
-    g_log_file = open(log_file_bpf, "a", buffering=1)
+    g_log_file = set_run_log(log_file_bpf)
     log('HEADER', f"=== RUN {run_idx}/{NUM_RUNS} ({branch}, param={param}) ===")
     try:
         # Load XDP
@@ -202,26 +217,36 @@ for run_idx in range(1, NUM_RUNS + 1):
             XDP_KERN_OBJ
         ], "Load XDP program")
 
-        # Shared flag giữa process
-        from multiprocessing import Manager
-        with Manager() as manager:
-            stop_flag = manager.dict()
-            stop_flag["done"] = False
-
-            # Start xdp_stats song song
-            p_xdp_stats = Process(target=run_xdp_stats, args=(log_file_bpf, iface, stop_flag))
-            p_xdp_stats.start()
-
-            # Start API call (blocking bên trong)
-            p_api = Process(target=call_tcpreplay_api, args=(api_url,))
-            p_api.start()
-
-            # Chờ API hoàn tất
-            p_api.join()
-
-            # Khi API kết thúc, báo xdp_stats dừng
-            stop_flag["done"] = True
-            p_xdp_stats.join()
+        # xdp_stats chạy trong thread, dừng ngay khi API trả về
+        stop_event = threading.Event()
+        stats = {"lines": [], "stopped_at": None}
+        t_xdp_stats = threading.Thread(target=run_xdp_stats, args=(iface, stop_event, stats))
+        t_xdp_stats.start()
+        try:
+            sent_wall = time.time()
+            result = call_tcpreplay_api(api_url)
+        finally:
+            end_wall = time.time()
+            stop_event.set()
+            t_xdp_stats.join()
+
+        # Cửa sổ replay thật = [end - elapsed_s, end]; dòng xdp_stats ngoài khoảng này bị bỏ
+        elapsed = (result or {}).get("elapsed_s")
+        start_wall = end_wall - elapsed if elapsed is not None else sent_wall
+        g_log_file.write(f"=== REPLAY_SENT TS={sent_wall:.6f} ===\n")
+        kept, dropped = write_replay_window(g_log_file, stats, start_wall, end_wall)
+        log('INFO', f"[REPLAY] Window {end_wall - start_wall:.3f}s "
+                    f"(request round-trip {end_wall - sent_wall:.3f}s), "
+                    f"kept {kept} xdp_stats lines, dropped {dropped} outside the window", to_file=False)
+
+        if result is None:
+            # API lỗi / mất kết nối: chỉ run này hỏng, dọn dẹp rồi sang run kế tiếp
+            log('ERROR', f"Run {run_idx}/{NUM_RUNS} failed: no replay result from {api_url}")
+            g_log_file.write(f"=== FAILED RUN={run_idx}, TIME={time.strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
+            unload_xdp()
+            run_cmd(["sudo", "rm", "-rf", f"/sys/fs/bpf/{iface}"],
+                    "Remove old BPF maps", check=False)
+            continue
 
         # Dump map to CSV
         log('INFO', f"Dumping map to CSV -> {csv_out}")
@@ -244,4 +269,4 @@ for run_idx in range(1, NUM_RUNS + 1):
         g_log_file.write(f"=== DONE RUN={run_idx}, TIME={time.strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
 
     finally:
-        g_log_file.close()
\ No newline at end of file
+        close_run_log()
\ No newline at end of file
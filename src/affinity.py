@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Kế hoạch CPU affinity cho orchestrator và collector.
+
+Core xử lý softirq XDP (`measured`, mặc định 0-3) là đối tượng đo; perf, sampler, power
+server, cpu monitor và chính orchestrator được ghim sang core `housekeeping` bằng
+sched_setaffinity (process con kế thừa affinity qua fork/exec, kể cả qua sudo).
+Tuỳ chọn `cgroup` đưa orchestrator vào một cpuset cgroup v2 có sẵn.
+
+    affinity:
+      enabled: true
+      measured: "0-3"
+      housekeeping: "4-7"
+      collectors:
+        perf: "7"
+
+Chạy file này để đo nhiễu collector trước/sau khi ghim:
+
+    python3 affinity.py bench --config ../config_pi.yml --seconds 10
+"""
+import argparse
+import json
+import multiprocessing as mp
+import os
+import time
+
+from logger import log
+
+# --- Giá trị mặc định cho mục `affinity:` trong config ---
+DEFAULT_AFFINITY = {
+    "enabled": False,
+    "measured": "0-3",      # core xử lý softirq XDP
+    "housekeeping": None,   # None = mọi core online trừ `measured`
+    "orchestrator": None,   # None = housekeeping
+    "workload": None,       # process thuộc workload (nn_filter_xdp.py), None = mọi core online
+    "collectors": {},       # ghi đè theo tên collector
+    "cgroup": None,         # thư mục cpuset cgroup v2, cần quyền ghi cgroup.procs
+}
+
+
+def parse_cpus(spec):
+    """"0-3,6" / 5 / [4, "6-7"] -> list core đã sắp xếp; None giữ nguyên None."""
+    if spec is None:
+        return None
+    if isinstance(spec, int):
+        return [spec]
+    if isinstance(spec, str):
+        spec = spec.split(",")
+    cpus = set()
+    for part in spec:
+        part = str(part).strip()
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-", 1)
+            cpus.update(range(int(lo), int(hi) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+# Affinity lúc import, trước khi apply_orchestrator() ghim orchestrator lại
+_initial_cpus = sorted(os.sched_getaffinity(0))
+
+
+def online_cpus():
+    """Core mà orchestrator được chạy lúc khởi động."""
+    return list(_initial_cpus)
+
+
+def load_affinity_config(cfg):
+    """Gộp mục `affinity:` của config với giá trị mặc định, chuẩn hoá danh sách core."""
+    acfg = {**DEFAULT_AFFINITY, **(cfg.get("affinity") or {})}
+    acfg["collectors"] = {name: parse_cpus(spec) for name, spec in (acfg["collectors"] or {}).items()}
+    all_cpus = online_cpus()
+    acfg["measured"] = parse_cpus(acfg["measured"]) or []
+    if acfg["housekeeping"] is None:
+        acfg["housekeeping"] = [c for c in all_cpus if c not in acfg["measured"]]
+    else:
+        acfg["housekeeping"] = parse_cpus(acfg["housekeeping"])
+    acfg["orchestrator"] = parse_cpus(acfg["orchestrator"]) or acfg["housekeeping"]
+    acfg["workload"] = parse_cpus(acfg["workload"]) or all_cpus
+    if acfg["enabled"]:
+        if not acfg["housekeeping"]:
+            log('WARN', f"[AFFINITY] No housekeeping cores besides measured {acfg['measured']}, "
+                        f"affinity plan disabled")
+            acfg["enabled"] = False
+        elif set(acfg["housekeeping"]) & set(acfg["measured"]):
+            log('WARN', f"[AFFINITY] Housekeeping cores {acfg['housekeeping']} overlap "
+                        f"measured cores {acfg['measured']}")
+    return acfg
+
+
+def collector_cpus(acfg, name):
+    """Core cho collector `name`; None nếu không ghim."""
+    if not acfg or not acfg["enabled"]:
+        return None
+    return acfg["collectors"].get(name) or acfg["housekeeping"]
+
+
+def pin_preexec(cpus):
+    """preexec_fn cho Popen/create_subprocess_exec: ghim process con trước khi exec."""
+    if not cpus:
+        return None
+
+    def preexec():
+        os.sched_setaffinity(0, cpus)
+    return preexec
+
+
+def placement(pid=0):
+    """Affinity hiệu lực của pid (0 = process hiện tại); None nếu process đã thoát."""
+    try:
+        return sorted(os.sched_getaffinity(pid))
+    except OSError:
+        return None
+
+
+def _join_cgroup(path):
+    try:
+        with open(os.path.join(path, "cgroup.procs"), "w") as f:
+            f.write(str(os.getpid()))
+        log('INFO', f"[AFFINITY] Joined cgroup {path}")
+    except OSError as e:
+        log('WARN', f"[AFFINITY] Cannot join cgroup {path}: {e}")
+
+
+def apply_orchestrator(acfg):
+    """Ghim orchestrator (và mọi process con về sau) sang housekeeping. Trả về affinity hiệu lực."""
+    if not acfg["enabled"]:
+        return placement()
+    if acfg["cgroup"]:
+        _join_cgroup(acfg["cgroup"])
+    os.sched_setaffinity(0, acfg["orchestrator"])
+    effective = placement()
+    log('INFO', f"[AFFINITY] Orchestrator pinned to {effective}, measured cores {acfg['measured']}")
+    return effective
+
+
+def plan_record(acfg):
+    """Kế hoạch + affinity hiệu lực của orchestrator, ghi vào metadata của cửa sổ đo."""
+    return {
+        "enabled": acfg["enabled"],
+        "measured": acfg["measured"],
+        "housekeeping": acfg["housekeeping"],
+        "orchestrator": placement(),
+        "cgroup": acfg["cgroup"],
+    }
+
+
+# --- Benchmark nhiễu collector ---
+def _workload(cpu, seconds, chunk, out):
+    """Vòng lặp cố định trên một core measured, đo thời gian mỗi chunk (ns)."""
+    os.sched_setaffinity(0, [cpu])
+    times = []
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        t0 = time.perf_counter_ns()
+        x = 0
+        for i in range(chunk):
+            x += i * i
+        times.append(time.perf_counter_ns() - t0)
+    out.send(times)
+    out.close()
+
+
+def _noise(cpus, seconds, busy_ms, period_ms, proc_stat):
+    """Giả lập collector: đọc /proc/stat rồi bận busy_ms trong mỗi period_ms."""
+    if cpus:
+        os.sched_setaffinity(0, cpus)
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        t0 = time.monotonic()
+        with open(proc_stat) as f:
+            f.read()
+        while (time.monotonic() - t0) * 1000 < busy_ms:
+            pass
+        time.sleep(max(0.0, period_ms / 1000 - (time.monotonic() - t0)))
+
+
+def _stats(times):
+    times = sorted(times)
+    n = len(times)
+    mean = sum(times) / n
+    var = sum((t - mean) ** 2 for t in times) / n
+    return {
+        "chunks": n,
+        "mean_us": mean / 1000,
+        "p99_us": times[min(n - 1, int(n * 0.99))] / 1000,
+        "cv": (var ** 0.5) / mean if mean else 0.0,
+    }
+
+
+def _bench_phase(acfg, noise_cpus, args):
+    ctx = mp.get_context("fork")
+    pipes, procs = [], []
+    for cpu in acfg["measured"]:
+        recv, send = ctx.Pipe(duplex=False)
+        procs.append(ctx.Process(target=_workload, args=(cpu, args.seconds, args.chunk, send)))
+        pipes.append(recv)
+    for _ in range(args.noise):
+        procs.append(ctx.Process(target=_noise, args=(noise_cpus, args.seconds, args.busy_ms,
+                                                      args.period_ms, args.proc_stat)))
+    for p in procs:
+        p.start()
+    per_core = {cpu: _stats(r.recv()) for cpu, r in zip(acfg["measured"], pipes)}
+    for p in procs:
+        p.join()
+    chunks = sum(s["chunks"] for s in per_core.values())
+    return {
+        "noise_cpus": noise_cpus,
+        "chunks_per_s": chunks / args.seconds,
+        "p99_us": max(s["p99_us"] for s in per_core.values()),
+        "cv": sum(s["cv"] for s in per_core.values()) / len(per_core),
+        "per_core": per_core,
+    }
+
+
+def bench(acfg, args):
+    """
+    Cùng một workload trên core measured, kèm `noise` process giả lập collector:
+    shared = collector chạy trên mọi core (như trước), isolated = ghim sang housekeeping.
+    """
+    if not acfg["housekeeping"] or not acfg["measured"]:
+        raise SystemExit(f"Need both measured and housekeeping cores (measured={acfg['measured']}, "
+                         f"housekeeping={acfg['housekeeping']}, online={online_cpus()})")
+    result = {"config": {k: getattr(args, k) for k in ("seconds", "noise", "chunk", "busy_ms", "period_ms")},
+              "measured": acfg["measured"], "housekeeping": acfg["housekeeping"]}
+    for phase, noise_cpus in (("shared", None), ("isolated", acfg["housekeeping"])):
+        log('INFO', f"[AFFINITY] Bench phase {phase}: {args.noise} noise procs on {noise_cpus or 'all cores'}")
+        result[phase] = _bench_phase(acfg, noise_cpus, args)
+    shared, isolated = result["shared"], result["isolated"]
+    result["throughput_gain"] = isolated["chunks_per_s"] / shared["chunks_per_s"] - 1
+    result["p99_reduction"] = 1 - isolated["p99_us"] / shared["p99_us"]
+    result["cv_reduction"] = 1 - isolated["cv"] / shared["cv"] if shared["cv"] else 0.0
+    for phase in ("shared", "isolated"):
+        r = result[phase]
+        log('INFO', f"[AFFINITY] {phase:<9} {r['chunks_per_s']:>10.1f} chunks/s  "
+                    f"p99 {r['p99_us']:>9.1f} us  cv {r['cv']:.3f}")
+    log('INFO', f"[AFFINITY] Isolation: throughput {result['throughput_gain']:+.1%}, "
+                f"p99 {-result['p99_reduction']:+.1%}, cv {-result['cv_reduction']:+.1%}")
+    return result
+
+
+if __name__ == "__main__":
+    import yaml
+
+    parser = argparse.ArgumentParser(description="CPU affinity plan cho collector")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_show = sub.add_parser("show", help="In kế hoạch affinity đã chuẩn hoá")
+    p_bench = sub.add_parser("bench", help="Đo nhiễu collector trên core measured, trước/sau khi ghim")
+    for p in (p_show, p_bench):
+        p.add_argument("--config", default=None, help="File config YAML (mục `affinity:`)")
+        p.add_argument("--measured", default=None, help="Ghi đè affinity.measured, vd 0-3")
+        p.add_argument("--housekeeping", default=None, help="Ghi đè affinity.housekeeping, vd 4-7")
+    p_bench.add_argument("--seconds", type=float, default=10.0)
+    p_bench.add_argument("--noise", type=int, default=4, help="Số process giả lập collector")
+    p_bench.add_argument("--chunk", type=int, default=20000, help="Số vòng lặp mỗi chunk workload")
+    p_bench.add_argument("--busy-ms", type=float, default=2.0)
+    p_bench.add_argument("--period-ms", type=float, default=5.0)
+    p_bench.add_argument("--proc-stat", default="/proc/stat")
+    p_bench.add_argument("--out", default=None, help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    cfg = {}
+    if args.config:
+        with open(args.config) as f:
+            cfg = yaml.safe_load(f) or {}
+    cfg["affinity"] = {**(cfg.get("affinity") or {}), "enabled": True}
+    for key in ("measured", "housekeeping"):
+        if getattr(args, key) is not None:
+            cfg["affinity"][key] = getattr(args, key)
+    acfg = load_affinity_config(cfg)
+
+    if args.cmd == "show":
+        print(json.dumps(acfg, indent=2))
+    else:
+        result = bench(acfg, args)
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(result, f, indent=2)
@@ -5,6 +5,7 @@ import yaml
 import os
 import argparse
 import signal
+import time
 
 app = Flask(__name__)
 parser = argparse.ArgumentParser()
@@ -23,11 +24,19 @@ SCRIPTS_REPLAY = cfg["scripts_tcpreplay"]
 IFACE = cfg["iface_lanforge"]
 
 
+current_proc = None
+
+
 def run_async(cmd):
     """Run tcpreplay in background"""
+    global current_proc
     try:
         print(f"[INFO] Running async command: {' '.join(cmd)}")
-        subprocess.run(cmd, check=True)
+        # Giữ handle (process group riêng) để /stop có thể dừng replay sớm
+        current_proc = subprocess.Popen(cmd, preexec_fn=os.setsid)
+        ret = current_proc.wait()
+        if ret != 0:
+            raise subprocess.CalledProcessError(ret, cmd)
         print("[INFO] tcpreplay finished successfully.")
     except Exception as e:
         print(f"[ERROR] tcpreplay failed: {e}")
@@ -38,6 +47,8 @@ def run_tcpreplay():
     data = request.json or {}
     log_file = data.get("log", "default.log")
     speed = int(data.get("speed", 100000))
+    # Orchestrator gửi duration = cửa sổ đo + cận trên warm-up
+    duration = int(data.get("duration", 125))
 
     # Validate input
     if not (10000 <= speed <= 200000):
@@ -48,7 +59,7 @@ def run_tcpreplay():
         IFACE,
         PCAP_FILE,
         str(speed),
-        "125",
+        str(duration),
         log_file
     ]
 
@@ -72,13 +83,19 @@ def stop_tcpreplay():
 def run_acc():
     """Blocking version — chỉ trả về khi tcpreplay kết thúc"""
     cmd = ["sudo", "tcpreplay", "-i", IFACE, "--limit=10000", PCAP_FILE]
+    # Thời gian replay thật để DUT cắt cửa sổ xdp_stats cho khớp
+    start_ts = time.time()
+    t0 = time.monotonic()
     result = subprocess.run(cmd, capture_output=True, text=True)
+    elapsed = time.monotonic() - t0
 
     return jsonify({
         "status": "ok" if result.returncode == 0 else "error",
         "stdout": result.stdout,
         "stderr": result.stderr,
-        "exit_code": result.returncode
+        "exit_code": result.returncode,
+        "start_ts": start_ts,
+        "elapsed_s": round(elapsed, 6)
     })
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Cache theo nội dung (content-addressed) cho bước chuyển model (rf2qs.py / read_model_to_map.py)
+và bước build (make -C XDP_PROG_DIR).
+
+Mỗi bước được định danh bằng hash của input (model pickle, script chuyển đổi, tham số,
+cây mã nguồn XDP). Lần đầu: chạy lệnh, so sánh snapshot cây thư mục trước/sau để biết
+file nào được sinh ra rồi lưu lại. Các lần sau cùng input: chỉ copy file đã lưu vào lại cây.
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import time
+
+from logger import log
+
+# --- Giá trị mặc định cho mục `cache:` trong config ---
+DEFAULT_CACHE = {
+    "enabled": True,
+    "dir": None,                                # mặc định: <base_dir>/artifact_cache
+    "exclude_dirs": [".git", "__pycache__"],
+    # read_model_to_map.py --iface còn ghi vào pinned map, không chỉ sinh file
+    "uncached_convert": ["randforest"],
+}
+
+_hash_memo = {}
+
+
+def load_cache_config(cfg, base_dir):
+    ccfg = {**DEFAULT_CACHE, **(cfg.get("cache") or {})}
+    if not ccfg["dir"]:
+        ccfg["dir"] = os.path.join(base_dir, "artifact_cache")
+    return ccfg
+
+
+def hash_file(path):
+    """sha256 của file, nhớ theo (mtime, size) để không hash lại pickle lớn mỗi cell."""
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    memo_key = (path, st.st_mtime_ns, st.st_size)
+    if memo_key not in _hash_memo:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        _hash_memo[memo_key] = h.hexdigest()
+    return _hash_memo[memo_key]
+
+
+def hash_key(parts):
+    """Hash ổn định của một list input (chuỗi, số, list...)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def source_files(root, exclude_dirs):
+    """
+    File nguồn của cây XDP: ưu tiên `git ls-files` (tracked + untracked không bị ignore),
+    nên file build (*.o, binary) thường đã bị loại qua .gitignore.
+    """
+    try:
+        out = subprocess.check_output(
+            ["git", "-C", root, "ls-files", "-co", "--exclude-standard", "-z"],
+            stderr=subprocess.DEVNULL
+        )
+        return sorted(p for p in out.decode().split("\0") if p)
+    except (subprocess.CalledProcessError, FileNotFoundError):
+        return sorted(snapshot_tree(root, exclude_dirs))
+
+
+def hash_tree(root, exclude_dirs):
+    h = hashlib.sha256()
+    for rel in source_files(root, exclude_dirs):
+        full = os.path.join(root, rel)
+        if os.path.isfile(full):
+            h.update(rel.encode() + b"\0" + hash_file(full).encode())
+    return h.hexdigest()
+
+
+def snapshot_tree(root, exclude_dirs):
+    """{relpath: (mtime_ns, size)} của mọi file thường trong cây."""
+    snap = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in exclude_dirs]
+        for name in filenames:
+            full = os.path.join(dirpath, name)
+            try:
+                st = os.lstat(full)
+            except FileNotFoundError:
+                continue
+            if os.path.islink(full):
+                continue
+            snap[os.path.relpath(full, root)] = (st.st_mtime_ns, st.st_size)
+    return snap
+
+
+class ArtifactCache:
+    def __init__(self, ccfg, tree_dir):
+        self.root = os.path.abspath(os.path.expanduser(ccfg["dir"]))
+        self.tree_dir = os.path.abspath(tree_dir)
+        self.exclude_dirs = set(ccfg["exclude_dirs"])
+        self.enabled = ccfg["enabled"]
+        os.makedirs(self.root, exist_ok=True)
+
+    def tree_hash(self):
+        return hash_tree(self.tree_dir, self.exclude_dirs)
+
+    def cached_step(self, stage, key_parts, fn):
+        """
+        Chạy fn() nếu chưa có artifact cho key_parts, ngược lại khôi phục artifact.
+        Trả về (hit, key).
+        """
+        key = hash_key([stage, key_parts])
+        if not self.enabled:
+            fn()
+            return False, key
+
+        entry = os.path.join(self.root, stage, key)
+        manifest_path = os.path.join(entry, "manifest.json")
+        if os.path.exists(manifest_path):
+            t0 = time.monotonic()
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            for rel in manifest["files"]:
+                dst = os.path.join(self.tree_dir, rel)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                # copy (không copy2): mtime = lúc khôi phục để make coi là input mới hơn .o cũ
+                shutil.copy(os.path.join(entry, "files", rel), dst)
+            log('INFO', f"[CACHE] {stage} hit {key[:12]}: restored {len(manifest['files'])} files "
+                        f"in {(time.monotonic() - t0) * 1000:.1f} ms")
+            return True, key
+
+        log('INFO', f"[CACHE] {stage} miss {key[:12]}, running step...")
+        before = snapshot_tree(self.tree_dir, self.exclude_dirs)
+        fn()
+        after = snapshot_tree(self.tree_dir, self.exclude_dirs)
+        changed = sorted(rel for rel, sig in after.items() if before.get(rel) != sig)
+
+        # Ghi vào thư mục tạm rồi rename -> entry không bao giờ bị dở dang
+        tmp = f"{entry}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        for rel in changed:
+            dst = os.path.join(tmp, "files", rel)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copy2(os.path.join(self.tree_dir, rel), dst)
+        os.makedirs(tmp, exist_ok=True)
+        with open(os.path.join(tmp, "manifest.json"), "w") as f:
+            json.dump({"stage": stage, "key_parts": key_parts, "files": changed,
+                       "created": time.strftime("%Y-%m-%d %H:%M:%S")}, f, indent=2, default=str)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            # Đã có entry khác ghi cùng key -> giữ bản cũ
+            shutil.rmtree(tmp, ignore_errors=True)
+        log('INFO', f"[CACHE] {stage} stored {len(changed)} files under {key[:12]}")
+        return False, key
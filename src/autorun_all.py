@@ -5,12 +5,23 @@ import os
 from pathlib import Path
 import time
 import signal
-from multiprocessing import Process
 import argparse
 from logger import (
     init_logger, set_run_log, close_run_log, log
 )
 import yaml
+from sweep_plan import load_sweep_plan, expand_cells, read_cells, cell_tag, SweepJournal
+from saturation_search import load_search_config, find_saturation
+from artifact_cache import load_cache_config, ArtifactCache, hash_file, hash_key
+from cell_metrics import summarize_throughput, ci_half_width, ci_converged
+from collector_runtime import run_collectors
+from collectors import load_collectors_config, build_collectors
+from warmup import load_warmup_config, wait_for_idle, wait_for_steady_state
+from host_tools import load_tools_config, privileged
+from cmd_runner import run_cmd
+from phase_timer import PhaseTimeline
+from affinity import load_affinity_config, apply_orchestrator
+from manifest import sweep_provenance, CellManifest
 
 # --- Parse CLI arguments ---
 parser = argparse.ArgumentParser(description="Automated XDP profiling runner")
@@ -18,7 +29,21 @@ parser.add_argument("--branch", required=True, help="Tên branch (ví dụ: knn_
 parser.add_argument("--param", required=True, help="Thông số thuật toán (ví dụ: 200)")
 parser.add_argument("--config", default="../../autorun_estimate/config_pc.yml", help="Đường dẫn file config YAML")
 parser.add_argument("--max-time", type=int, default=120, help="Thời gian chạy mỗi lần (mặc định: 120s)")
-parser.add_argument("--num-runs", type=int, default=5, help="Số lần lặp lại mỗi mức PPS (mặc định: 5)")
+parser.add_argument("--num-runs", type=int, default=None, help="Số lần lặp lại mỗi mức PPS (mặc định: sweep.num_runs trong config, hoặc 5)")
+parser.add_argument("--fresh", action="store_true", help="Bỏ qua journal cũ, chạy lại toàn bộ sweep")
+parser.add_argument("--mode", choices=["sweep", "search"], default="sweep",
+                    help="sweep: quét toàn bộ dải PPS; search: tìm điểm bão hoà RX/TX cho từng model")
+parser.add_argument("--ci-target", type=float, default=None,
+                    help="Dừng lặp một mức PPS khi CI 95%% half-width < ci_target × mean (vd: 0.02); --num-runs là số run tối đa")
+parser.add_argument("--load-once", action="store_true",
+                    help="Giữ XDP program của mỗi model attach qua mọi mức PPS, chỉ zero accounting_map giữa các bước")
+parser.add_argument("--collectors", default=None,
+                    help="Danh sách collector, cách nhau bởi dấu phẩy (ghi đè collectors.enabled), vd: throughput,cpu_power")
+parser.add_argument("--cells-file", default=None,
+                    help="File JSONL các cell cần chạy (do fleet.py sinh), thay cho ma trận sweep trong config")
+parser.add_argument("--results-dir", default=None, help="Ghi đè all_results_dir trong config")
+parser.add_argument("--no-cache", action="store_true", help="Tắt cache artifact (luôn chạy rf2qs.py/make)")
+parser.add_argument("--min-runs", type=int, default=None, help="Số run tối thiểu trước khi xét CI (mặc định: 2)")
 args = parser.parse_args()
 
 branch = args.branch
@@ -41,7 +66,7 @@ XDP_LOADER = cfg["xdp_program"]["xdp_loader"]
 
 GROUND_TRUTH = cfg["dataset"]["ground_truth"]
 LOG_FILE = os.path.join(BASEDIR, cfg["logging"]["main_log"])
-RESULTS_DIR = cfg["all_results_dir"]
+RESULTS_DIR = os.path.abspath(args.results_dir) if args.results_dir else cfg["all_results_dir"]
 BPF_DIR = os.path.join(RESULTS_DIR, cfg["results"]["bpf"])
 PERF_DIR = os.path.join(RESULTS_DIR, cfg["results"]["perf"])
 LANFORGE_DIR = cfg["results"]["lanforge"]
@@ -51,6 +76,23 @@ THROUGHPUT_SCRIPT = cfg["xdp_program"]["throughput_script"]
 SERVER_SCRIPT = cfg["xdp_program"]["server_scripts"]
 THROUGHPUT_DIR = os.path.join(RESULTS_DIR, cfg["results"]["throughput"])
 POWER_DIR = os.path.join(RESULTS_DIR, cfg["results"]["power"])
+TIMING_DIR = os.path.join(RESULTS_DIR, cfg["results"].get("timing", "timing"))
+MANIFEST_DIR = os.path.join(RESULTS_DIR, cfg["results"].get("manifest", "manifest"))
+TOOLS = load_tools_config(cfg)
+BPF_PIN_DIR = os.path.join(TOOLS["bpffs"], iface)
+ACCOUNTING_MAP = os.path.join(BPF_PIN_DIR, "accounting_map")
+# Script con (estimate_throughput_latency.py) đọc cùng backend qua biến môi trường
+os.environ["ACCOUNTING_BACKEND"] = TOOLS["accounting_backend"]
+WARMUP = load_warmup_config(cfg)
+CACHE_CFG = load_cache_config(cfg, BASEDIR)
+if args.no_cache:
+    CACHE_CFG["enabled"] = False
+artifact_cache = ArtifactCache(CACHE_CFG, XDP_PROG_DIR)
+COLLECTOR_CFG = load_collectors_config(cfg, ["power_server", "cpu_power", "throughput", "perf"], args.collectors)
+AFFINITY = load_affinity_config(cfg)
+# Provenance chung của sweep (đường dẫn tương đối tính trước mọi os.chdir)
+XDP_KERN_OBJ_PATH = os.path.abspath(XDP_KERN_OBJ)
+PROVENANCE = sweep_provenance(args.config, XDP_PROG_DIR)
 
 HOME_DIR = str(Path.home())
 if branch == "randforest" or branch == "svm":
@@ -58,8 +100,13 @@ if branch == "randforest" or branch == "svm":
 else:
     PYTHON_SCRIPS = cfg["xdp_program"]["python_quickXDP"]
 
+# --- Sequential stopping (mục `sequential:` trong config) ---
+DEFAULT_SEQUENTIAL = {"ci_target": None, "min_runs": 2, "skip_rows": 15}
+
 # --- Init logger ---
 init_logger(LOG_FILE)
+# Orchestrator + mọi process con (make, sudo, collector) chạy trên core housekeeping
+apply_orchestrator(AFFINITY)
 
 # --- Prepare folders ---
 os.makedirs(BPF_DIR, exist_ok=True)
@@ -67,34 +114,18 @@ os.makedirs(PERF_DIR, exist_ok=True)
 os.makedirs(THROUGHPUT_DIR, exist_ok=True)
 os.makedirs(POWER_DIR, exist_ok=True)
 
+# --- Timeline theo phase của từng cell (tóm tắt bằng phase_timer.py) ---
+timeline = PhaseTimeline(os.path.join(RESULTS_DIR, f"phase_timeline_{branch}_{param}.jsonl"))
+
 # --- System-wide log file ---
 g_system_log = open(LOG_FILE, "a", buffering=1)
 g_log_file = None  # profiling log (per-run)
 
-# --- Run shell command ---
-def run_cmd(cmd, desc, check=True):
-    log('DEBUG', f"{desc}: {' '.join(cmd)}")
-    try:
-        result = subprocess.run(cmd, check=check, capture_output=True, text=True)
-        if result.stdout.strip():
-            for line in result.stdout.splitlines():
-                log('INFO', f"  {line}", to_file=False)
-        if result.stderr.strip():
-            for line in result.stderr.splitlines():
-                log('WARN', f"  {line}", to_file=False)
-        return result
-    except subprocess.CalledProcessError as e:
-        log('ERROR', f"Command failed ({desc}): {e}")
-        log('ERROR', f"STDOUT: {e.stdout.strip()}")
-        log('ERROR', f"STDERR: {e.stderr.strip()}")
-        if check: raise
-        return None
-
 # --- Get loaded XDP program ID ---
 def get_prog_id():
     log('DEBUG', "Getting XDP program ID for 'xdp_anomaly_detector'...")
     try:
-        bpftool_out = subprocess.check_output(["sudo", "bpftool", "prog", "show"], text=True)
+        bpftool_out = subprocess.check_output(privileged(TOOLS, TOOLS["bpftool"], "prog", "show"), text=True)
     except subprocess.CalledProcessError as e:
         log('ERROR', f"Failed to run bpftool: {e}")
         raise RuntimeError("bpftool failed.")
@@ -108,8 +139,10 @@ def get_prog_id():
 
 # --- Unload all XDP programs ---
 def unload_xdp():
-    run_cmd(["sudo", "xdp-loader", "unload", iface, "--all"], "Unload all XDP programs", check=False)
-    time.sleep(2)
+    with timeline.phase("unload"):
+        run_cmd(privileged(TOOLS, TOOLS["xdp_loader_cli"], "unload", iface, "--all"), "Unload all XDP programs", check=False)
+    with timeline.phase("unload_settle"):
+        time.sleep(TOOLS["unload_settle"])
 
 # --- Call tcpreplay API ---
 def call_tcpreplay_api(api_url, log_file, speed, duration):
@@ -124,130 +157,6 @@ def call_tcpreplay_api(api_url, log_file, speed, duration):
     except Exception as e:
         log('ERROR', f"Failed to call API: {e}")
 
-# --- Run BPF profiling ---
-def run_bpftool_profiling(prog_id, log_file_path, duration):
-    log('DEBUG', f"Starting bpftool profiling ({duration}s)...", to_file=False)
-    with open(log_file_path, "a", buffering=1) as f:
-        proc = subprocess.Popen(
-            ["sudo", "bpftool", "prog", "profile", "id", prog_id,
-             "l1d_loads", "llc_misses", "itlb_misses", "dtlb_misses"],
-            stdout=f, stderr=subprocess.STDOUT, preexec_fn=os.setsid
-        )
-        log('INFO', f"[BPF] Profiling started (PID={proc.pid})", to_file=False)
-        time.sleep(duration)
-        if proc.poll() is None:
-            log('DEBUG', f"[BPF] Sending SIGINT to stop profiling...", to_file=False)
-            os.killpg(proc.pid, signal.SIGINT)
-            try:
-                proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                log('WARN', "[BPF] Forcing SIGKILL...", to_file=False)
-                os.killpg(proc.pid, signal.SIGKILL)
-        log('INFO', "[BPF] Profiling completed.", to_file=False)
-        
-def read_proc_stat():
-    stats = {}
-    
-    with open("/proc/stat") as f:
-        for line in f:
-            if line.startswith("cpu"):
-                parts = line.split()
-                cpu = parts[0]
-                values = list(map(int, parts[1:]))
-                total = sum(values)
-                idle = values[3] + values[4]
-                stats[cpu] = (total, idle)
-    return stats
-
-def read_energy_uj():
-    path = "/sys/class/powercap/intel-rapl:0/energy_uj"
-    try:
-        with open(path) as f:
-            return int(f.read().strip())
-    except:
-        return None
-    
-def monitor_cpu_power(csv_path, duration, interval=1.0):
-    with open(csv_path, "w", buffering=1) as f:
-        f.write("timestamp,cpu,cpu0,cpu1,cpu2,cpu3,power_w\n")
-        
-        t_start = time.time()
-        prev_stat = read_proc_stat()
-        prev_energy = read_energy_uj()
-        prev_time = time.time()
-        
-        while time.time() - t_start < duration:
-            time.sleep(interval)
-            
-            now_stat = read_proc_stat()
-            now_energy = read_energy_uj()
-            now_time = time.time()
-            
-            row = [f"{now_time:.3f}"]
-            
-            for cpu in ["cpu", "cpu0", "cpu1", "cpu2", "cpu3"]:
-                if cpu in prev_stat and cpu in now_stat:
-                    t1, i1 = prev_stat[cpu]
-                    t2, i2 = now_stat[cpu]
-                    dt = t2 - t1
-                    di = i2 - i1
-                    usage = 100 * (1 - di / dt) if dt > 0 else 0.0
-                    
-                else:
-                    usage = 0.0
-                    
-                row.append(f"{usage:.2f}")
-            
-            if prev_energy is not None and now_energy is not None:
-                power = (now_energy - prev_energy) / 1e6 / (now_time - prev_time)
-            else:
-                power = 0.0
-
-            row.append(f"{power:.3f}")
-            f.write(",".join(row) + "\n")
-
-            prev_stat = now_stat
-            prev_energy = now_energy
-            prev_time = now_time
-
-def run_perf_profiling(svg_file, log_file_path, duration, core_id):
-    log('DEBUG', f"Starting perf ({duration}s)...", to_file=False)
-    with open(log_file_path, "a", buffering=1) as f:
-        proc = subprocess.Popen(
-            ["sudo", FLAMEGRAPH_SCRIPT, svg_file, str(duration), str(core_id)],
-            stdout=f, stderr=subprocess.STDOUT, preexec_fn=os.setsid
-        )
-        log('INFO', f"[PERF] Started (PID={proc.pid})", to_file=False)
-        proc.wait()
-        log('INFO', "[PERF] Completed.", to_file=False)
-
-# --- Run POWER server (FIXED: Added sudo and check return code) ---
-def run_power_server(csv_path, log_file_path, duration):
-    log('DEBUG', f"Starting server for {duration}s...", to_file=False)
-    with open(log_file_path, "a", buffering=1) as f:
-        proc = subprocess.Popen(
-            # FIX: Thêm "sudo" để đảm bảo quyền truy cập cảm biến
-            ["sudo", "python3", SERVER_SCRIPT, "--csv", csv_path],
-            stdout=f, stderr=subprocess.STDOUT, preexec_fn=os.setsid
-        )
-        log('INFO', f"[POWER] Started (PID={proc.pid})", to_file=False)
-        try:
-            proc.wait(timeout=duration)  # đợi đúng duration
-        except subprocess.TimeoutExpired:
-            log('DEBUG', "[POWER] Timeout reached, sending SIGINT...", to_file=False)
-            os.killpg(proc.pid, signal.SIGINT)  # gửi SIGINT cho process group
-            try:
-                proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                log('WARN', "[POWER] Forcing SIGKILL...", to_file=False)
-                os.killpg(proc.pid, signal.SIGKILL)
-        
-        # FIX: Kiểm tra mã thoát
-        if proc.returncode is not None and proc.returncode != 0:
-             log('ERROR', f"[POWER] Completed with non-zero exit code: {proc.returncode}. Check {log_file_path} for errors.", to_file=False)
-        else:
-            log('INFO', "[POWER] Completed.", to_file=False)
-
 def stop_remote_traffic(api_url):
     stop_url = api_url.replace("/run", "/stop")
     log('DEBUG', f"Stopping remote traffic via {stop_url}")
@@ -268,225 +177,389 @@ def stop_remote_traffic(api_url):
     except Exception as e:
         log('WARN', f"Failed to stop remote traffic: {e}")
 
-def run_throughput_latency(branch, param, pps, run_idx, m, sz, duration):
+def collector_context(cell, prog_id=None):
+    """Thông tin một cell cho các collector (xem collectors.py)."""
+    return {
+        "tag": cell_tag(cell),
+        "duration": MAX_TIME,
+        "iface": iface,
+        "accounting_map": ACCOUNTING_MAP,
+        "prog_id": prog_id,
+        "sudo": TOOLS["sudo"],
+        "bpftool": TOOLS["bpftool"],
+        "affinity": AFFINITY,
+        "dirs": {"bpf": BPF_DIR, "perf": PERF_DIR, "power": POWER_DIR, "throughput": THROUGHPUT_DIR},
+        "paths": {
+            "server_script": SERVER_SCRIPT,
+            "throughput_script": THROUGHPUT_SCRIPT,
+            "flamegraph_script": FLAMEGRAPH_SCRIPT,
+        },
+    }
+
+def convert_model(m, sz, model_file):
     """
-    Đo throughput/latency song song trong thời gian chỉ định.
-    Kết quả được ghi vào file CSV theo format {branch}_{param}_{pps}_{run_idx}_{m}_{sz}.csv
+    Chuyển model sang dạng XDP (rf2qs.py / read_model_to_map.py), có cache theo hash
+    của model, script và tham số. Trả về cache key để bước build dùng làm input.
     """
-    output_csv = os.path.join(THROUGHPUT_DIR, f"{branch}_{param}_{pps}_{run_idx}_{m}_{sz}.csv")
-    log_file_path = os.path.join(THROUGHPUT_DIR, f"log_{branch}_{param}_{pps}_{run_idx}_{m}_{sz}.txt")
-
-    cmd = [
-        "sudo", "python3", THROUGHPUT_SCRIPT,
-        f"/sys/fs/bpf/{iface}/accounting_map",
-        output_csv,
-        str(duration)
-    ]
-
-    log('DEBUG', f"Starting throughput/latency measurement ({duration}s)...", to_file=False)
-    log('INFO', f"[THROUGHPUT] Command: {' '.join(cmd)}", to_file=False)
-    log('INFO', f"[THROUGHPUT] Output CSV: {output_csv}", to_file=False)
-
-    with open(log_file_path, "a", buffering=1) as f:
-        proc = subprocess.Popen(
-            cmd,
-            stdout=f,
-            stderr=subprocess.STDOUT,
-            preexec_fn=os.setsid
-        )
-        log('INFO', f"[THROUGHPUT] Started (PID={proc.pid})", to_file=False)
-
-        try:
-            proc.wait(timeout=duration + 10)
-            log('INFO', "[THROUGHPUT] Completed successfully.", to_file=False)
-        except subprocess.TimeoutExpired:
-            log('WARN', "[THROUGHPUT] Timeout reached, sending SIGINT...", to_file=False)
-            os.killpg(proc.pid, signal.SIGINT)
-            try:
-                proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                log('WARN', "[THROUGHPUT] Forcing SIGKILL...", to_file=False)
-                os.killpg(proc.pid, signal.SIGKILL)
-        except Exception as e:
-            log('ERROR', f"[THROUGHPUT] Error: {e}", to_file=False)
-        finally:
-            log('INFO', "[THROUGHPUT] Measurement finished.", to_file=False)
+    log('INFO', f"Running python3 {PYTHON_SCRIPS} --model {model_file}")
+    if branch == "randforest":
+        cmd = [
+            "python3",
+            PYTHON_SCRIPS,
+            "--max_tree", str(m),
+            "--max_leaves", str(sz),
+            "--iface", iface,
+            "--model_folder", "../../security_paper/rf",
+            "--home_folder", "/home/gnb/"
+        ]
+        desc, inputs = "Run read_model_to_map.py", [model_file]
+    elif branch == "quickscore":
+        cmd = ["python3", PYTHON_SCRIPS, "--model", model_file]
+        desc, inputs = "Run rf2qs.py", [model_file]
+    else:
+        svm_model = "../../security_paper/svm/models/SVM-Linear.pkl"
+        svm_scaler = "../../security_paper/svm/scalers/scaler_SVM-Linear.pkl"
+        cmd = ["python3", PYTHON_SCRIPS, "--svm_model", svm_model, "--scaler", svm_scaler]
+        desc, inputs = "Run read_model_to_map.py", [svm_model, svm_scaler]
+
+    key_parts = {
+        "branch": branch,
+        "cmd": cmd,
+        "cwd": os.getcwd(),
+        "script": hash_file(PYTHON_SCRIPS),
+        "inputs": {p: hash_file(p) if os.path.exists(p) else None for p in inputs},
+    }
+    if branch in CACHE_CFG["uncached_convert"]:
+        # read_model_to_map.py --iface còn ghi model vào pinned map -> không thể chỉ khôi phục file
+        run_cmd(cmd, desc, check=True, timeout=TOOLS["cmd_timeout"])
+        key = hash_key(key_parts)
+    else:
+        _, key = artifact_cache.cached_step("convert", key_parts, lambda: run_cmd(cmd, desc, check=True, timeout=TOOLS["cmd_timeout"]))
+    if branch == "randforest":
+        run_cmd(privileged(TOOLS, TOOLS["xdp_loader_cli"], "unload", iface, "--all"), "Unload", check=True)
+    return key
+
+
+def build_xdp(convert_key=None):
+    """make -C XDP_PROG_DIR, có cache theo hash cây mã nguồn + model đã chuyển."""
+    log('INFO', f"Building XDP program in {XDP_PROG_DIR}")
+    with timeline.phase("build"):
+        key_parts = {"tree": artifact_cache.tree_hash(), "convert": convert_key}
+        artifact_cache.cached_step("build", key_parts,
+                                   lambda: run_cmd([TOOLS["make"], "-C", XDP_PROG_DIR], "Build XDP program",
+                                                  timeout=TOOLS["cmd_timeout"]))
+
+
+def start_workload(pps, log_file_lanforge):
+    """
+    Dừng traffic cũ, bật replay ở mức pps rồi chờ PPS/latency ổn định
+    (thay cho sleep(5) + sleep(60) cố định trước đây).
+    """
+    with timeline.phase("stop_traffic"):
+        stop_remote_traffic(api_url)
+    with timeline.phase("idle_wait"):
+        wait_for_idle(ACCOUNTING_MAP, WARMUP)
+    # Replay phải kéo dài đủ cho cả warm-up (tối đa max_wait) lẫn cửa sổ đo
+    with timeline.phase("replay_api"):
+        call_tcpreplay_api(api_url, log_file_lanforge, pps, MAX_TIME + int(WARMUP["max_wait"]) + 5)
+    with timeline.phase("warmup"):
+        wait_for_steady_state(ACCOUNTING_MAP, WARMUP)
 
 # --- Initial Cleanup ---
 unload_xdp()
-run_cmd(["sudo", "rm", "-rf", f"/sys/fs/bpf/{iface}"], "Remove old BPF maps", check=False)
-run_cmd(["sudo", "pkill", "-9", "bpftool"], "Kill stray bpftool", check=False)
-run_cmd(["sudo", "pkill", "-9", "perf"], "Kill stray perf", check=False)
-run_cmd(
-    ["sudo", "pkill", "-9", "-f", "../../server.py"],
-    "Kill stray server.py",
-    check=False
-)
-
-# --- Main loop ---
-if branch == "randforest" :
-    #model_params = [10, 20]
-    # model_params = [20]
-    #model_sizes = [8, 16, 32, 64]
-    # model_sizes = [64]
-    MODEL_KEYS = [
-        (20, 64),
-    ]
-
-    
-elif branch == "quickscore":
-    # model_params = [70, 80, 90, 100]
-    # model_params = [10, 20, 30, 40, 50, 60]
-    # model_sizes = [8, 16, 32, 64]
-    # model_sizes = [8, 16, 32]
-    MODEL_KEYS = [
-        (20, 64),
-        (100, 32),
-    ]
-
+with timeline.phase("rm_pins"):
+    run_cmd(privileged(TOOLS, "rm", "-rf", BPF_PIN_DIR), "Remove old BPF maps", check=False)
+if TOOLS["kill_strays"]:
+    run_cmd(["sudo", "pkill", "-9", "bpftool"], "Kill stray bpftool", check=False)
+    run_cmd(["sudo", "pkill", "-9", "perf"], "Kill stray perf", check=False)
+    run_cmd(
+        ["sudo", "pkill", "-9", "-f", "../../server.py"],
+        "Kill stray server.py",
+        check=False
+    )
+
+# --- Sweep plan (khai báo trong mục `sweep:` của config) ---
+plan = load_sweep_plan(cfg, branch, NUM_RUNS)
+NUM_RUNS = plan["num_runs"]
+if branch == "quickscore":
     PYTHON_SCRIPS = cfg["xdp_program"]["python_quickXDP"]
+
+journal_path = os.path.join(RESULTS_DIR, f"sweep_journal_{branch}_{param}.jsonl")
+if plan["journal"] and not args.results_dir:
+    journal_path = plan["journal"]
+journal = SweepJournal(journal_path, fresh=args.fresh)
+if args.cells_file:
+    all_cells = read_cells(args.cells_file, branch, param)
 else:
-    MODEL_KEYS = [
-        (1, 1),
-    ]
-
-    
-for pps in range(10000, 200001, 10000):
-    for run_idx in range(1, NUM_RUNS + 1):
-        for m, sz in MODEL_KEYS:
-            # for sz in model_sizes:
-            model_file = os.path.join(os.path.expanduser(MODEL_RF), f"rf_{m}_{sz}_model.pkl")
-
-            power_cpu_csv = os.path.join(POWER_DIR, f"cpu_power_{branch}_{param}_{pps}_{run_idx}_{m}_{sz}.csv")
-            log_file_bpf = os.path.join(BPF_DIR, f"log_{branch}_{param}_{pps}_{run_idx}_{m}_{sz}.txt")
-            log_file_perf = os.path.join(PERF_DIR, f"log_{branch}_{param}_{pps}_{run_idx}_{m}_{sz}.txt")
-            log_file_lanforge = os.path.join(LANFORGE_DIR, f"log_{branch}_{param}_{pps}_{run_idx}_{m}_{sz}.txt")
-            log_file_power = os.path.join(POWER_DIR, f"log_{branch}_{param}_{pps}_{run_idx}_{m}_{sz}.txt")
-            power_csv = os.path.join(POWER_DIR, f"{branch}_{param}_{pps}_{run_idx}_{m}_{sz}.csv")
-            
-            # log_run_xdp_stats = os.path.join(STATS_DIR, f"log_{branch}_{param}_{pps}_{run_idx}_{m}_{sz}.txt")
-
-            g_log_file = open(log_file_bpf, "a")
-            log('HEADER', f"=== PPS={pps}, Run {run_idx}/{NUM_RUNS}, Model rf_{m}_{sz} ===")
-            g_log_file.write(f"=== PPS={pps}, RUN={run_idx}, BRANCH={branch}, PARAM={param}, MODEL=rf_{m}_{sz}, TIME={time.strftime('%Y-%m-%d %H:%M:%S')} ===\n")
-            if branch == "base":
-                log('INFO', f"Building XDP program in {XDP_PROG_DIR}")
-                run_cmd(["make", "-C", XDP_PROG_DIR], "Build XDP program")
-                os.chdir(XDP_PROG_DIR1)
-                
-                run_cmd([
-                    "sudo", XDP_LOADER, "--dev", iface,
-                    "-S",
-                    "--progname", "xdp_anomaly_detector"
-                ], "Load XDP program")
-
-                # --- Step 1: Gọi tcpreplay API ---
-                stop_remote_traffic(api_url)
-                time.sleep(5)
-                # call_tcpreplay_api(api_url, log_file_lanforge, pps, MAX_TIME + 5)
-                log('INFO', "Waiting 60 seconds before starting workload...")
-                time.sleep(60)
-                call_tcpreplay_api(api_url, log_file_lanforge, pps, MAX_TIME+5)
-                # --- Step 2: Chạy perf profiling ---
-                processes = []
-                p_power = Process(target=run_power_server, args=(power_csv, log_file_power, MAX_TIME))
-                p_cpu_power = Process(target=monitor_cpu_power, args=(power_cpu_csv, MAX_TIME))
-                p_through = Process(target=run_throughput_latency, args=(branch, param, pps, run_idx, m, sz, MAX_TIME))
-                processes.append(p_power)
-                processes.append(p_cpu_power)
-                processes.append(p_through)
-                for core_id in range(4):
-                    svg_file_cores = f"{branch}_{param}_{pps}_{run_idx}_{m}_{sz}_{core_id}"
-                    p_perf = Process(
-                        target=run_perf_profiling,
-                        args=(svg_file_cores, log_file_perf, MAX_TIME, core_id)
-                    )
-                    processes.append(p_perf)
-                for p in processes:
-                    p.start()
-                    
-                for p in processes:
-                    p.join()                   
-                # run_perf_profiling(svg_file, log_file_perf, MAX_TIME)
-                unload_xdp()
-                run_cmd(["sudo", "rm", "-rf", f"/sys/fs/bpf/{iface}"], "Remove old BPF maps", check=False)
-                log('INFO', f"[BASE] Completed PPS={pps}, Run={run_idx}")
-                g_log_file.write(f"=== DONE BASE PPS={pps}, RUN={run_idx}, MODEL=rf_{m}_{sz}, TIME={time.strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
-                time.sleep(3)
-                continue 
-
-            #--- Step 1: Run rf2qs.py ---
-            os.chdir(XDP_PROG_DIR1)
-            log('INFO', f"Đã cd vào {XDP_PROG_DIR1}")
-            log('INFO', f"Running python3 {PYTHON_SCRIPS} --model {model_file}")
-            if branch == "randforest":
-                run_cmd([
-                    "python3",
-                    PYTHON_SCRIPS,
-                    "--max_tree", str(m),
-                    "--max_leaves", str(sz),
-                    "--iface", iface,
-                    "--model_folder", "../../security_paper/rf",
-                    "--home_folder", "/home/gnb/"
-                ], "Run read_model_to_map.py", check=True)
-                run_cmd(["sudo", "xdp-loader", "unload", iface, "--all"], "Unload", check=True)
-            elif branch == "quickscore":
-                run_cmd(["python3", PYTHON_SCRIPS, "--model", model_file], "Run rf2qs.py", check=True)
-            else:
-                run_cmd(["python3", PYTHON_SCRIPS, "--svm_model", "../../security_paper/svm/models/SVM-Linear.pkl", \
-                            "--scaler", "../../security_paper/svm/scalers/scaler_SVM-Linear.pkl"], "Run read_model_to_map.py", check=True)
-            # --- Step 2: Build XDP program ---
-            log('INFO', f"Building XDP program in {XDP_PROG_DIR}")
-            run_cmd(["make", "-C", XDP_PROG_DIR], "Build XDP program")
-            os.chdir(XDP_PROG_DIR1)
-            
-            run_cmd([
-                "sudo", XDP_LOADER, "--dev", iface,
-                "-S",
-                "--progname", "xdp_anomaly_detector"
-            ], "Load XDP program")
-
-            # --- Step 4: Get prog ID ---
-            try:
-                prog_id = get_prog_id()
-            except RuntimeError:
-                unload_xdp()
-                g_log_file.close()
-                continue
+    all_cells = expand_cells(plan, branch, param)
+pending_cells = journal.pending(all_cells)
+if args.mode == "sweep":
+    log('INFO', f"Sweep plan: {len(all_cells)} cells, {len(all_cells) - len(pending_cells)} already done "
+                f"(journal {journal.path}), {len(pending_cells)} to run")
 
-            # --- Step 5: Trigger tcpreplay API ---
-            stop_remote_traffic(api_url)
-            time.sleep(5)
-            log('INFO', "Waiting 60 seconds before starting workload...")
-            time.sleep(60)
-            call_tcpreplay_api(api_url, log_file_lanforge, pps, MAX_TIME+5)
-            # --- Step 6: Run profiling in parallel ---
-            processes = []
-            p_power = Process(target=run_power_server, args=(power_csv, log_file_power, MAX_TIME))
-            p_cpu_power = Process(target=monitor_cpu_power, args=(power_cpu_csv, MAX_TIME))
-            p_through = Process(target=run_throughput_latency, args=(branch, param, pps, run_idx, m, sz, MAX_TIME))
-            processes.append(p_power)
-            processes.append(p_cpu_power)
-            processes.append(p_through)
-            for core_id in range(4):
-                svg_file_cores = f"{branch}_{param}_{pps}_{run_idx}_{m}_{sz}_{core_id}"
-                p_perf = Process(
-                target=run_perf_profiling,
-                args=(svg_file_cores, log_file_perf, MAX_TIME, core_id)
-            )
-            processes.append(p_perf)
-            for p in processes:
-                p.start()
-                
-            for p in processes:
-                p.join()      
+
+def prepare_model(m, sz):
+    """
+    Chuyển model + build + load XDP lên iface.
+    Trả về prog_id ("" với branch base), None nếu load thất bại.
+    """
+    model_file = os.path.join(os.path.expanduser(MODEL_RF), f"rf_{m}_{sz}_model.pkl")
+    if branch == "base":
+        build_xdp()
+        os.chdir(XDP_PROG_DIR1)
+    else:
+        #--- Step 1: Run rf2qs.py ---
+        os.chdir(XDP_PROG_DIR1)
+        log('INFO', f"Đã cd vào {XDP_PROG_DIR1}")
+        with timeline.phase("convert"):
+            convert_key = convert_model(m, sz, model_file)
+        # --- Step 2: Build XDP program ---
+        build_xdp(convert_key)
+        os.chdir(XDP_PROG_DIR1)
+
+    with timeline.phase("load"):
+        run_cmd(privileged(
+            TOOLS, XDP_LOADER, "--dev", iface,
+            "-S",
+            "--progname", "xdp_anomaly_detector"
+        ), "Load XDP program")
+        if branch == "base":
+            return ""
+
+        # --- Step 4: Get prog ID ---
+        try:
+            return get_prog_id()
+        except RuntimeError:
+            pass
+    unload_xdp()
+    return None
+
+
+def teardown_model():
+    """Gỡ XDP và xoá pinned map của iface."""
+    unload_xdp()
+    with timeline.phase("rm_pins"):
+        run_cmd(privileged(TOOLS, "rm", "-rf", BPF_PIN_DIR), "Remove old BPF maps", check=False)
+
+
+def cell_lanforge_log(cell):
+    return os.path.join(LANFORGE_DIR, f"log_{cell_tag(cell)}.txt")
+
+
+def cell_timing_json(cell):
+    return os.path.join(TIMING_DIR, f"timing_{cell_tag(cell)}.json")
+
+
+def measure_cell(cell, prog_id=None):
+    """Bật traffic, chờ ổn định rồi chạy các collector song song trong MAX_TIME giây."""
+    # --- Step 5: Trigger tcpreplay API + chờ ổn định ---
+    start_workload(cell["pps"], cell_lanforge_log(cell))
+    # --- Step 6: Run profiling in parallel (collector bật trong config `collectors:`) ---
+    collectors = build_collectors(COLLECTOR_CFG, collector_context(cell, prog_id))
+    with timeline.phase("measure"):
+        results = run_collectors(collectors, MAX_TIME, lead=COLLECTOR_CFG["start_lead"],
+                                 timing_path=cell_timing_json(cell))
+    with timeline.phase("stop_traffic"):
+        stop_remote_traffic(api_url)
+    return results
+
+
+# --- Load-once: model đang được giữ attach giữa các cell ---
+loaded_model = None
+loaded_prog_id = None
+
+
+def ensure_model_loaded(m, sz, log_file):
+    """--load-once: chỉ prepare khi đổi model, giữ nguyên program cho các mức PPS."""
+    global loaded_model, loaded_prog_id
+    if loaded_model == (m, sz):
+        return True
+    if loaded_model is not None:
+        teardown_model()
+        loaded_model = None
+    log('INFO', f"[LOAD-ONCE] Attaching rf_{m}_{sz} for all remaining PPS steps")
+    loaded_prog_id = prepare_model(m, sz)
+    if loaded_prog_id is None:
+        return False
+    loaded_model = (m, sz)
+    log_file.write(f"=== LOADED MODEL=rf_{m}_{sz}, TIME={time.strftime('%Y-%m-%d %H:%M:%S')} ===\n")
+    return True
+
+
+def reset_counters(log_file):
+    """Snapshot rồi zero accounting_map giữa hai mức PPS (thay cho unload/reload)."""
+    try:
+        from estimate_throughput_latency import reset_accounting  # cần numpy + bpf(2), import muộn
+        with timeline.phase("counter_reset"):
+            snap = reset_accounting(ACCOUNTING_MAP)
+        log_file.write(f"=== SNAPSHOT pkts={snap.total_pkts}, bytes={snap.total_bytes}, "
+                       f"proc_time={snap.proc_time} -> zeroed ===\n")
+    except (ImportError, OSError) as e:
+        # Collector tính theo delta nên vẫn đo đúng khi không zero được
+        log('WARN', f"[LOAD-ONCE] Cannot reset {ACCOUNTING_MAP}: {e}")
+
+
+def sweep_info():
+    """Tham số sweep ghi vào manifest của mỗi cell."""
+    return {
+        "mode": args.mode,
+        "max_time": MAX_TIME,
+        "num_runs": NUM_RUNS,
+        "load_once": args.load_once,
+        "ci_target": args.ci_target,
+        "cells_file": args.cells_file,
+        "collectors": COLLECTOR_CFG["enabled"],
+        "warmup": WARMUP,
+        "affinity": AFFINITY["enabled"],
+    }
+
+
+def run_cell(cell):
+    """Chạy một cell (pps, run_idx, model). Trả về True nếu cell hoàn thành."""
+    pps, run_idx, m, sz = cell["pps"], cell["run_idx"], cell["m"], cell["sz"]
+    log_file_bpf = os.path.join(BPF_DIR, f"log_{branch}_{param}_{pps}_{run_idx}_{m}_{sz}.txt")
+
+    timeline.begin_cell(cell_tag(cell), pps=pps, run_idx=run_idx, model=f"rf_{m}_{sz}")
+    manifest = CellManifest(MANIFEST_DIR, cell_tag(cell), cell, sweep_info(), PROVENANCE)
+    manifest.add_artifacts(bpf_log=log_file_bpf, lanforge_log=cell_lanforge_log(cell),
+                           timing=cell_timing_json(cell), phase_timeline=timeline.path)
+    status = "failed"
+    g_log_file = open(log_file_bpf, "a")
+    log('HEADER', f"=== PPS={pps}, Run {run_idx}/{NUM_RUNS}, Model rf_{m}_{sz} ===")
+    g_log_file.write(f"=== PPS={pps}, RUN={run_idx}, BRANCH={branch}, PARAM={param}, MODEL=rf_{m}_{sz}, TIME={time.strftime('%Y-%m-%d %H:%M:%S')} ===\n")
+    try:
+        if args.load_once:
+            if not ensure_model_loaded(m, sz, g_log_file):
+                return False
+            reset_counters(g_log_file)
+            prog_id = loaded_prog_id
+        else:
+            prog_id = prepare_model(m, sz)
+            if prog_id is None:
+                return False
+        manifest.update(prog_id=prog_id)
+        manifest.set_xdp_obj(XDP_KERN_OBJ_PATH)
+        manifest.add_collectors(measure_cell(cell, prog_id))
+        if not args.load_once:
             # --- Step 7: Cleanup ---
-            unload_xdp()
-            run_cmd(["sudo", "rm", "-rf", f"/sys/fs/bpf/{iface}"], "Remove old BPF maps", check=False)
-            log('INFO', f"Completed PPS={pps}, Run={run_idx}, Model rf_{m}_{sz}")
-            g_log_file.write(f"=== DONE PPS={pps}, RUN={run_idx}, MODEL=rf_{m}_{sz}, TIME={time.strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
-            # g_log_file.close()
-            time.sleep(3)
+            teardown_model()
+
+        done_tag = "DONE BASE" if branch == "base" else "DONE"
+        log('INFO', f"Completed PPS={pps}, Run={run_idx}, Model rf_{m}_{sz}")
+        g_log_file.write(f"=== {done_tag} PPS={pps}, RUN={run_idx}, MODEL=rf_{m}_{sz}, TIME={time.strftime('%Y-%m-%d %H:%M:%S')} ===\n\n")
+        status = "done"
+    finally:
+        g_log_file.close()
+        manifest.write(status)
+        if status != "done":
+            timeline.end_cell(status)
+    if not args.load_once:
+        with timeline.phase("cell_gap"):
+            time.sleep(TOOLS["cell_gap"])
+    timeline.end_cell(status)
+    return True
+
+
+def cell_throughput_csv(cell):
+    return os.path.join(THROUGHPUT_DIR, f"{cell_tag(cell)}.csv")
+
+
+def run_search():
+    """Tìm max sustainable PPS cho từng model thay vì quét toàn bộ dải PPS."""
+    scfg = load_search_config(cfg)
+    pps_min, pps_max = min(plan["pps"]), max(plan["pps"])
+    out_csv = os.path.join(RESULTS_DIR, f"saturation_{branch}_{param}.csv")
+    write_header = not os.path.exists(out_csv)
+
+    for m, sz in plan["models"]:
+        def measure(pps):
+            cell = {"branch": branch, "param": param, "pps": pps, "run_idx": 1, "m": m, "sz": sz}
+            if not journal.is_done(cell):
+                if not run_cell(cell):
+                    return None
+                journal.mark_done(cell, mode="search")
+            summary = summarize_throughput(cell_throughput_csv(cell), scfg["skip_rows"])
+            if summary is None:
+                log('WARN', f"[SEARCH] No throughput samples for {cell_tag(cell)}")
+                return None
+            ratio = summary["pps_avg"] / pps
+            log('INFO', f"[SEARCH] rf_{m}_{sz} TX={pps} RX={summary['pps_avg']:.0f} ratio={ratio:.3f}")
+            return ratio
+
+        log('HEADER', f"=== SEARCH rf_{m}_{sz}: {pps_min}..{pps_max} pps, threshold={scfg['threshold']} ===")
+        max_pps, probes = find_saturation(measure, pps_min, pps_max, scfg)
+        log('INFO', f"[SEARCH] rf_{m}_{sz}: max sustainable PPS = {max_pps} "
+                    f"({len(probes)} cells vs {len(plan['pps'])} in linear sweep)")
+
+        with open(out_csv, "a") as f:
+            if write_header:
+                f.write("branch,param,max_tree,max_leaves,max_pps,threshold,cells_used,probes\n")
+                write_header = False
+            probe_str = " ".join(f"{p}:{'NA' if r is None else f'{r:.3f}'}" for p, r in sorted(probes.items()))
+            f.write(f"{branch},{param},{m},{sz},{'' if max_pps is None else max_pps},"
+                    f"{scfg['threshold']},{len(probes)},{probe_str}\n")
+    log('INFO', f"[SEARCH] Results written to {out_csv}")
+
+
+def group_converged(cell, seq):
+    """
+    Sequential stopping: dùng các run trước (1..run_idx-1) của cùng (pps, model),
+    True nếu CI 95% của throughput và latency đều đã hẹp hơn ci_target.
+    """
+    if cell["run_idx"] <= seq["min_runs"]:
+        return False
+    thr_means, lat_means = [], []
+    for r in range(1, cell["run_idx"]):
+        summary = summarize_throughput(cell_throughput_csv({**cell, "run_idx": r}), seq["skip_rows"])
+        if summary is not None:
+            thr_means.append(summary["throughput_avg"])
+            lat_means.append(summary["latency_avg"])
+    if len(thr_means) < seq["min_runs"]:
+        return False
+    target = seq["ci_target"]
+    if ci_converged(thr_means, target) and ci_converged(lat_means, target):
+        log('INFO', f"[CI] PPS={cell['pps']} rf_{cell['m']}_{cell['sz']} converged after {len(thr_means)} runs "
+                    f"(thr ±{ci_half_width(thr_means):.1f} B/s, lat ±{ci_half_width(lat_means):.2f} ns)")
+        return True
+    return False
+
+
+def run_sweep():
+    seq = {**DEFAULT_SEQUENTIAL, **(cfg.get("sequential") or {})}
+    if args.ci_target is not None:
+        seq["ci_target"] = args.ci_target
+    if args.min_runs is not None:
+        seq["min_runs"] = args.min_runs
+    if seq["ci_target"]:
+        log('INFO', f"[CI] Sequential stopping: target half-width {seq['ci_target']:.1%} of mean, "
+                    f"min {seq['min_runs']} / max {NUM_RUNS} runs")
+
+    converged, skipped = set(), 0
+    for cell in pending_cells:
+        group = (cell["pps"], cell["m"], cell["sz"])
+        if seq["ci_target"]:
+            if group not in converged and group_converged(cell, seq):
+                converged.add(group)
+            if group in converged:
+                skipped += 1
+                continue
+        if run_cell(cell):
+            journal.mark_done(cell)
+    if seq["ci_target"]:
+        log('INFO', f"[CI] Skipped {skipped} cells thanks to CI convergence")
+
+
+# --- Main loop ---
+if args.mode == "search":
+    run_search()
+else:
+    if args.load_once:
+        # Gom cell theo model (giữ thứ tự trong mỗi nhóm) để mỗi model chỉ load một lần
+        model_order = {key: i for i, key in enumerate(plan["models"])}
+        pending_cells.sort(key=lambda c: model_order.get((c["m"], c["sz"]), len(model_order)))
+    run_sweep()
+if loaded_model is not None:
+    teardown_model()
 
 log('HEADER', "=== All tests completed ===")
 g_system_log.close()
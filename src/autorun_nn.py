@@ -7,9 +7,17 @@ import requests
 import os
 import time
 import signal
-from multiprocessing import Process
+from multiprocessing import Process, Event
 import argparse
 from logger import init_logger, log
+from cmd_runner import run_cmd
+from collector_runtime import run_collectors
+from collectors import load_collectors_config, build_collectors
+from warmup import load_warmup_config, wait_for_idle, wait_for_steady_state
+from phase_timer import PhaseTimeline
+from affinity import load_affinity_config, apply_orchestrator, pin_preexec
+from manifest import sweep_provenance, file_info, CellManifest
+from host_tools import load_tools_config, privileged
 import yaml
 
 # --- Parse CLI arguments ---
@@ -19,6 +27,8 @@ parser.add_argument("--param", required=True, help="Thông số thuật toán (v
 parser.add_argument("--config", default="../config_pc.yml", help="Đường dẫn file config YAML")
 parser.add_argument("--max-time", type=int, default=120, help="Thời gian chạy mỗi lần (mặc định: 120s)")
 parser.add_argument("--num-runs", type=int, default=5, help="Số lần lặp lại mỗi mức PPS (mặc định: 5)")
+parser.add_argument("--collectors", default=None,
+                    help="Danh sách collector, cách nhau bởi dấu phẩy (ghi đè collectors.enabled)")
 args = parser.parse_args()
 
 branch = args.branch
@@ -39,43 +49,48 @@ LOG_FILE = os.path.join(BASEDIR, cfg["logging"]["main_log"])
 BPF_DIR = os.path.join(RESULTS_DIR, cfg["results"]["bpf"])
 PERF_DIR = os.path.join(RESULTS_DIR, cfg["results"]["perf"])
 POWER_DIR = os.path.join(RESULTS_DIR, cfg["results"]["power"])
+TIMING_DIR = os.path.join(RESULTS_DIR, cfg["results"].get("timing", "timing"))
+MANIFEST_DIR = os.path.join(RESULTS_DIR, cfg["results"].get("manifest", "manifest"))
+# Timeline theo phase của từng cell (tóm tắt bằng phase_timer.py)
+timeline = PhaseTimeline(os.path.join(RESULTS_DIR, f"phase_timeline_{branch}_{param}.jsonl"))
 THROUGHPUT_DIR = os.path.join(RESULTS_DIR, cfg["results"]["throughput"])
 LANFORGE_DIR = cfg["results"]["lanforge"]
 NN_SCRIPTS = cfg["nn_scripts_path"]
 OUT_FOLDER_NN = cfg["folder_out_nn"]
 SERVER_SCRIPT = cfg["xdp_program"]["server_scripts"]
+WARMUP = load_warmup_config(cfg)
+TOOLS = load_tools_config(cfg)
+BPF_PIN_DIR = os.path.join(TOOLS["bpffs"], iface)
+# Script con (estimate_throughput_latency.py) đọc cùng backend qua biến môi trường
+os.environ["ACCOUNTING_BACKEND"] = TOOLS["accounting_backend"]
+ACCOUNTING_MAP = WARMUP.get("map_path", os.path.join(BPF_PIN_DIR, "accounting_map"))
+# XDP + replay phải sống đủ cho warm-up (tối đa max_wait) lẫn cửa sổ đo
+WARMUP_BUDGET = int(WARMUP["max_wait"]) + 5
+# nn_filter_xdp.py tự ghi throughput -> mặc định không bật collector throughput
+COLLECTOR_CFG = load_collectors_config(cfg, ["power_server", "cpu_power", "perf"], args.collectors)
+AFFINITY = load_affinity_config(cfg)
+# Không có XDP object riêng: nn_filter_xdp.py tự biên dịch + load, nên ghi hash script và commit cây của nó
+PROVENANCE = {**sweep_provenance(args.config, os.path.dirname(os.path.abspath(NN_SCRIPTS))),
+              "nn_script": file_info(NN_SCRIPTS)}
+SWEEP_INFO = {"max_time": MAX_TIME, "num_runs": NUM_RUNS, "collectors": COLLECTOR_CFG["enabled"],
+              "warmup": WARMUP, "affinity": AFFINITY["enabled"]}
 
 # --- Init logger ---
 init_logger(LOG_FILE)
+# Orchestrator + collector chạy trên core housekeeping
+apply_orchestrator(AFFINITY)
 
 # --- Prepare folders ---
 for d in [BPF_DIR, PERF_DIR, THROUGHPUT_DIR, OUT_FOLDER_NN, POWER_DIR]:
     os.makedirs(d, exist_ok=True)
 
-# --- Helper: run shell command ---
-def run_cmd(cmd, desc, check=True):
-    log('DEBUG', f"{desc}: {' '.join(cmd)}")
-    try:
-        result = subprocess.run(cmd, check=check, capture_output=True, text=True)
-        if result.stdout.strip():
-            for line in result.stdout.splitlines():
-                log('INFO', f"  {line}", to_file=False)
-        if result.stderr.strip():
-            for line in result.stderr.splitlines():
-                log('WARN', f"  {line}", to_file=False)
-        return result
-    except subprocess.CalledProcessError as e:
-        log('ERROR', f"Command failed ({desc}): {e}")
-        log('ERROR', f"STDOUT: {e.stdout.strip()}")
-        log('ERROR', f"STDERR: {e.stderr.strip()}")
-        if check:
-            raise
-        return None
-
 # --- Unload all XDP programs ---
 def unload_xdp():
-    run_cmd(["sudo", "xdp-loader", "unload", iface, "--all"], "Unload all XDP programs", check=False)
-    time.sleep(1)
+    with timeline.phase("unload"):
+        run_cmd(privileged(TOOLS, TOOLS["xdp_loader_cli"], "unload", iface, "--all"), "Unload all XDP programs",
+                check=False)
+    with timeline.phase("unload_settle"):
+        time.sleep(TOOLS["unload_settle"])
 
 # --- Call tcpreplay API ---
 def call_tcpreplay_api(api_url, log_file, speed, duration):
@@ -90,110 +105,6 @@ def call_tcpreplay_api(api_url, log_file, speed, duration):
     except Exception as e:
         log('ERROR', f"Failed to call API: {e}")
 
-def read_proc_stat():
-    stats = {}
-    
-    with open("/proc/stat") as f:
-        for line in f:
-            if line.startswith("cpu"):
-                parts = line.split()
-                cpu = parts[0]
-                values = list(map(int, parts[1:]))
-                total = sum(values)
-                idle = values[3] + values[4]
-                stats[cpu] = (total, idle)
-    return stats
-
-def read_energy_uj():
-    path = "/sys/class/powercap/intel-rapl:0/energy_uj"
-    try:
-        with open(path) as f:
-            return int(f.read().strip())
-    except:
-        return None
-    
-def monitor_cpu_power(csv_path, duration, interval=1.0):
-    with open(csv_path, "w", buffering=1) as f:
-        f.write("timestamp,cpu,cpu0,cpu1,cpu2,cpu3,power_w\n")
-        
-        t_start = time.time()
-        prev_stat = read_proc_stat()
-        prev_energy = read_energy_uj()
-        prev_time = time.time()
-        
-        while time.time() - t_start < duration:
-            time.sleep(interval)
-            
-            now_stat = read_proc_stat()
-            now_energy = read_energy_uj()
-            now_time = time.time()
-            
-            row = [f"{now_time:.3f}"]
-            
-            for cpu in ["cpu", "cpu0", "cpu1", "cpu2", "cpu3"]:
-                if cpu in prev_stat and cpu in now_stat:
-                    t1, i1 = prev_stat[cpu]
-                    t2, i2 = now_stat[cpu]
-                    dt = t2 - t1
-                    di = i2 - i1
-                    usage = 100 * (1 - di / dt) if dt > 0 else 0.0
-                    
-                else:
-                    usage = 0.0
-                    
-                row.append(f"{usage:.2f}")
-            
-            if prev_energy is not None and now_energy is not None:
-                power = (now_energy - prev_energy) / 1e6 / (now_time - prev_time)
-            else:
-                power = 0.0
-
-            row.append(f"{power:.3f}")
-            f.write(",".join(row) + "\n")
-
-            prev_stat = now_stat
-            prev_energy = now_energy
-            prev_time = now_time
-
-# --- Run PERF profiling ---
-def run_perf_profiling(svg_file, log_file_path, duration, core_id):
-    log('DEBUG', f"Starting perf ({duration}s)...", to_file=False)
-    with open(log_file_path, "a", buffering=1) as f:
-        proc = subprocess.Popen(
-            ["sudo", FLAMEGRAPH_SCRIPT, svg_file, str(duration), str(core_id)],
-            stdout=f, stderr=subprocess.STDOUT, preexec_fn=os.setsid
-        )
-        log('INFO', f"[PERF] Started (PID={proc.pid})", to_file=False)
-        proc.wait()
-        log('INFO', "[PERF] Completed.", to_file=False)
-
-# --- Run POWER server (FIXED: Added sudo and check return code) ---
-def run_power_server(csv_path, log_file_path, duration):
-    log('DEBUG', f"Starting server for {duration}s...", to_file=False)
-    with open(log_file_path, "a", buffering=1) as f:
-        proc = subprocess.Popen(
-            # FIX: Thêm "sudo" để đảm bảo quyền truy cập cảm biến
-            ["sudo", "python3", SERVER_SCRIPT, "--csv", csv_path],
-            stdout=f, stderr=subprocess.STDOUT, preexec_fn=os.setsid
-        )
-        log('INFO', f"[POWER] Started (PID={proc.pid})", to_file=False)
-        try:
-            proc.wait(timeout=duration)  # đợi đúng duration
-        except subprocess.TimeoutExpired:
-            log('DEBUG', "[POWER] Timeout reached, sending SIGINT...", to_file=False)
-            os.killpg(proc.pid, signal.SIGINT)  # gửi SIGINT cho process group
-            try:
-                proc.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                log('WARN', "[POWER] Forcing SIGKILL...", to_file=False)
-                os.killpg(proc.pid, signal.SIGKILL)
-        
-        # FIX: Kiểm tra mã thoát
-        if proc.returncode is not None and proc.returncode != 0:
-             log('ERROR', f"[POWER] Completed with non-zero exit code: {proc.returncode}. Check {log_file_path} for errors.", to_file=False)
-        else:
-            log('INFO', "[POWER] Completed.", to_file=False)
-            
 def stop_remote_traffic(api_url):
     stop_url = api_url.replace("/run", "/stop")
     log('DEBUG', f"Stopping remote traffic via {stop_url}")
@@ -216,8 +127,9 @@ def stop_remote_traffic(api_url):
         
         
 # --- Load XDP and keep running ---
-def load_xdp_program(iface, NN_SCRIPTS, OUT_FILE_NN, MAX_TIME):
-    cmd = ["sudo", "python3", NN_SCRIPTS, iface, OUT_FILE_NN, "-S"]
+def load_xdp_program(iface, NN_SCRIPTS, OUT_FILE_NN, MAX_TIME, stop=None):
+    # stop: Event do orchestrator set khi đo xong -> kill đúng session của nn_filter_xdp.py
+    cmd = privileged(TOOLS, "python3", NN_SCRIPTS, iface, OUT_FILE_NN, "-S")
     log('DEBUG', f"Start load_xdp_program: {' '.join(cmd)}")
 
     log_dir = os.path.dirname(OUT_FILE_NN)
@@ -229,7 +141,9 @@ def load_xdp_program(iface, NN_SCRIPTS, OUT_FILE_NN, MAX_TIME):
             stdout=f,
             stderr=subprocess.STDOUT,
             text=True,
-            preexec_fn=os.setsid
+            start_new_session=True,
+            # nn_filter_xdp.py thuộc workload -> trả lại core ban đầu thay vì kế thừa housekeeping
+            preexec_fn=pin_preexec(AFFINITY["workload"]) if AFFINITY["enabled"] else None
         )
 
         start_time = time.time()
@@ -237,89 +151,110 @@ def load_xdp_program(iface, NN_SCRIPTS, OUT_FILE_NN, MAX_TIME):
             if proc.poll() is not None:
                 log('INFO', f"XDP exited (code={proc.returncode})")
                 break
-            if time.time() - start_time > MAX_TIME:
-                log('ERROR', f"XDP load exceeded {MAX_TIME}s, killing...")
+            stopped = stop is not None and stop.is_set()
+            if stopped or time.time() - start_time > MAX_TIME:
+                if stopped:
+                    log('DEBUG', "Stop requested, killing XDP session...")
+                else:
+                    log('ERROR', f"XDP load exceeded {MAX_TIME}s, killing...")
                 try:
                     os.killpg(proc.pid, signal.SIGKILL)
                 except ProcessLookupError:
                     log('WARN', "XDP already exited before kill.")
                 break
-            time.sleep(1)
+            if stop is not None:
+                stop.wait(1)
+            else:
+                time.sleep(1)
 
 # --- Initial Cleanup ---
 unload_xdp()
-run_cmd(["sudo", "rm", "-rf", f"/sys/fs/bpf/{iface}"], "Remove old BPF maps", check=False)
-run_cmd(["sudo", "pkill", "-9", "bpftool"], "Kill stray bpftool", check=False)
-run_cmd(["sudo", "pkill", "-9", "perf"], "Kill stray perf", check=False)
-run_cmd(["sudo", "pkill", "-f", "../ebpf-classifier/nn-filter/nn_filter_xdp.py"], "Kill stray nn_filter_xdp", check=False)
-run_cmd(["sudo", "pkill", "-f", "../../server.py"], "Kill stray nn_filter_xdp", check=False)
+run_cmd(privileged(TOOLS, "rm", "-rf", BPF_PIN_DIR), "Remove old BPF maps", check=False)
+if TOOLS["kill_strays"]:
+    run_cmd(privileged(TOOLS, "pkill", "-9", "bpftool"), "Kill stray bpftool", check=False)
+    run_cmd(privileged(TOOLS, "pkill", "-9", "perf"), "Kill stray perf", check=False)
+    run_cmd(privileged(TOOLS, "pkill", "-f", "../ebpf-classifier/nn-filter/nn_filter_xdp.py"),
+            "Kill stray nn_filter_xdp", check=False)
+    run_cmd(privileged(TOOLS, "pkill", "-f", "../../server.py"), "Kill stray server.py", check=False)
 # --- Main loop ---
 for pps in range(10000, 200001, 10000):
     for run_idx in range(1, NUM_RUNS + 1):
         log_file_bpf = os.path.join(BPF_DIR, f"log_{branch}_{param}_{pps}_{run_idx}_1_1.txt")
-        log_file_perf = os.path.join(PERF_DIR, f"log_{branch}_{param}_{pps}_{run_idx}_1_1.txt")
         log_throughput = os.path.join(THROUGHPUT_DIR, f"{branch}_{param}_{pps}_{run_idx}_1_1.csv")
-        log_power = os.path.join(POWER_DIR, f"{branch}_{param}_{pps}_{run_idx}_1_1.txt")
-        csv_file_power = os.path.join(POWER_DIR, f"{branch}_{param}_{pps}_{run_idx}_1_1.csv")
-        power_cpu_csv = os.path.join(POWER_DIR, f"cpu_power_{branch}_{param}_{pps}_{run_idx}.csv")
         log_file_lanforge = os.path.join(LANFORGE_DIR, f"log_{branch}_{param}_{pps}_{run_idx}_1_1.txt")
 
+        tag = f"{branch}_{param}_{pps}_{run_idx}_1_1"
+        timeline.begin_cell(tag, pps=pps, run_idx=run_idx, model="nn")
+        manifest = CellManifest(MANIFEST_DIR, tag, {"branch": branch, "param": param, "pps": pps,
+                                                    "run_idx": run_idx, "m": 1, "sz": 1},
+                                SWEEP_INFO, PROVENANCE)
+        manifest.add_artifacts(bpf_log=log_file_bpf, throughput=log_throughput, lanforge_log=log_file_lanforge,
+                               timing=os.path.join(TIMING_DIR, f"timing_{tag}.json"), phase_timeline=timeline.path)
         log('HEADER', f"=== PPS={pps}, Run {run_idx}/{NUM_RUNS} ===")
 
         # --- Start processes ---
         log('DEBUG', "Starting all profiling processes...")
         log('INFO', "Load XDP program into interface")
-        p_xdp = Process(target=load_xdp_program, args=(iface, NN_SCRIPTS, log_throughput, MAX_TIME))
+        xdp_stop = Event()
+        p_xdp = Process(target=load_xdp_program,
+                        args=(iface, NN_SCRIPTS, log_throughput, MAX_TIME + WARMUP_BUDGET, xdp_stop))
         #p_xdp.start()
         log('INFO', "Call API to STOP all tcpreplay running in APP")
-        stop_remote_traffic(api_url)
-        log('INFO', "WAITING 30s......")
-        time.sleep(60)
-        processes = []
-        p_tcpreplay = Process(target=call_tcpreplay_api, args=(api_url, log_file_lanforge, pps, MAX_TIME))
-        p_power = Process(target=run_power_server, args=(csv_file_power, log_power, MAX_TIME))
-        p_cpu_power = Process(target=monitor_cpu_power, args=(power_cpu_csv, MAX_TIME))
-        # p_through = Process(target=run_throughput_latency, args=(branch, param, pps, run_idx, m, sz, MAX_TIME))
-        processes.append(p_power)
-        processes.append(p_cpu_power)
-        # processes.append(p_through)
-        for core_id in range(4):
-            svg_file_cores = f"{branch}_{param}_{pps}_{run_idx}_{core_id}"
-            p_perf = Process(
-                target=run_perf_profiling,
-                args=(svg_file_cores, log_file_perf, MAX_TIME, core_id)
-            )
-            processes.append(p_perf)
-        p_xdp.start()
-        time.sleep(5)
-        p_tcpreplay.start()
-        log('INFO', f"All profiling processes started, waiting {MAX_TIME}s...")          
-        for p in processes:
-            p.start()
-
-        time.sleep(MAX_TIME)
+        with timeline.phase("stop_traffic"):
+            stop_remote_traffic(api_url)
+        p_tcpreplay = Process(target=call_tcpreplay_api, args=(api_url, log_file_lanforge, pps, MAX_TIME + WARMUP_BUDGET))
+        collectors = build_collectors(COLLECTOR_CFG, {
+            "tag": tag,
+            "duration": MAX_TIME,
+            "iface": iface,
+            "accounting_map": ACCOUNTING_MAP,
+            "sudo": TOOLS["sudo"],
+            "bpftool": TOOLS["bpftool"],
+            "affinity": AFFINITY,
+            "dirs": {"bpf": BPF_DIR, "perf": PERF_DIR, "power": POWER_DIR, "throughput": THROUGHPUT_DIR},
+            "paths": {"server_script": SERVER_SCRIPT, "flamegraph_script": FLAMEGRAPH_SCRIPT},
+        })
+        # nn_filter_xdp.py tự load XDP -> chờ cố định 5s trước khi bật traffic
+        with timeline.phase("load"):
+            p_xdp.start()
+            time.sleep(5)
+        # accounting_map chỉ được pin sau khi nn_filter_xdp.py load xong
+        with timeline.phase("idle_wait"):
+            wait_for_idle(ACCOUNTING_MAP, WARMUP)
+        with timeline.phase("replay_api"):
+            p_tcpreplay.start()
+        with timeline.phase("warmup"):
+            wait_for_steady_state(ACCOUNTING_MAP, WARMUP)
+        log('INFO', f"Starting all profiling collectors for {MAX_TIME}s...")
+        with timeline.phase("measure"):
+            results = run_collectors(collectors, MAX_TIME, lead=COLLECTOR_CFG["start_lead"],
+                                     timing_path=os.path.join(TIMING_DIR, f"timing_{tag}.json"))
+        manifest.add_collectors(results)
 
         # --- Stop everything safely ---
         log('DEBUG', f"Stopping XDP + profiling after {MAX_TIME}s...")
-        try:
+        with timeline.phase("stop_xdp"):
+            # Process con chung process group với orchestrator -> không killpg nó,
+            # chỉ báo cho load_xdp_program kill session riêng của nn_filter_xdp.py
+            xdp_stop.set()
+            p_xdp.join(timeout=10)
             if p_xdp.is_alive():
-                os.killpg(os.getpgid(p_xdp.pid), signal.SIGKILL)
-                log('DEBUG', "Killed XDP process group.")
-        except ProcessLookupError:
-            log('WARN', "XDP process already gone before killpg().")
-        except Exception as e:
-            log('ERROR', f"Error stopping XDP: {e}")
+                log('WARN', "XDP loader did not exit after stop request, terminating it.")
+                p_xdp.terminate()
 
         unload_xdp()
 
-        # p_perf0.join(); p_perf1.join(); p_perf2.join(); p_perf3.join(); p_power.join()
-        for p in processes:
-            p.join()     
-        p_tcpreplay.join(timeout=5)
-        p_xdp.join(timeout=5)
+        with timeline.phase("stop_traffic"):
+            stop_remote_traffic(api_url)
+            p_tcpreplay.join(timeout=5)
+            p_xdp.join(timeout=5)
 
-        run_cmd(["sudo", "rm", "-rf", f"/sys/fs/bpf/{iface}"], "Remove old BPF maps", check=False)
+        with timeline.phase("rm_pins"):
+            run_cmd(privileged(TOOLS, "rm", "-rf", BPF_PIN_DIR), "Remove old BPF maps", check=False)
         log('INFO', f"Completed PPS={pps}, Run={run_idx}")
-        time.sleep(3)
+        with timeline.phase("cell_gap"):
+            time.sleep(TOOLS["cell_gap"])
+        manifest.write("done")
+        timeline.end_cell()
 
 log('HEADER', "=== All tests completed ===")
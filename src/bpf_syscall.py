@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Gọi thẳng syscall bpf(2) qua ctypes cho các reader pinned map, không cần bcc.
+
+Import bcc mất vài giây và Pi DUT không có toolchain BCC; reader chỉ cần vài lệnh:
+OBJ_GET, MAP_LOOKUP_ELEM, MAP_UPDATE_ELEM, MAP_GET_NEXT_KEY, MAP_LOOKUP_BATCH và
+OBJ_GET_INFO_BY_FD. Mỗi lệnh dùng struct con tương ứng trong union bpf_attr
+(include/uapi/linux/bpf.h); kernel chấp nhận attr ngắn hơn union đầy đủ.
+Lỗi trả về OSError(errno).
+
+So sánh thời gian khởi động (interpreter mới -> giá trị đầu tiên) với đường bcc:
+
+    sudo python3 bpf_syscall.py bench /sys/fs/bpf/<iface>/accounting_map --runs 5
+"""
+import argparse
+import ctypes
+import errno
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+# Số hiệu syscall bpf theo kiến trúc
+NR_BPF = {
+    "x86_64": 321,
+    "aarch64": 280,
+    "arm64": 280,
+    "armv7l": 386,
+    "armv6l": 386,
+    "i686": 357,
+    "i386": 357,
+    "riscv64": 280,
+    "ppc64le": 361,
+    "s390x": 351,
+}
+
+# enum bpf_cmd
+BPF_MAP_LOOKUP_ELEM = 1
+BPF_MAP_UPDATE_ELEM = 2
+BPF_MAP_GET_NEXT_KEY = 4
+BPF_OBJ_GET = 7
+BPF_OBJ_GET_INFO_BY_FD = 15
+BPF_MAP_LOOKUP_BATCH = 24
+
+# flags của MAP_UPDATE_ELEM
+BPF_ANY = 0
+
+_libc = ctypes.CDLL(None, use_errno=True)
+_libc.syscall.restype = ctypes.c_long
+_nr = NR_BPF.get(platform.machine())
+
+
+# --- Các struct con của union bpf_attr ---
+class ObjAttr(ctypes.Structure):
+    # BPF_OBJ_GET
+    _fields_ = [
+        ("pathname", ctypes.c_uint64),
+        ("bpf_fd", ctypes.c_uint32),
+        ("file_flags", ctypes.c_uint32),
+    ]
+
+
+class MapElemAttr(ctypes.Structure):
+    # BPF_MAP_LOOKUP_ELEM / UPDATE_ELEM / GET_NEXT_KEY (value và next_key cùng vị trí)
+    _fields_ = [
+        ("map_fd", ctypes.c_uint32),
+        ("_pad", ctypes.c_uint32),
+        ("key", ctypes.c_uint64),
+        ("value", ctypes.c_uint64),
+        ("flags", ctypes.c_uint64),
+    ]
+
+
+class BatchAttr(ctypes.Structure):
+    # BPF_MAP_LOOKUP_BATCH
+    _fields_ = [
+        ("in_batch", ctypes.c_uint64),
+        ("out_batch", ctypes.c_uint64),
+        ("keys", ctypes.c_uint64),
+        ("values", ctypes.c_uint64),
+        ("count", ctypes.c_uint32),
+        ("map_fd", ctypes.c_uint32),
+        ("elem_flags", ctypes.c_uint64),
+        ("flags", ctypes.c_uint64),
+    ]
+
+
+class InfoAttr(ctypes.Structure):
+    # BPF_OBJ_GET_INFO_BY_FD
+    _fields_ = [
+        ("bpf_fd", ctypes.c_uint32),
+        ("info_len", ctypes.c_uint32),
+        ("info", ctypes.c_uint64),
+    ]
+
+
+class BpfMapInfo(ctypes.Structure):
+    # Chỉ cần phần đầu struct bpf_map_info, kernel chấp nhận info_len nhỏ hơn
+    _fields_ = [
+        ("type", ctypes.c_uint32),
+        ("id", ctypes.c_uint32),
+        ("key_size", ctypes.c_uint32),
+        ("value_size", ctypes.c_uint32),
+        ("max_entries", ctypes.c_uint32),
+        ("map_flags", ctypes.c_uint32),
+        ("name", ctypes.c_char * 16),
+    ]
+
+
+def addr(obj):
+    """Địa chỉ của buffer ctypes (0 = NULL) để gán vào trường __aligned_u64 của attr."""
+    return 0 if obj is None else ctypes.addressof(obj)
+
+
+def sys_bpf(cmd, attr):
+    """bpf(cmd, &attr, sizeof(attr)); trả về giá trị >= 0, lỗi -> OSError."""
+    if _nr is None:
+        raise OSError(errno.ENOSYS, f"bpf(2) syscall number unknown for {platform.machine()}")
+    ret = _libc.syscall(_nr, cmd, ctypes.byref(attr), ctypes.sizeof(attr))
+    if ret < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return ret
+
+
+def obj_get(path):
+    """fd của object được pin tại path (bpffs)."""
+    name = ctypes.create_string_buffer(os.fsencode(path))
+    return sys_bpf(BPF_OBJ_GET, ObjAttr(pathname=addr(name)))
+
+
+def obj_get_info(fd, info=None):
+    """bpf_map_info (mặc định) của fd."""
+    info = info if info is not None else BpfMapInfo()
+    sys_bpf(BPF_OBJ_GET_INFO_BY_FD, InfoAttr(bpf_fd=fd, info_len=ctypes.sizeof(info), info=addr(info)))
+    return info
+
+
+def map_lookup_elem(fd, key, value):
+    """Đọc value của key vào buffer value (ctypes); ENOENT -> OSError."""
+    sys_bpf(BPF_MAP_LOOKUP_ELEM, MapElemAttr(map_fd=fd, key=addr(key), value=addr(value)))
+
+
+def map_update_elem(fd, key, value, flags=BPF_ANY):
+    sys_bpf(BPF_MAP_UPDATE_ELEM, MapElemAttr(map_fd=fd, key=addr(key), value=addr(value), flags=flags))
+
+
+def map_get_next_key(fd, key, next_key):
+    """Key kế tiếp sau key (None = key đầu) vào next_key; False khi đã hết map."""
+    try:
+        sys_bpf(BPF_MAP_GET_NEXT_KEY, MapElemAttr(map_fd=fd, key=addr(key), value=addr(next_key)))
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return False
+        raise
+    return True
+
+
+def map_lookup_batch(fd, keys, values, count, in_batch=None, out_batch=None, attr=None):
+    """
+    Đọc tối đa count entry vào keys/values trong một syscall (kernel >= 5.6).
+    Trả về (số entry đọc được, True nếu đã tới cuối map). attr: BatchAttr cấp sẵn để dùng lại.
+    """
+    attr = attr if attr is not None else BatchAttr()
+    attr.in_batch, attr.out_batch = addr(in_batch), addr(out_batch)
+    attr.keys, attr.values = addr(keys), addr(values)
+    attr.count, attr.map_fd = count, fd
+    try:
+        sys_bpf(BPF_MAP_LOOKUP_BATCH, attr)
+    except OSError as e:
+        # Hết map giữa chừng: kernel vẫn điền count entry rồi trả ENOENT
+        if e.errno == errno.ENOENT:
+            return attr.count, True
+        raise
+    return attr.count, False
+
+
+# --- Benchmark thời gian khởi động ---
+_STARTUP_SNIPPETS = {
+    "syscall": """
+import ctypes, bpf_syscall
+fd = bpf_syscall.obj_get(MAP)
+key, value = ctypes.c_uint32(0), (ctypes.c_uint8 * 4096)()
+bpf_syscall.map_lookup_elem(fd, key, value)
+""",
+    "bcc": """
+import ctypes
+from bcc import libbcc
+lib = libbcc.lib
+lib.bpf_obj_get.argtypes = [ctypes.c_char_p]
+fd = lib.bpf_obj_get(MAP.encode())
+key, value = ctypes.c_uint32(0), (ctypes.c_uint8 * 4096)()
+if fd < 0 or lib.bpf_map_lookup_elem(fd, ctypes.byref(key), ctypes.byref(value)) != 0:
+    raise SystemExit(1)
+""",
+}
+
+
+def bench_startup(map_path, runs=5):
+    """
+    Thời gian (ms) từ lúc spawn interpreter mới tới khi đọc xong giá trị đầu tiên của map,
+    cho từng đường truy cập; `baseline` = interpreter rỗng. None nếu đường đó không chạy được.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [here, os.environ.get("PYTHONPATH")]))}
+    snippets = {"baseline": "", **_STARTUP_SNIPPETS}
+    result = {}
+    for name, body in snippets.items():
+        times = []
+        for _ in range(runs):
+            t0 = time.perf_counter()
+            proc = subprocess.run([sys.executable, "-c", f"MAP = {map_path!r}\n{body}"], env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if proc.returncode != 0:
+                times = None
+                err = (proc.stderr.strip().splitlines() or ["?"])[-1]
+                print(f"  {name:<9} unavailable: {err}")
+                break
+            times.append((time.perf_counter() - t0) * 1000)
+        result[name] = statistics.median(times) if times else None
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="bpf(2) qua ctypes: đọc pinned map, so sánh khởi động với bcc")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_info = sub.add_parser("info", help="In bpf_map_info của map")
+    p_info.add_argument("map_path")
+    p_bench = sub.add_parser("bench", help="Thời gian khởi động syscall vs bcc (interpreter mới mỗi lần)")
+    p_bench.add_argument("map_path")
+    p_bench.add_argument("--runs", type=int, default=5)
+    p_bench.add_argument("--out", default=None, help="Ghi kết quả ra file JSON")
+    args = parser.parse_args()
+
+    if args.cmd == "info":
+        fd = obj_get(args.map_path)
+        try:
+            info = obj_get_info(fd)
+        finally:
+            os.close(fd)
+        print(json.dumps({name: getattr(info, name) for name, _ in BpfMapInfo._fields_ if name != "name"}
+                         | {"name": info.name.decode(errors="replace")}, indent=2))
+    else:
+        result = bench_startup(args.map_path, args.runs)
+        print(f"Startup to first map value ({args.runs} runs, median):")
+        for name, ms in result.items():
+            print(f"  {name:<9} {'n/a' if ms is None else f'{ms:8.1f} ms'}")
+        if args.out:
+            with open(args.out, "w") as f:
+                json.dump(result, f, indent=2)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Đọc nhanh kết quả của một cell ngay trong lúc sweep (không cần matplotlib/scipy như plot_all.py).
+"""
+import csv
+import os
+import statistics
+
+
+def safe_float(x):
+    try:
+        return float(x)
+    except Exception:
+        return None
+
+
+def read_throughput_csv(path, skip_rows=0):
+    """
+    Đọc CSV của estimate_throughput_latency.py -> (throughputs, pps_list, latencies).
+    Không có CSV mà có file .bin cùng tên (ts_binary.py) thì đọc file đó.
+    skip_rows: số dòng đầu (warm-up) bỏ qua, giống plot_all.py.
+    """
+    throughputs, pps_list, latencies = [], [], []
+    if not os.path.exists(path):
+        # Sampler chạy `--format bin` và không đổi sang CSV: đọc thẳng file .bin
+        bin_path = os.path.splitext(path)[0] + ".bin"
+        if os.path.exists(bin_path):
+            from ts_binary import metrics
+            thr, pps, lat = metrics(bin_path)
+            return thr[skip_rows:].tolist(), pps[skip_rows:].tolist(), lat[skip_rows:].tolist()
+        return throughputs, pps_list, latencies
+
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        for _ in range(skip_rows):
+            next(reader, None)
+        for row in reader:
+            thr = safe_float(row.get("throughput_Bps"))
+            pps = safe_float(row.get("pps"))
+            lat = safe_float(row.get("latency_ns"))
+            if thr is None or pps is None or lat is None:
+                continue
+            throughputs.append(thr)
+            pps_list.append(pps)
+            latencies.append(lat)
+    return throughputs, pps_list, latencies
+
+
+def summarize_throughput(path, skip_rows=0):
+    """Trung bình throughput/pps/latency của một file, None nếu không có dữ liệu."""
+    thr, pps, lat = read_throughput_csv(path, skip_rows)
+    if not pps:
+        return None
+    return {
+        "throughput_avg": statistics.mean(thr),
+        "pps_avg": statistics.mean(pps),
+        "latency_avg": statistics.mean(lat),
+        "n": len(pps),
+    }
+
+
+def ci_half_width(values, z=1.96):
+    """Nửa độ rộng khoảng tin cậy 95%: z·s/√n (cùng công thức với plot_all.py)."""
+    n = len(values)
+    if n < 2:
+        return float("inf")
+    return z * statistics.stdev(values) / n ** 0.5
+
+
+def ci_converged(values, target_rel):
+    """True nếu CI half-width <= target_rel × |mean|."""
+    if len(values) < 2:
+        return False
+    return ci_half_width(values) <= target_rel * abs(statistics.mean(values))
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Chạy lệnh shell cho các orchestrator, stream stdout/stderr vào logger theo từng dòng.
+
+Thay cho `subprocess.run(..., capture_output=True)`: build/convert dài vẫn có log ngay,
+chỉ giữ lại `tail_lines` dòng cuối để báo lỗi thay vì toàn bộ output trong RAM.
+Lệnh chạy trong process group riêng để khi quá `timeout` có thể kill cả cây con
+(make -> cc, sudo -> lệnh thật...).
+"""
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+
+from logger import log
+
+DEFAULT_TAIL_LINES = 200
+# Giây chờ sau SIGTERM trước khi SIGKILL process group
+KILL_GRACE = 5.0
+
+
+def _pump(pipe, level, tail):
+    """Đọc pipe tới EOF, log từng dòng và giữ tail."""
+    with pipe:
+        for line in pipe:
+            line = line.rstrip("\n")
+            tail.append(line)
+            log(level, f"  {line}", to_file=False)
+
+
+def _kill_group(proc):
+    """SIGTERM cả process group (sudo tự chuyển tiếp cho lệnh con), quá hạn thì SIGKILL."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            return
+        try:
+            proc.wait(timeout=KILL_GRACE)
+            return
+        except subprocess.TimeoutExpired:
+            continue
+
+
+def run_cmd(cmd, desc, check=True, timeout=None, tail_lines=DEFAULT_TAIL_LINES, cwd=None):
+    """
+    Chạy cmd, stdout được log mức INFO, stderr mức WARN ngay khi có dòng mới.
+    Trả về CompletedProcess với stdout/stderr là tail (kể cả khi exit code != 0 và check=False,
+    lúc đó stderr tail được log WARN); None chỉ khi quá timeout và check=False.
+    """
+    log('DEBUG', f"{desc}: {' '.join(cmd)}")
+    out_tail = deque(maxlen=tail_lines)
+    err_tail = deque(maxlen=tail_lines)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                            errors="replace", bufsize=1, cwd=cwd, start_new_session=True)
+    pumps = [threading.Thread(target=_pump, args=(proc.stdout, 'INFO', out_tail), daemon=True),
+             threading.Thread(target=_pump, args=(proc.stderr, 'WARN', err_tail), daemon=True)]
+    for t in pumps:
+        t.start()
+
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        _kill_group(proc)
+        for t in pumps:
+            t.join(timeout=KILL_GRACE)
+        log('ERROR', f"Command timed out after {timeout}s ({desc}), killed process group {proc.pid}")
+        log('ERROR', "STDERR (tail): " + "\n".join(err_tail))
+        if check:
+            raise subprocess.TimeoutExpired(cmd, timeout, "\n".join(out_tail), "\n".join(err_tail))
+        return None
+    except BaseException:
+        # Ctrl+C / lỗi khác giữa chừng: không để lại tiến trình con mồ côi
+        _kill_group(proc)
+        raise
+    # Process con của cmd (vd. daemon do sudo spawn) có thể giữ pipe mở -> không chờ vô hạn
+    deadline = time.monotonic() + KILL_GRACE
+    for t in pumps:
+        t.join(timeout=max(0.0, deadline - time.monotonic()))
+    if any(t.is_alive() for t in pumps):
+        log('WARN', f"Output of ({desc}) still open after exit, a child process keeps the pipe; not waiting")
+
+    stdout, stderr = "\n".join(out_tail), "\n".join(err_tail)
+    if proc.returncode != 0:
+        e = subprocess.CalledProcessError(proc.returncode, cmd, stdout, stderr)
+        if check:
+            log('ERROR', f"Command failed ({desc}): {e}")
+            log('ERROR', f"STDOUT (tail): {stdout.strip()}")
+            log('ERROR', f"STDERR (tail): {stderr.strip()}")
+            raise e
+        log('WARN', f"Command exited with code {proc.returncode} ({desc})")
+        if stderr.strip():
+            log('WARN', f"STDERR (tail): {stderr.strip()}")
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Runtime asyncio cho các collector của một cửa sổ đo.
+
+Thay vì fork một multiprocessing.Process cho mỗi collector (mỗi cái lại tự spawn sudo
+và block trên wait/sleep), mọi collector (plugin trong collectors.py) chạy như task
+trong một event loop:
+  - collector dạng lệnh: asyncio.create_subprocess_exec, process group riêng,
+  - collector viết bằng Python: coroutine chạy trực tiếp trong loop.
+Tất cả bắt đầu lấy mẫu tại cùng một barrier t0 (monotonic) và dùng chung một deadline;
+khi hết hạn hoặc bị huỷ (Ctrl-C) thì dừng theo thứ tự SIGINT -> chờ grace -> SIGKILL
+giống run_power_server trước đây.
+"""
+import asyncio
+import json
+import os
+import signal
+import time
+
+from affinity import placement
+from logger import log
+
+
+class Window:
+    """
+    Thông tin cửa sổ đo dùng chung cho mọi collector (thời gian theo loop.time(), tức monotonic).
+    t0 là barrier: thời điểm mọi collector cùng bắt đầu lấy mẫu, đặt trước `lead` giây
+    để kịp spawn sudo/interpreter.
+    """
+
+    def __init__(self, duration, hard_slack, lead=0.0):
+        # loop.time() của event loop mặc định chính là time.monotonic() -> dùng chung với process con
+        self.t0_ns = time.monotonic_ns() + int(lead * 1e9)
+        self.t0 = self.t0_ns / 1e9
+        self.t0_wall = time.time() + lead
+        self.duration = duration
+        self.lead = lead
+        self.t_start = self.t0
+        self.deadline = self.t0 + duration
+        # Cận cứng cho collector tự kết thúc (perf, throughput script) nhưng bị treo
+        self.hard_deadline = self.deadline + hard_slack
+
+    def remaining(self, until=None):
+        return max(0.0, (until or self.deadline) - asyncio.get_running_loop().time())
+
+    def offset(self, t=None):
+        """Độ lệch (giây) của t (mặc định: bây giờ) so với t0."""
+        return (t if t is not None else asyncio.get_running_loop().time()) - self.t0
+
+    async def barrier(self):
+        """Chờ tới t0."""
+        await asyncio.sleep(self.remaining(self.t0))
+
+
+async def terminate(proc, name, grace=5.0):
+    """SIGINT cả process group, chờ grace giây rồi mới SIGKILL."""
+    if proc.returncode is not None:
+        return
+    log('DEBUG', f"[{name}] Sending SIGINT...", to_file=False)
+    try:
+        os.killpg(proc.pid, signal.SIGINT)
+        await asyncio.wait_for(proc.wait(), timeout=grace)
+    except ProcessLookupError:
+        pass
+    except asyncio.TimeoutError:
+        log('WARN', f"[{name}] Forcing SIGKILL...", to_file=False)
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+
+
+async def _run_collectors(collectors, duration, hard_slack, lead):
+    window = Window(duration, hard_slack, lead)
+    loop = asyncio.get_running_loop()
+
+    async def lifecycle(c):
+        try:
+            await c.start(window)
+            # Collector tự ghi t_started nếu biết chính xác lúc bắt đầu lấy mẫu
+            if c.t_started is None:
+                c.t_started = loop.time()
+            await c.wait(window)
+        finally:
+            await c.stop()
+            c.t_stopped = loop.time()
+
+    tasks = [asyncio.create_task(lifecycle(c), name=c.name) for c in collectors]
+    try:
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+    except asyncio.CancelledError:
+        # Huỷ có cấu trúc: mỗi collector tự dừng process của nó trước khi thoát
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    for c, res in zip(collectors, results):
+        if isinstance(res, BaseException):
+            log('ERROR', f"[{c.name.upper()}] Collector failed: {res!r}", to_file=False)
+    return window
+
+
+def timing_record(window, collectors):
+    """Offset bắt đầu/dừng thực tế của từng collector so với barrier t0, kèm core đang chạy."""
+    orchestrator_cpus = placement()
+    collectors_timing = {}
+    for c in collectors:
+        collectors_timing[c.name] = {
+            "start_offset_s": None if c.t_started is None else round(window.offset(c.t_started), 6),
+            "stop_offset_s": None if c.t_stopped is None else round(window.offset(c.t_stopped), 6),
+            # Collector không spawn process chạy ngay trong orchestrator
+            "cpus": c.placement or {"in_process": orchestrator_cpus},
+        }
+    return {
+        "t0_monotonic_ns": window.t0_ns,
+        "t0_wall": round(window.t0_wall, 6),
+        "lead_s": window.lead,
+        "duration_s": window.duration,
+        "orchestrator_cpus": orchestrator_cpus,
+        "collectors": collectors_timing,
+    }
+
+
+def run_collectors(collectors, duration, hard_slack=30.0, lead=0.0, timing_path=None):
+    """
+    Chạy các collector (xem collectors.py) trong một cửa sổ đo dài duration giây,
+    bắt đầu cùng lúc tại barrier t0 = bây giờ + lead.
+    Trả về {tên: {"summary": collect(), "artifacts": artifacts(), "timing": {...}}};
+    timing_path: nếu có, ghi thêm bản ghi timing (JSON) của cửa sổ.
+    """
+    for c in collectors:
+        c.t_started = c.t_stopped = None
+        c.prepare()
+    window = asyncio.run(_run_collectors(collectors, duration, hard_slack, lead))
+    timing = timing_record(window, collectors)
+    for name, t in timing["collectors"].items():
+        log('DEBUG', f"[{name.upper()}] start {t['start_offset_s']}s, stop {t['stop_offset_s']}s from t0",
+            to_file=False)
+    if timing_path:
+        os.makedirs(os.path.dirname(timing_path) or ".", exist_ok=True)
+        with open(timing_path, "w") as f:
+            json.dump(timing, f, indent=2)
+    return {
+        c.name: {"summary": c.collect(), "artifacts": c.artifacts(), "timing": timing["collectors"][c.name]}
+        for c in collectors
+    }
@@ -0,0 +1,551 @@
+#!/usr/bin/env python3
+"""
+Framework collector dùng chung cho autorun_all.py và autorun_nn.py.
+
+Mỗi nguồn metric là một plugin kế thừa Collector và đăng ký bằng @register_collector.
+Vòng đời: prepare() -> start(window) -> wait(window) -> stop() -> collect() / artifacts().
+Collector nào chạy trong một cửa sổ đo được chọn qua mục `collectors:` trong config,
+ví dụ tắt 4× perf cho sweep chỉ đo throughput:
+
+    collectors:
+      enabled: ["throughput", "cpu_power"]
+"""
+import asyncio
+import os
+import subprocess
+import time
+
+from affinity import collector_cpus, pin_preexec, placement
+from collector_runtime import terminate
+from logger import log
+
+# --- Registry ---
+COLLECTORS = {}
+
+
+def register_collector(name):
+    """Decorator đăng ký một class collector dưới tên `name` (dùng trong config)."""
+    def deco(cls):
+        cls.name = name
+        COLLECTORS[name] = cls
+        return cls
+    return deco
+
+
+class Collector:
+    """Giao diện chung của mọi collector."""
+    name = None
+
+    def __init__(self, ctx, options):
+        # ctx: thông tin cell (tag, dirs, iface, duration...), options: mục config của collector
+        self.ctx = ctx
+        self.options = options
+        # loop.time() lúc thực sự bắt đầu/dừng lấy mẫu, runtime dùng để ghi timing
+        self.t_started = None
+        self.t_stopped = None
+        # Core được ghim theo mục `affinity:` (None = không ghim) và affinity hiệu lực đã ghi nhận
+        self.affinity = collector_cpus(ctx.get("affinity"), self.name)
+        self.placement = {}
+
+    def prepare(self):
+        """Chuẩn bị đường dẫn output, kiểm tra điều kiện chạy (trước cửa sổ đo)."""
+
+    async def start(self, window):
+        """Bắt đầu thu thập tại window.t0 (barrier), không được block sau đó."""
+
+    async def wait(self, window):
+        """Chờ tới khi collector nên dừng (mặc định: hết cửa sổ đo)."""
+        await asyncio.sleep(window.remaining())
+
+    async def stop(self):
+        """Dừng thu thập, dọn process/file."""
+
+    def collect(self):
+        """Tóm tắt kết quả (dict) sau khi dừng."""
+        return {}
+
+    def artifacts(self):
+        """Danh sách file output."""
+        return []
+
+
+class CommandCollector(Collector):
+    """
+    Collector chạy một hay nhiều lệnh ngoài (mỗi lệnh một process group),
+    stdout/stderr ghi vào log_path.
+    stop_after: số giây từ t0 thì SIGINT; None = chờ lệnh tự thoát (tới hard_deadline).
+    prespawn: True nếu lệnh tự chờ tới t0 (nhận window.t0_ns qua tham số) -> spawn ngay,
+              False -> chờ barrier rồi mới spawn.
+    """
+    stop_after = None
+    grace = 5.0
+    prespawn = False
+
+    def commands(self, window):
+        """List (label, cmd)."""
+        raise NotImplementedError
+
+    def prepare(self):
+        self.procs = []
+        self.returncodes = {}
+        self._log = None
+
+    async def start(self, window):
+        self._log = open(self.log_path, "a", buffering=1)
+        if not self.prespawn:
+            await window.barrier()
+        for label, cmd in self.commands(window):
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, stdout=self._log, stderr=subprocess.STDOUT, start_new_session=True,
+                preexec_fn=pin_preexec(self.affinity)
+            )
+            self.placement[label] = placement(proc.pid)
+            log('INFO', f"[{label}] Started (PID={proc.pid}, cpus={self.placement[label]})", to_file=False)
+            self.procs.append((label, proc))
+
+    async def wait(self, window):
+        until = window.t_start + self.stop_after if self.stop_after is not None else window.hard_deadline
+        waits = [p.wait() for _, p in self.procs]
+        try:
+            await asyncio.wait_for(asyncio.gather(*waits), timeout=window.remaining(until))
+        except asyncio.TimeoutError:
+            if self.stop_after is None:
+                log('WARN', f"[{self.name.upper()}] Still running past the window deadline", to_file=False)
+
+    async def stop(self):
+        for label, proc in self.procs:
+            await terminate(proc, label, self.grace)
+            self.returncodes[label] = proc.returncode
+            if proc.returncode not in (0, -2):
+                log('ERROR', f"[{label}] Completed with non-zero exit code: {proc.returncode}. "
+                             f"Check {self.log_path} for errors.", to_file=False)
+            else:
+                log('INFO', f"[{label}] Completed.", to_file=False)
+        if self._log:
+            self._log.close()
+
+    def collect(self):
+        return {"returncodes": self.returncodes}
+
+
+# --- Power server (cảm biến ngoài, SIGINT khi hết duration) ---
+@register_collector("power_server")
+class PowerServerCollector(CommandCollector):
+    def prepare(self):
+        super().prepare()
+        tag, power_dir = self.ctx["tag"], self.ctx["dirs"]["power"]
+        self.csv_path = os.path.join(power_dir, f"{tag}.csv")
+        self.log_path = os.path.join(power_dir, f"log_{tag}.txt")
+        self.stop_after = self.ctx["duration"]
+
+    def commands(self, window):
+        # sudo để đảm bảo quyền truy cập cảm biến
+        return [("POWER", [*self.ctx.get("sudo", ["sudo"]), "python3", self.ctx["paths"]["server_script"],
+                           "--csv", self.csv_path])]
+
+    def artifacts(self):
+        return [self.csv_path, self.log_path]
+
+
+# --- Throughput/latency từ accounting_map ---
+def hist_map_path(options, accounting_map):
+    """Đường dẫn map histogram latency (option `hist_map`, tên tương đối = cùng thư mục với accounting_map)."""
+    hist = options.get("hist_map")
+    if not hist:
+        return None
+    return hist if os.path.isabs(hist) else os.path.join(os.path.dirname(accounting_map), hist)
+
+
+@register_collector("throughput")
+class ThroughputCollector(CommandCollector):
+    def prepare(self):
+        super().prepare()
+        tag, thr_dir = self.ctx["tag"], self.ctx["dirs"]["throughput"]
+        self.csv_path = os.path.join(thr_dir, f"{tag}.csv")
+        self.log_path = os.path.join(thr_dir, f"log_{tag}.txt")
+        # format "bin": sampler chỉ ghi record thô (ts_binary.py), đổi sang CSV sau cửa sổ đo
+        self.fmt = self.options.get("format", "csv")
+        self.bin_path = os.path.join(thr_dir, f"{tag}.bin") if self.fmt == "bin" else None
+        # Script tự thoát sau duration, chỉ SIGINT nếu quá 10s
+        self.stop_after = self.ctx["duration"] + 10
+        # Script tự chờ tới --start-at nên spawn sớm, bù thời gian khởi động sudo + interpreter
+        self.prespawn = True
+        log('INFO', f"[THROUGHPUT] Output CSV: {self.csv_path}", to_file=False)
+
+    def commands(self, window):
+        return [("THROUGHPUT", [
+            *self.ctx.get("sudo", ["sudo"]), "python3", self.ctx["paths"]["throughput_script"],
+            self.ctx["accounting_map"], self.bin_path or self.csv_path, str(self.ctx["duration"]),
+            "--start-at", str(window.t0_ns),
+            "--format", self.fmt,
+            "--interval", str(self.options.get("interval", 1.0)),
+            "--spin-us", str(self.options.get("spin_us", 0)),
+            *self.hist_args(),
+        ])]
+
+    def hist_args(self):
+        hist = hist_map_path(self.options, self.ctx["accounting_map"])
+        if not hist:
+            return []
+        return ["--hist-map", hist, "--hist-kind", self.options.get("hist_kind", "log2"),
+                "--hist-bucket-ns", str(self.options.get("hist_bucket_ns", 1.0))]
+
+    async def stop(self):
+        await super().stop()
+        # Thời điểm đọc mẫu đầu tiên do chính script in ra (monotonic ns)
+        try:
+            with open(self.log_path) as f:
+                for line in f:
+                    if line.startswith("[SYNC] first_read_ns="):
+                        self.t_started = int(line.split("=", 1)[1]) / 1e9
+        except (OSError, ValueError):
+            pass
+        if self.bin_path and self.options.get("convert_csv", True):
+            from ts_binary import to_csv
+            try:
+                await asyncio.to_thread(to_csv, self.bin_path, self.csv_path)
+            except (OSError, ValueError) as e:
+                log('WARN', f"[THROUGHPUT] Cannot convert {self.bin_path} to CSV: {e}", to_file=False)
+
+    def artifacts(self):
+        return [p for p in (self.bin_path, self.csv_path) if p] + [self.log_path]
+
+
+# --- Throughput/latency lấy mẫu ngay trong orchestrator (không spawn sudo python3) ---
+@register_collector("sampler")
+class SamplerCollector(Collector):
+    """
+    Cùng output với "throughput" nhưng chạy estimate_throughput_latency.Sampler trong thread
+    của orchestrator: không tốn khởi động sudo + interpreter mỗi cửa sổ, và metric từng mẫu
+    đi thẳng tới các callback trong ctx["sample_subscribers"] (dashboard, abort sớm...).
+    Orchestrator cần quyền đọc pinned map (root/CAP_BPF, hoặc backend "file" của sim).
+    Option abort_below_pps + abort_after: dừng lấy mẫu sớm khi RX pps dưới ngưỡng
+    abort_after mẫu liên tiếp (traffic không tới), đánh dấu aborted trong summary.
+    Option layouts + maps: đọc thêm map khác / accounting_map của iface khác trong cùng tick,
+    chung timestamp, ghi counter thô ra <tag>_maps.csv (xem map_specs trong estimate_throughput_latency.py).
+    """
+
+    def prepare(self):
+        from estimate_throughput_latency import map_specs
+        tag, thr_dir = self.ctx["tag"], self.ctx["dirs"]["throughput"]
+        self.fmt = self.options.get("format", "csv")
+        self.csv_path = os.path.join(thr_dir, f"{tag}.csv")
+        self.bin_path = os.path.join(thr_dir, f"{tag}.bin") if self.fmt == "bin" else None
+        # Lỗi layout/spec trong config báo ngay, trước khi cửa sổ đo bắt đầu
+        self.maps = map_specs(self.options, self.ctx.get("iface"), os.path.dirname(self.ctx["accounting_map"]))
+        self.maps_path = os.path.join(thr_dir, f"{tag}_maps.csv") if self.maps else None
+        self.maps_sink = None
+        self.sampler = None
+        self.sink = None
+        self.aborted = False
+        self.low = 0
+        log('INFO', f"[SAMPLER] Output: {self.bin_path or self.csv_path}", to_file=False)
+
+    async def start(self, window):
+        from estimate_throughput_latency import Sampler, CsvSink, BinSink, MapsCsvSink
+        opts = self.options
+        self.sampler = Sampler(self.ctx["accounting_map"], interval=opts.get("interval", 1.0),
+                               duration=self.ctx["duration"], start_at=window.t0_ns,
+                               spin_us=opts.get("spin_us", 0),
+                               hist_map=hist_map_path(opts, self.ctx["accounting_map"]),
+                               hist_kind=opts.get("hist_kind", "log2"),
+                               hist_bucket_ns=opts.get("hist_bucket_ns", 1.0), maps=self.maps)
+        self.sink = BinSink(self.sampler, self.bin_path) if self.bin_path else CsvSink(self.sampler, self.csv_path)
+        sinks = [self.sink]
+        if self.sampler.map_readers:
+            self.maps_sink = MapsCsvSink(self.sampler, self.maps_path)
+            sinks.append(self.maps_sink)
+        for callback in (self._on_sample, *sinks, *self.ctx.get("sample_subscribers", [])):
+            self.sampler.subscribe(callback)
+        self.sampler.start()
+
+    def _on_sample(self, sample):
+        if sample.index == 0:
+            # t_ns là monotonic, cùng gốc với loop.time()
+            self.t_started = sample.t_ns / 1e9
+            return
+        threshold = self.options.get("abort_below_pps")
+        if threshold is None or self.aborted:
+            return
+        self.low = self.low + 1 if sample.pps < threshold else 0
+        if self.low >= self.options.get("abort_after", 5):
+            self.aborted = True
+            log('WARN', f"[SAMPLER] RX pps below {threshold} for {self.low} samples, stopping early",
+                to_file=False)
+            self.sampler.stop()
+
+    async def wait(self, window):
+        while not self.sampler.join(timeout=0) and window.remaining(window.hard_deadline) > 0:
+            await asyncio.sleep(min(0.1, window.remaining(window.hard_deadline)))
+
+    async def stop(self):
+        if self.sampler is None:
+            return
+        self.sampler.stop()
+        await asyncio.to_thread(self.sampler.join, 5)
+        self.sink.close()
+        if self.maps_sink is not None:
+            self.maps_sink.close()
+        if self.sampler.error is not None:
+            log('ERROR', f"[SAMPLER] Failed: {self.sampler.error!r}", to_file=False)
+        if self.bin_path and self.options.get("convert_csv", True) and os.path.exists(self.bin_path):
+            from ts_binary import to_csv
+            await asyncio.to_thread(to_csv, self.bin_path, self.csv_path)
+        log('INFO', f"[SAMPLER] Completed ({self.sampler.samples} samples).", to_file=False)
+
+    def collect(self):
+        if self.sampler is None:
+            return {}
+        return {"samples": self.sampler.samples, "missed": self.sampler.missed,
+                "read_errors": self.sampler.read_errors, "aborted": self.aborted,
+                "maps": list(self.sampler.map_readers),
+                "error": None if self.sampler.error is None else repr(self.sampler.error)}
+
+    def artifacts(self):
+        return [p for p in (self.bin_path, self.csv_path, self.maps_path) if p]
+
+
+# --- perf + FlameGraph, mỗi core một process ---
+@register_collector("perf")
+class PerfCollector(CommandCollector):
+    def prepare(self):
+        super().prepare()
+        self.cores = self.options.get("cores", [0, 1, 2, 3])
+        self.log_path = os.path.join(self.ctx["dirs"]["perf"], f"log_{self.ctx['tag']}.txt")
+
+    def commands(self, window):
+        # FLAMEGRAPH_SCRIPT tự dừng sau duration -> không đặt stop_after
+        return [
+            (f"PERF{core}", [*self.ctx.get("sudo", ["sudo"]), self.ctx["paths"]["flamegraph_script"],
+                             f"{self.ctx['tag']}_{core}", str(self.ctx["duration"]), str(core)])
+            for core in self.cores
+        ]
+
+    def artifacts(self):
+        return [self.log_path] + [f"{self.ctx['tag']}_{core}.svg" for core in self.cores]
+
+
+# --- bpftool prog profile (cần prog_id) ---
+@register_collector("bpftool")
+class BpftoolCollector(CommandCollector):
+    def prepare(self):
+        super().prepare()
+        self.log_path = os.path.join(self.ctx["dirs"]["bpf"], f"log_{self.ctx['tag']}.txt")
+        self.stop_after = self.ctx["duration"]
+        self.events = self.options.get("events", ["l1d_loads", "llc_misses", "itlb_misses", "dtlb_misses"])
+
+    def commands(self, window):
+        if not self.ctx.get("prog_id"):
+            log('WARN', "[BPF] No prog_id for this cell, skipping bpftool profiling", to_file=False)
+            return []
+        return [("BPF", [*self.ctx.get("sudo", ["sudo"]), self.ctx.get("bpftool", "bpftool"),
+                         "prog", "profile", "id", self.ctx["prog_id"], *self.events])]
+
+    def artifacts(self):
+        return [self.log_path]
+
+
+# --- CPU usage (/proc/stat) + công suất RAPL, chạy ngay trong event loop ---
+def parse_proc_stat(lines):
+    """{cpu: (total, idle)} từ các dòng của /proc/stat."""
+    stats = {}
+    for line in lines:
+        if line.startswith("cpu"):
+            parts = line.split()
+            cpu = parts[0]
+            values = list(map(int, parts[1:]))
+            total = sum(values)
+            idle = values[3] + values[4]
+            stats[cpu] = (total, idle)
+    return stats
+
+
+def read_proc_stat(path="/proc/stat"):
+    with open(path) as f:
+        return parse_proc_stat(f)
+
+
+def read_energy_uj(path="/sys/class/powercap/intel-rapl:0/energy_uj"):
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def cpu_power_row(cpus, prev_stat, now_stat, prev_energy, now_energy, dt):
+    """Các cột CSV giữa hai mẫu: usage (%) của từng cpu rồi công suất RAPL (W)."""
+    row = []
+    for cpu in cpus:
+        if cpu in prev_stat and cpu in now_stat:
+            t1, i1 = prev_stat[cpu]
+            t2, i2 = now_stat[cpu]
+            dt_cpu = t2 - t1
+            di = i2 - i1
+            usage = 100 * (1 - di / dt_cpu) if dt_cpu > 0 else 0.0
+        else:
+            usage = 0.0
+
+        row.append(f"{usage:.2f}")
+
+    if prev_energy is not None and now_energy is not None and dt > 0:
+        power = (now_energy - prev_energy) / 1e6 / dt
+    else:
+        power = 0.0
+
+    row.append(f"{power:.3f}")
+    return row
+
+
+@register_collector("cpu_power")
+class CpuPowerCollector(Collector):
+    def prepare(self):
+        self.csv_path = os.path.join(self.ctx["dirs"]["power"], f"cpu_power_{self.ctx['tag']}.csv")
+        self.interval = self.options.get("interval", 1.0)
+        self.cpus = self.options.get("cpus", ["cpu", "cpu0", "cpu1", "cpu2", "cpu3"])
+        self.proc_stat = self.options.get("proc_stat", "/proc/stat")
+        self.rapl = self.options.get("rapl_energy", "/sys/class/powercap/intel-rapl:0/energy_uj")
+        self.samples = 0
+        self.task = None
+
+    async def start(self, window):
+        self.task = asyncio.create_task(self._monitor(window))
+
+    async def wait(self, window):
+        await asyncio.wait({self.task})
+
+    async def stop(self):
+        if self.task is None:
+            return
+        if not self.task.done():
+            self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        log('INFO', "[CPU_POWER] Completed.", to_file=False)
+
+    async def _monitor(self, window):
+        loop = asyncio.get_running_loop()
+        with open(self.csv_path, "w", buffering=1) as f:
+            f.write("timestamp," + ",".join(self.cpus) + ",power_w\n")
+
+            await window.barrier()
+            self.t_started = loop.time()
+            prev_stat = read_proc_stat(self.proc_stat)
+            prev_energy = read_energy_uj(self.rapl)
+            prev_time = time.time()
+
+            # Mẫu thứ k lấy tại t0 + k·interval để thẳng hàng với các collector khác
+            k = 0
+            while window.remaining() > 0:
+                k += 1
+                await asyncio.sleep(window.remaining(window.t0 + k * self.interval))
+
+                now_stat = read_proc_stat(self.proc_stat)
+                now_energy = read_energy_uj(self.rapl)
+                now_time = time.time()
+
+                row = [f"{now_time:.3f}"] + cpu_power_row(
+                    self.cpus, prev_stat, now_stat, prev_energy, now_energy, now_time - prev_time)
+                f.write(",".join(row) + "\n")
+                self.samples += 1
+
+                prev_stat = now_stat
+                prev_energy = now_energy
+                prev_time = now_time
+
+    def collect(self):
+        return {"samples": self.samples}
+
+    def artifacts(self):
+        return [self.csv_path]
+
+
+# --- dut_agent.py: throughput + CPU/RAPL do agent thường trú lấy mẫu, không spawn process ---
+@register_collector("agent")
+class AgentCollector(Collector):
+    def prepare(self):
+        tag = self.ctx["tag"]
+        self.url = self.options.get("url", "http://127.0.0.1:16200").rstrip("/")
+        self.metrics = self.options.get("metrics", ["throughput", "cpu_power"])
+        self.request = {
+            "tag": tag,
+            "duration": self.ctx["duration"],
+            "interval": self.options.get("interval", 1.0),
+            "metrics": self.metrics,
+            "map_path": self.ctx["accounting_map"],
+            "throughput_csv": os.path.abspath(os.path.join(self.ctx["dirs"]["throughput"], f"{tag}.csv")),
+            "cpu_power_csv": os.path.abspath(os.path.join(self.ctx["dirs"]["power"], f"cpu_power_{tag}.csv")),
+        }
+        for key in ("cpus", "proc_stat", "rapl_energy", "hist_kind", "hist_bucket_ns"):
+            if key in self.options:
+                self.request[key] = self.options[key]
+        hist = hist_map_path(self.options, self.ctx["accounting_map"])
+        if hist:
+            self.request["hist_map"] = hist
+        self.session = None
+        self.summary = {}
+
+    def _post(self, path, payload):
+        import requests
+        resp = requests.post(self.url + path, json=payload, timeout=10)
+        data = resp.json()
+        if resp.status_code != 200:
+            raise RuntimeError(f"agent {path}: HTTP {resp.status_code} {data.get('message')}")
+        return data
+
+    async def start(self, window):
+        resp = await asyncio.to_thread(self._post, "/start", {**self.request, "start_at_ns": window.t0_ns})
+        self.session = resp["session"]
+        log('INFO', f"[AGENT] Session {self.session} started", to_file=False)
+
+    async def stop(self):
+        if self.session is None:
+            return
+        try:
+            self.summary = await asyncio.to_thread(self._post, "/stop", {"session": self.session})
+        except Exception as e:
+            log('ERROR', f"[AGENT] Cannot stop session {self.session}: {e}", to_file=False)
+            return
+        # /collect xoá session đã xong khỏi agent, không thì agent giữ mọi session cũ
+        try:
+            self.summary = await asyncio.to_thread(self._post, "/collect", {"session": self.session})
+        except Exception as e:
+            log('WARN', f"[AGENT] Cannot collect session {self.session}: {e}", to_file=False)
+        if self.summary.get("running"):
+            log('WARN', f"[AGENT] Session {self.session} still running after stop, left on the agent",
+                to_file=False)
+        if self.summary.get("affinity"):
+            self.placement["agent"] = self.summary["affinity"]
+        first = self.summary.get("first_read_ns") or {}
+        if first:
+            self.t_started = min(first.values()) / 1e9
+        for metric, err in (self.summary.get("errors") or {}).items():
+            log('ERROR', f"[AGENT] {metric}: {err}", to_file=False)
+        log('INFO', f"[AGENT] Completed: samples {self.summary.get('samples')}", to_file=False)
+
+    def collect(self):
+        return {k: self.summary.get(k) for k in ("session", "samples", "errors")}
+
+    def artifacts(self):
+        return [self.request[f"{m}_csv"] for m in self.metrics]
+
+
+# --- Cấu hình + chạy ---
+def load_collectors_config(cfg, default_enabled, cli_enabled=None):
+    """
+    Mục `collectors:` của config: `enabled` là list tên plugin, `start_lead` là thời gian
+    chờ trước barrier, các key khác là option theo từng plugin. cli_enabled (chuỗi "a,b,c") ghi đè `enabled`.
+    """
+    ccfg = dict(cfg.get("collectors") or {})
+    ccfg.setdefault("enabled", list(default_enabled))
+    # Giây dành cho việc spawn sudo/interpreter trước barrier t0
+    ccfg.setdefault("start_lead", 2.0)
+    if cli_enabled:
+        ccfg["enabled"] = [n.strip() for n in cli_enabled.split(",") if n.strip()]
+    unknown = [n for n in ccfg["enabled"] if n not in COLLECTORS]
+    if unknown:
+        raise ValueError(f"Unknown collectors {unknown}, available: {sorted(COLLECTORS)}")
+    return ccfg
+
+
+def build_collectors(ccfg, ctx):
+    return [COLLECTORS[name](ctx, ccfg.get(name) or {}) for name in ccfg["enabled"]]
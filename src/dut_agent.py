@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Agent chạy thường trú trên DUT, thay cho việc spawn `sudo python3 ...` ở mỗi cửa sổ đo.
+
+Agent chạy với root đúng một lần và giữ sẵn handle của pinned accounting_map (mở lại khi
+map được pin lại), /proc/stat và RAPL energy_uj. Orchestrator (collector "agent" trong
+collectors.py) gọi RPC qua HTTP:
+  POST /start   {tag, duration, start_at_ns, interval, metrics, map_path, hist_map, throughput_csv, ...}
+  POST /stop    {session}   -> chờ sampler chạy hết cửa sổ (hoặc dừng ngay nếu now=true)
+  POST /collect {session}   -> tóm tắt (số mẫu, first_read_ns, lỗi, file output), xoá session đã xong
+  GET  /health
+
+    sudo python3 dut_agent.py --port 16200
+"""
+import argparse
+import itertools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from affinity import parse_cpus
+from collectors import parse_proc_stat, cpu_power_row
+from logger import log
+
+DEFAULT_PORT = 16200
+METRICS = ("throughput", "cpu_power")
+
+
+class FileReader:
+    """
+    File sysfs/procfs mở một lần, mỗi lần đọc chỉ seek(0).
+    Mở lại nếu file bị thay (inode đổi), vd. file giả của sim_backend.py.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.f = None
+        self.inode = None
+
+    def read(self):
+        inode = os.stat(self.path).st_ino
+        if self.f is None or inode != self.inode:
+            self.close()
+            self.f = open(self.path)
+            self.inode = inode
+        self.f.seek(0)
+        return self.f.read()
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+class SharedReader:
+    """
+    MapReader dùng chung giữa các session chạy song song: fd và buffer ctypes của reader
+    không thread-safe nên mọi lần đọc đi qua một lock; thuộc tính khác (ncpu, percpu,
+    edges...) đọc thẳng từ reader.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.lock = threading.Lock()
+
+    def read(self):
+        with self.lock:
+            return self.reader.read()
+
+    def read_percpu(self, out=None):
+        with self.lock:
+            return self.reader.read_percpu(out)
+
+    def __getattr__(self, name):
+        return getattr(self.reader, name)
+
+
+class Handles:
+    """Handle dùng chung giữa các session, giữ mở suốt vòng đời agent."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.maps = {}
+        self.files = {}
+
+    def accounting(self, map_path):
+        with self.lock:
+            if map_path not in self.maps:
+                # Import muộn: chỉ cần numpy + bpf(2) khi có session đo throughput
+                from estimate_throughput_latency import AccountingReader
+                self.maps[map_path] = SharedReader(AccountingReader(map_path))
+            return self.maps[map_path]
+
+    def histogram(self, map_path, kind, bucket_ns):
+        key = (map_path, kind, bucket_ns)
+        with self.lock:
+            if key not in self.maps:
+                from estimate_throughput_latency import HistogramReader
+                self.maps[key] = SharedReader(HistogramReader(map_path, kind, bucket_ns))
+            return self.maps[key]
+
+    def file(self, path):
+        with self.lock:
+            if path not in self.files:
+                self.files[path] = FileReader(path)
+            return self.files[path]
+
+    def proc_stat(self, path):
+        reader = self.file(path)
+        return parse_proc_stat(reader.read().splitlines())
+
+    def energy_uj(self, path):
+        try:
+            return int(self.file(path).read().strip())
+        except (OSError, ValueError):
+            return None
+
+
+class Session:
+    """Một cửa sổ đo: mỗi metric một thread lấy mẫu tại start_at + k·interval."""
+
+    def __init__(self, sid, req, handles):
+        self.sid = sid
+        self.req = req
+        self.handles = handles
+        self.tag = req["tag"]
+        self.duration = float(req["duration"])
+        self.interval = float(req.get("interval", 1.0))
+        self.start_at_ns = int(req.get("start_at_ns") or time.monotonic_ns())
+        self.end_ns = self.start_at_ns + int(self.duration * 1e9)
+        self.metrics = req.get("metrics", list(METRICS))
+        self.stop_event = threading.Event()
+        self.samples = {m: 0 for m in self.metrics}
+        self.first_read_ns = {}
+        self.errors = {}
+        self.threads = []
+        self.sampler = None
+
+    def start(self):
+        for metric in self.metrics:
+            target = getattr(self, f"_run_{metric}")
+            t = threading.Thread(target=self._guard, args=(metric, target), name=f"{self.tag}-{metric}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def _guard(self, metric, target):
+        try:
+            target()
+        except Exception as e:
+            self.errors[metric] = repr(e)
+            log('ERROR', f"[AGENT] {self.tag} {metric} failed: {e!r}", to_file=False)
+
+    def _sleep_until(self, t_ns):
+        """Chờ tới t_ns (monotonic); False nếu bị stop trước đó."""
+        wait = (t_ns - time.monotonic_ns()) / 1e9
+        return not self.stop_event.wait(wait) if wait > 0 else not self.stop_event.is_set()
+
+    def _ticks(self):
+        for k in itertools.count(1):
+            t_ns = self.start_at_ns + int(k * self.interval * 1e9)
+            if t_ns > self.end_ns or not self._sleep_until(t_ns):
+                return
+            yield
+
+    def _run_throughput(self):
+        from estimate_throughput_latency import Sampler, CsvSink
+        hist = None
+        if self.req.get("hist_map") and os.path.exists(self.req["hist_map"]):
+            hist = self.handles.histogram(self.req["hist_map"], self.req.get("hist_kind", "log2"),
+                                          float(self.req.get("hist_bucket_ns", 1.0)))
+        # Sampler dùng lại handle của agent, lưới deadline trùng với start_at + k·interval
+        self.sampler = Sampler(interval=self.interval, duration=self.duration, start_at=self.start_at_ns,
+                               metrics=False, reader=self.handles.accounting(self.req["map_path"]),
+                               hist_reader=hist)
+        sink = CsvSink(self.sampler, self.req["throughput_csv"], flush_every=0)
+
+        def count(sample):
+            if sample.index == 0:
+                self.first_read_ns["throughput"] = sample.t_ns
+            else:
+                self.samples["throughput"] += 1
+
+        self.sampler.subscribe(sink)
+        self.sampler.subscribe(count)
+        if self.stop_event.is_set():
+            return
+        try:
+            self.sampler.run()
+        finally:
+            sink.close()
+
+    def _run_cpu_power(self):
+        cpus = self.req.get("cpus", ["cpu", "cpu0", "cpu1", "cpu2", "cpu3"])
+        proc_stat = self.req.get("proc_stat", "/proc/stat")
+        rapl = self.req.get("rapl_energy", "/sys/class/powercap/intel-rapl:0/energy_uj")
+        with open(self.req["cpu_power_csv"], "w", buffering=1) as f:
+            f.write("timestamp," + ",".join(cpus) + ",power_w\n")
+            if not self._sleep_until(self.start_at_ns):
+                return
+            prev_stat = self.handles.proc_stat(proc_stat)
+            prev_energy = self.handles.energy_uj(rapl)
+            self.first_read_ns["cpu_power"] = time.monotonic_ns()
+            prev_time = time.time()
+            for _ in self._ticks():
+                now_stat = self.handles.proc_stat(proc_stat)
+                now_energy = self.handles.energy_uj(rapl)
+                now_time = time.time()
+                row = [f"{now_time:.3f}"] + cpu_power_row(
+                    cpus, prev_stat, now_stat, prev_energy, now_energy, now_time - prev_time)
+                f.write(",".join(row) + "\n")
+                self.samples["cpu_power"] += 1
+                prev_stat, prev_energy, prev_time = now_stat, now_energy, now_time
+
+    def stop(self, now=False):
+        if not now:
+            # Để sampler lấy nốt mẫu cuối ở start_at + duration
+            grace = max(0.0, (self.end_ns - time.monotonic_ns()) / 1e9) + self.interval
+            for t in self.threads:
+                t.join(timeout=grace)
+        self.stop_event.set()
+        if self.sampler is not None:
+            self.sampler.stop()
+        for t in self.threads:
+            t.join(timeout=5)
+
+    def summary(self):
+        return {
+            "session": self.sid,
+            "tag": self.tag,
+            "samples": self.samples,
+            "first_read_ns": self.first_read_ns,
+            "errors": self.errors,
+            "running": any(t.is_alive() for t in self.threads),
+            "affinity": sorted(os.sched_getaffinity(0)),
+            "artifacts": [self.req[k] for k in ("throughput_csv", "cpu_power_csv") if k in self.req],
+        }
+
+
+class Agent:
+    def __init__(self):
+        self.handles = Handles()
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+
+    def start(self, req):
+        metrics = req.get("metrics", METRICS)
+        unknown = [m for m in metrics if m not in METRICS]
+        if unknown:
+            raise ValueError(f"Unknown metrics {unknown}, available: {list(METRICS)}")
+        required = ["tag", "duration"] + [f"{m}_csv" for m in metrics]
+        if "throughput" in metrics:
+            required.append("map_path")
+        missing = [k for k in required if k not in req]
+        if missing:
+            # KeyError sẽ thành 404 (session không tồn tại) -> báo lỗi request
+            raise ValueError(f"Missing keys {missing} in /start request")
+        for key in ("throughput_csv", "cpu_power_csv"):
+            if key in req:
+                os.makedirs(os.path.dirname(req[key]) or ".", exist_ok=True)
+        with self.lock:
+            sid = f"{req['tag']}-{next(self.ids)}"
+            session = Session(sid, req, self.handles)
+            self.sessions[sid] = session
+        session.start()
+        log('INFO', f"[AGENT] Started session {sid} ({', '.join(session.metrics)})", to_file=False)
+        return {"session": sid, "start_at_ns": session.start_at_ns}
+
+    def _session(self, req):
+        session = self.sessions.get(req.get("session"))
+        if session is None:
+            raise KeyError(f"Unknown session {req.get('session')!r}")
+        return session
+
+    def stop(self, req):
+        session = self._session(req)
+        session.stop(now=bool(req.get("now")))
+        log('INFO', f"[AGENT] Stopped session {session.sid}", to_file=False)
+        return session.summary()
+
+    def collect(self, req):
+        session = self._session(req)
+        summary = session.summary()
+        if not summary["running"]:
+            with self.lock:
+                self.sessions.pop(session.sid, None)
+        return summary
+
+
+class _AgentHandler(BaseHTTPRequestHandler):
+    agent = None
+
+    def _reply(self, code, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            return self._reply(200, {"status": "ok", "sessions": list(self.agent.sessions), "pid": os.getpid()})
+        return self._reply(404, {"status": "error", "message": f"unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        routes = {"/start": self.agent.start, "/stop": self.agent.stop, "/collect": self.agent.collect}
+        if self.path not in routes:
+            return self._reply(404, {"status": "error", "message": f"unknown endpoint {self.path}"})
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            req = json.loads(self.rfile.read(length) or b"{}") if length else {}
+            return self._reply(200, {"status": "ok", **routes[self.path](req)})
+        except KeyError as e:
+            return self._reply(404, {"status": "error", "message": str(e)})
+        except (ValueError, OSError) as e:
+            return self._reply(400, {"status": "error", "message": str(e)})
+
+    def log_message(self, fmt, *fmt_args):
+        pass
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT):
+    handler = type("AgentHandler", (_AgentHandler,), {"agent": Agent()})
+    server = ThreadingHTTPServer((host, port), handler)
+    log('INFO', f"[AGENT] Listening on http://{host}:{port}", to_file=False)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Agent đo thường trú trên DUT")
+    parser.add_argument("--host", default="127.0.0.1", help="Chỉ nghe localhost theo mặc định")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--cpus", default=None, help="Ghim agent sang core housekeeping, vd 4-7")
+    args = parser.parse_args()
+    if args.cpus:
+        os.sched_setaffinity(0, parse_cpus(args.cpus))
+        log('INFO', f"[AGENT] Pinned to cpus {sorted(os.sched_getaffinity(0))}", to_file=False)
+    serve(args.host, args.port)
@@ -8,6 +8,7 @@ import argparse
 from logger import (
     init_logger, set_run_log, close_run_log, log
 )
+from cmd_runner import run_cmd
 import yaml
 
 # --- Parse CLI arguments ---
@@ -61,25 +62,6 @@ init_logger(LOG_FILE)
 g_system_log = open(LOG_FILE, "a", buffering=1)
 g_log_file = None  # profiling log (per-run)
 
-# --- Run shell command ---
-def run_cmd(cmd, desc, check=True):
-    log('DEBUG', f"{desc}: {' '.join(cmd)}")
-    try:
-        result = subprocess.run(cmd, check=check, capture_output=True, text=True)
-        if result.stdout.strip():
-            for line in result.stdout.splitlines():
-                log('INFO', f"  {line}", to_file=False)
-        if result.stderr.strip():
-            for line in result.stderr.splitlines():
-                log('WARN', f"  {line}", to_file=False)
-        return result
-    except subprocess.CalledProcessError as e:
-        log('ERROR', f"Command failed ({desc}): {e}")
-        log('ERROR', f"STDOUT: {e.stdout.strip()}")
-        log('ERROR', f"STDERR: {e.stderr.strip()}")
-        if check: raise
-        return None
-
 # --- Unload all XDP programs ---
 def unload_xdp():
     run_cmd(["sudo", "xdp-loader", "unload", iface, "--all"], "Unload all XDP programs", check=False)
@@ -1,43 +1,437 @@
 #!/usr/bin/env python3
+import argparse
+import asyncio
 import ctypes
+import json
+import os
+import threading
 import time
 import csv
-import sys
+from collections import namedtuple
 from datetime import datetime
-from bcc import libbcc
 
-# ==== KHAI BÁO HÀM GỐC TỪ LIBBCC ====
-libbcc.lib.bpf_obj_get.argtypes = [ctypes.c_char_p]
-libbcc.lib.bpf_obj_get.restype = ctypes.c_int
+import numpy as np
 
-libbcc.lib.bpf_map_lookup_elem.argtypes = [
-    ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p
-]
-libbcc.lib.bpf_map_lookup_elem.restype = ctypes.c_int
+import bpf_syscall
 
+# "bpf": pinned map thật qua syscall bpf(2) (bpf_syscall.py); "file": file do sim_backend.py ghi
+ACCOUNTING_BACKEND = os.environ.get("ACCOUNTING_BACKEND", "bpf")
 
-# ==== STRUCT PHẢI KHỚP VỚI CODE C ====
-class Accounting(ctypes.Structure):
-    _fields_ = [
-        ("time_in", ctypes.c_uint64),
-        ("proc_time", ctypes.c_uint64),
-        ("total_pkts", ctypes.c_uint64),
-        ("total_bytes", ctypes.c_uint64),
-    ]
+
+# Kiểu field dùng trong layout struct khai báo ở config
+FIELD_TYPES = {
+    "u8": ctypes.c_uint8, "u16": ctypes.c_uint16, "u32": ctypes.c_uint32, "u64": ctypes.c_uint64,
+    "s8": ctypes.c_int8, "s16": ctypes.c_int16, "s32": ctypes.c_int32, "s64": ctypes.c_int64,
+}
+
+# ==== LAYOUT PHẢI KHỚP VỚI STRUCT TRONG CODE C ====
+# {tên layout: {field: kiểu}} theo đúng thứ tự field; config (mục `layouts`) thêm/ghi đè
+DEFAULT_LAYOUTS = {
+    "accounting": {"time_in": "u64", "proc_time": "u64", "total_pkts": "u64", "total_bytes": "u64"},
+}
+
+
+def make_struct(name: str, fields):
+    """ctypes.Structure từ layout {field: kiểu} (hoặc list [field, kiểu]), căn lề như compiler C."""
+    fields = dict(fields)
+    unknown = sorted({t for t in fields.values() if t not in FIELD_TYPES})
+    if not fields or unknown:
+        raise ValueError(f"Layout {name!r}: needs at least one field, unknown types {unknown} "
+                         f"(available: {', '.join(FIELD_TYPES)})")
+    return type(name, (ctypes.Structure,), {"_fields_": [(f, FIELD_TYPES[t]) for f, t in fields.items()]})
+
+
+Accounting = make_struct("Accounting", DEFAULT_LAYOUTS["accounting"])
+
+
+# Giá trị `type` trong struct bpf_map_info (include/uapi/linux/bpf.h)
+BPF_MAP_TYPE_ARRAY = 2
+BPF_MAP_TYPE_PERCPU_ARRAY = 6
+ARRAY_MAP_TYPES = (BPF_MAP_TYPE_ARRAY, BPF_MAP_TYPE_PERCPU_ARRAY)
+N_FIELDS = len(Accounting._fields_)
+
+
+def possible_cpus(path="/sys/devices/system/cpu/possible"):
+    """Số CPU "possible" (vd "0-3" -> 4): value của map per-CPU có đúng ngần này phần tử."""
+    with open(path) as f:
+        spec = f.read().strip()
+    return int(spec.split(",")[-1].split("-")[-1]) + 1
+
+
+def totals(values):
+    """Cộng các hàng per-CPU (ndarray ncpu × 4) thành một struct Accounting."""
+    return Accounting(*values.sum(axis=0, dtype=np.uint64).tolist())
+
+
+class MapReader:
+    """
+    Pinned map dạng array (key u32) mở một lần, dùng lại fd và buffer ctypes cấp sẵn cho
+    key/value ở mọi lần đọc: mỗi mẫu chỉ tốn một syscall bpf(), không cấp phát gì thêm.
+    Map bị pin lại sau mỗi lần load XDP -> mở lại khi inode của file pin đổi (kiểm tra
+    tối đa mỗi `check_every` giây để không thêm stat() vào mỗi mẫu).
+
+    values: ndarray uint64 (max_entries × ncpu × value_size/8) trỏ thẳng vào buffer ctypes;
+    ncpu = số CPU possible với map per-CPU, 1 với map thường.
+    """
+
+    def __init__(self, map_path: str, value_size: int = None, check_every: float = 1.0):
+        self.map_path = map_path
+        self.value_size = value_size
+        self.check_every = check_every
+        self.inode = None
+        self.next_check = 0.0
+        self.fd = None
+        self.file = None
+        self.key = ctypes.c_uint32(0)
+        self.percpu = False
+        self.ncpu = 1
+        self.max_entries = 1
+        self.stride = 0
+        self.buf = None
+        self.keys = None
+        self.values = None
+        self.batch = False
+
+    def _open(self):
+        self.close()
+        self.inode = os.stat(self.map_path).st_ino
+        if ACCOUNTING_BACKEND == "file":
+            self._open_file()
+        else:
+            try:
+                self.fd = bpf_syscall.obj_get(self.map_path)
+            except OSError as e:
+                raise OSError(e.errno, f"Cannot open pinned map at {self.map_path}: {e.strerror}") from None
+            info = bpf_syscall.obj_get_info(self.fd)
+            if info.type not in ARRAY_MAP_TYPES:
+                raise OSError(f"{self.map_path}: map type {info.type} is not an array map")
+            self.percpu = info.type == BPF_MAP_TYPE_PERCPU_ARRAY
+            self.ncpu = possible_cpus() if self.percpu else 1
+            self.max_entries = info.max_entries
+            self.value_size = info.value_size
+        # Kernel làm tròn mỗi value per-CPU lên bội số 8 byte
+        self.stride = (self.value_size + 7) // 8 * 8
+        self.buf = (ctypes.c_uint8 * (self.max_entries * self.ncpu * self.stride))()
+        self.keys = (ctypes.c_uint32 * self.max_entries)()
+        self.values = np.frombuffer(self.buf, dtype=np.uint64).reshape(
+            self.max_entries, self.ncpu, self.stride // 8)
+        # Nhiều key -> thử BPF_MAP_LOOKUP_BATCH (kernel >= 5.6), lỗi thì lùi về lookup từng key
+        self.batch = self.fd is not None and self.max_entries > 1
+        # attr của syscall cấp sẵn, mỗi lần đọc chỉ đổi con trỏ value
+        self.elem_attr = bpf_syscall.MapElemAttr(map_fd=self.fd or 0, key=bpf_syscall.addr(self.key))
+        self.batch_attr = bpf_syscall.BatchAttr()
+        self.out_batch = ctypes.c_uint32(0)
+        self.next_check = time.monotonic() + self.check_every
+
+    def _open_file(self):
+        """
+        Map giả của sim_backend.py: file max_entries × ncpu × value_size byte. Layout lấy từ
+        `<map>.info` (JSON type/max_entries/value_size) nếu có; không có thì là map một entry,
+        file n × value_size byte = PERCPU_ARRAY n CPU.
+        """
+        self.file = open(self.map_path, "rb", buffering=0)
+        size = os.fstat(self.file.fileno()).st_size
+        try:
+            with open(self.map_path + ".info") as f:
+                info = json.load(f)
+        except FileNotFoundError:
+            info = {"max_entries": 1, "value_size": self.value_size}
+        self.max_entries = int(info["max_entries"])
+        self.value_size = int(info["value_size"])
+        self.ncpu = max(1, size // (self.max_entries * self.value_size))
+        self.percpu = info.get("type", BPF_MAP_TYPE_PERCPU_ARRAY if self.ncpu > 1 else BPF_MAP_TYPE_ARRAY) \
+            == BPF_MAP_TYPE_PERCPU_ARRAY
+
+    def _ensure_open(self):
+        if self.inode is None:
+            self._open()
+        elif time.monotonic() >= self.next_check:
+            if os.stat(self.map_path).st_ino != self.inode:
+                self._open()
+            self.next_check = time.monotonic() + self.check_every
+
+    def _value_addr(self, key):
+        return ctypes.addressof(self.buf) + key * self.ncpu * self.stride
+
+    def _pread(self, key, count=1):
+        """Backend "file": count entry liên tiếp từ key trong một lần pread."""
+        size = count * self.ncpu * self.stride
+        data = os.pread(self.file.fileno(), size, key * self.ncpu * self.stride)
+        if len(data) != size:
+            raise OSError(f"Short read from simulated map {self.map_path}")
+        ctypes.memmove(self._value_addr(key), data, size)
+
+    def _lookup_into(self, key):
+        if self.file is not None:
+            return self._pread(key)
+        self.key.value = key
+        self.elem_attr.value = self._value_addr(key)
+        try:
+            bpf_syscall.sys_bpf(bpf_syscall.BPF_MAP_LOOKUP_ELEM, self.elem_attr)
+        except OSError as e:
+            raise OSError(e.errno, f"Failed to read map element {key}: {e.strerror}") from None
+
+    def _lookup_batch(self):
+        """Mọi entry trong một lệnh BPF_MAP_LOOKUP_BATCH; False nếu kernel không hỗ trợ."""
+        try:
+            count, _ = bpf_syscall.map_lookup_batch(self.fd, self.keys, self.buf, self.max_entries,
+                                                    out_batch=self.out_batch, attr=self.batch_attr)
+            if count == self.max_entries:
+                return True
+            reason = f"got {count}/{self.max_entries} entries"
+        except OSError as e:
+            reason = e.strerror
+        print(f"[MAP] Batch lookup unavailable on {self.map_path} ({reason}), using per-key lookups")
+        self.batch = False
+        return False
+
+    def lookup(self, key=0, out=None):
+        """Value của một key (ncpu × value_size/8). out: mảng cùng shape để ghi vào, không cấp phát."""
+        self._ensure_open()
+        self._lookup_into(key)
+        if out is None:
+            return self.values[key].copy()
+        np.copyto(out, self.values[key])
+        return out
+
+    def lookup_all(self, out=None):
+        """Mọi entry (max_entries × ncpu × value_size/8), batch nếu được."""
+        self._ensure_open()
+        if self.file is not None:
+            self._pread(0, self.max_entries)
+        elif not (self.batch and self._lookup_batch()):
+            for key in range(self.max_entries):
+                self._lookup_into(key)
+        if out is None:
+            return self.values.copy()
+        np.copyto(out, self.values)
+        return out
+
+    def update(self, key, values):
+        """Ghi value (ncpu hàng) cho một key, BPF_ANY."""
+        self._ensure_open()
+        data = (ctypes.c_uint8 * (self.ncpu * self.stride)).from_buffer_copy(
+            np.ascontiguousarray(values, dtype=np.uint64).tobytes())
+        if self.file is not None:
+            with open(self.map_path, "r+b") as f:
+                f.seek(key * ctypes.sizeof(data))
+                f.write(bytes(data))
+            return
+        self.key.value = key
+        bpf_syscall.map_update_elem(self.fd, self.key, data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        self.inode = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AccountingReader(MapReader):
+    """
+    accounting_map: một entry struct Accounting, ARRAY (dùng chung) hoặc PERCPU_ARRAY.
+    read_percpu() trả về ndarray (ncpu × 4) của mọi CPU.
+    """
+
+    def __init__(self, map_path: str, check_every: float = 1.0):
+        super().__init__(map_path, value_size=ctypes.sizeof(Accounting), check_every=check_every)
+
+    def read_percpu(self, out=None):
+        """ndarray uint64 (ncpu × 4): time_in, proc_time, total_pkts, total_bytes của từng CPU."""
+        # copy (hoặc ghi vào out) để mẫu trước không bị ghi đè ở lần đọc sau
+        return self.lookup(0, out)
+
+    def read(self):
+        """Tổng trên mọi CPU dưới dạng struct Accounting."""
+        return totals(self.read_percpu())
+
+    def reset(self):
+        """Snapshot (tổng) rồi ghi 0 cho mọi CPU. Trả về snapshot."""
+        snap = self.read()
+        self.update(0, np.zeros((self.ncpu, N_FIELDS), dtype=np.uint64))
+        return snap
+
+
+# Percentile xuất ra CSV, tính từ histogram latency trong kernel
+PERCENTILES = (50, 90, 99, 99.9)
+PERCENTILE_COLS = ["p50_ns", "p90_ns", "p99_ns", "p999_ns"]
+
+
+def hist_edges(n_buckets: int, kind: str = "log2", bucket_ns: float = 1.0):
+    """
+    Biên (ns) của n_buckets bucket, ndarray n_buckets + 1 phần tử.
+    log2: như bpf_log2l() của bcc, bucket 0 = [0, 1), bucket i = [2^(i-1), 2^i) × bucket_ns.
+    linear: bucket i = [i, i + 1) × bucket_ns. Bucket cuối gom mọi giá trị vượt ngưỡng.
+    """
+    if kind == "log2":
+        edges = np.concatenate(([0.0], 2.0 ** np.arange(n_buckets)))
+    elif kind == "linear":
+        edges = np.arange(n_buckets + 1, dtype=float)
+    else:
+        raise ValueError(f"Unknown histogram kind {kind!r} (log2, linear)")
+    return edges * bucket_ns
+
+
+def hist_percentiles(counts, edges, percentiles=PERCENTILES):
+    """Percentile (ns) từ số gói mỗi bucket, nội suy tuyến tính trong bucket; 0 nếu không có gói."""
+    total = counts.sum()
+    if total <= 0:
+        return [0.0] * len(percentiles)
+    cum = np.cumsum(counts)
+    ranks = np.asarray(percentiles, dtype=float) / 100 * total
+    idx = np.minimum(np.searchsorted(cum, ranks, side="left"), len(counts) - 1)
+    below = cum[idx] - counts[idx]
+    frac = np.divide(ranks - below, counts[idx], out=np.zeros(len(idx)), where=counts[idx] > 0)
+    return (edges[idx] + frac * (edges[idx + 1] - edges[idx])).tolist()
+
+
+class HistogramReader(MapReader):
+    """
+    Map histogram latency mỗi gói (tuỳ chọn): array u64, key = bucket, cộng dồn từ lúc load.
+    read() trả về số gói mỗi bucket (cộng mọi CPU nếu per-CPU) bằng một lần lookup_all().
+    """
+
+    def __init__(self, map_path: str, kind: str = "log2", bucket_ns: float = 1.0, check_every: float = 1.0):
+        super().__init__(map_path, value_size=8, check_every=check_every)
+        self.kind = kind
+        self.bucket_ns = bucket_ns
+        self.edges = None
+
+    def _open(self):
+        super()._open()
+        self.edges = hist_edges(self.max_entries, self.kind, self.bucket_ns)
+
+    def read(self):
+        return self.lookup_all()[:, :, 0].sum(axis=1, dtype=np.uint64)
+
+    def percentiles(self, h1, h2):
+        """Percentile của các gói xử lý giữa hai lần read(); map bị load lại thì bucket âm -> 0."""
+        return hist_percentiles(np.clip(h2.astype(np.int64) - h1.astype(np.int64), 0, None), self.edges)
+
+
+class StructReader(MapReader):
+    """
+    Map array bất kỳ có value là struct khai báo bằng layout (make_struct).
+    read() trả về structured ndarray (max_entries × ncpu), mỗi field một cột theo tên.
+    """
+
+    def __init__(self, map_path: str, struct, check_every: float = 1.0):
+        super().__init__(map_path, value_size=ctypes.sizeof(struct), check_every=check_every)
+        self.struct = struct
+        self.fields = [name for name, _ in struct._fields_]
+        self.dtype = None
+
+    def _open(self):
+        super()._open()
+        size = ctypes.sizeof(self.struct)
+        if self.value_size != size:
+            self.close()
+            raise OSError(f"{self.map_path}: value_size {self.value_size} does not match layout "
+                          f"{self.struct.__name__} ({size} bytes)")
+        # dtype theo offset của ctypes, itemsize = stride để view thẳng lên buffer
+        base = np.dtype(self.struct)
+        self.dtype = np.dtype({"names": self.fields, "formats": [base.fields[f][0] for f in self.fields],
+                               "offsets": [base.fields[f][1] for f in self.fields], "itemsize": self.stride})
+
+    def read(self):
+        return self.lookup_all().view(self.dtype)[..., 0]
+
+    def totals(self, values):
+        """{field: list giá trị mỗi entry, cộng mọi CPU} từ một kết quả read()."""
+        return {f: values[f].sum(axis=1).tolist() for f in self.fields}
+
+
+# Một map đọc thêm trong mỗi tick của Sampler: tên cột, đường dẫn pin, struct (make_struct)
+MapSpec = namedtuple("MapSpec", "name path layout")
+
+
+def map_specs(section, iface: str = None, pin_dir: str = None):
+    """
+    Danh sách MapSpec từ mục config {layouts: {tên: {field: kiểu}}, maps: [{name, path, layout, ifaces}]}.
+    `{iface}` trong path được thay bằng từng iface của `ifaces` (mặc định: iface của cell) và tên
+    map thành `<name>@<iface>`; path tương đối nằm trong pin_dir (thư mục của accounting_map).
+    """
+    section = section or {}
+    layouts = {**DEFAULT_LAYOUTS, **(section.get("layouts") or {})}
+    structs = {}
+    specs = []
+    for entry in section.get("maps") or []:
+        layout = entry.get("layout", "accounting")
+        if layout not in layouts:
+            raise ValueError(f"Map {entry.get('name')!r}: unknown layout {layout!r}, "
+                             f"declared: {sorted(layouts)}")
+        if layout not in structs:
+            structs[layout] = make_struct(layout, layouts[layout])
+        path = entry["path"]
+        if pin_dir and not os.path.isabs(path):
+            path = os.path.join(pin_dir, path)
+        ifaces = entry.get("ifaces")
+        if "{iface}" not in path:
+            specs.append(MapSpec(entry["name"], path, structs[layout]))
+            continue
+        if not (ifaces or iface):
+            raise ValueError(f"Map {entry['name']!r}: path {path} needs an iface")
+        for name in ifaces or [iface]:
+            label = f"{entry['name']}@{name}" if ifaces else entry["name"]
+            specs.append(MapSpec(label, path.format(iface=name), structs[layout]))
+    names = [s.name for s in specs]
+    dup = sorted({n for n in names if names.count(n) > 1})
+    if dup:
+        raise ValueError(f"Duplicate map names {dup}")
+    return specs
 
 
 def read_accounting(map_path: str):
-    """Đọc entry duy nhất trong accounting_map"""
-    map_fd = libbcc.lib.bpf_obj_get(map_path.encode("utf-8"))
-    if map_fd < 0:
-        raise OSError(f"Cannot open pinned map at {map_path}")
+    """Đọc entry duy nhất trong accounting_map (tổng các CPU nếu map là per-CPU)"""
+    reader = AccountingReader(map_path)
+    try:
+        return reader.read()
+    finally:
+        reader.close()
+
+
+def reset_accounting(map_path: str):
+    """Snapshot entry hiện tại rồi ghi 0 vào accounting_map. Trả về snapshot."""
+    reader = AccountingReader(map_path)
+    try:
+        return reader.reset()
+    finally:
+        reader.close()
 
-    key = ctypes.c_uint32(0)
-    val = Accounting()
-    ret = libbcc.lib.bpf_map_lookup_elem(map_fd, ctypes.byref(key), ctypes.byref(val))
-    if ret != 0:
-        raise OSError("Failed to read map element")
-    return val
+
+def bench_reads(map_path: str, n: int = 10000):
+    """
+    Micro-benchmark chi phí mỗi mẫu (µs): mở map mỗi lần đọc (read_accounting) so với
+    reader giữ fd + buffer cấp sẵn; map nhiều key thì thêm batch so với lookup từng key.
+    """
+    def per_sample_us(fn, count):
+        fn()
+        t0 = time.perf_counter_ns()
+        for _ in range(count):
+            fn()
+        return (time.perf_counter_ns() - t0) / count / 1000
+
+    result = {"reopen": per_sample_us(lambda: read_accounting(map_path), n)}
+    with AccountingReader(map_path) as reader:
+        out = reader.read_percpu()
+        result["persistent"] = per_sample_us(reader.read_percpu, n)
+        result["persistent_out"] = per_sample_us(lambda: reader.read_percpu(out), n)
+        if reader.max_entries > 1:
+            all_out = reader.lookup_all()
+            batched = reader.batch or reader.file is not None
+            result["batch"] = per_sample_us(lambda: reader.lookup_all(all_out), n) if batched else None
+            result["per_key"] = per_sample_us(lambda: [reader._lookup_into(k) for k in range(reader.max_entries)], n)
+        result.update(backend=ACCOUNTING_BACKEND, ncpu=reader.ncpu, max_entries=reader.max_entries, samples=n)
+    return result
 
 
 def compute_metrics(ac1: Accounting, ac2: Accounting, interval: float):
@@ -53,64 +447,466 @@ def compute_metrics(ac1: Accounting, ac2: Accounting, interval: float):
     return throughput_bps, avg_latency_ns, pps
 
 
+def compute_percpu_metrics(v1, v2, interval: float):
+    """PPS và latency (ns/pkt) của từng CPU từ hai mẫu ncpu × 4."""
+    delta = v2.astype(np.int64) - v1.astype(np.int64)
+    delta_proc, delta_pkts = delta[:, 1], delta[:, 2]
+    pps = delta_pkts / interval if interval > 0 else np.zeros(len(delta))
+    latency = np.divide(delta_proc, delta_pkts, out=np.zeros(len(delta)), where=delta_pkts > 0)
+    return pps, latency
+
+
+def csv_header(percpu_cpus=0, hist=False):
+    """
+    Cột CSV. t_s: thời điểm đọc mẫu (giây, monotonic) so với mẫu đầu; interval_s: khoảng
+    thực tế giữa hai lần đọc. Có histogram thì thêm p50_ns..p999_ns trong interval.
+    Map per-CPU có thêm pps_cpu<i>, latency_ns_cpu<i> để thấy lệch RSS.
+    """
+    cols = ["timestamp", "throughput_Bps", "pps", "latency_ns", "t_s", "interval_s"]
+    if hist:
+        cols += PERCENTILE_COLS
+    for i in range(percpu_cpus):
+        cols += [f"pps_cpu{i}", f"latency_ns_cpu{i}"]
+    return cols
+
+
+def metrics_row(v1, v2, interval: float, t_s: float, percpu=False, percentiles=None):
+    """
+    (throughput, latency, pps, cột CSV sau timestamp) từ hai mẫu read_percpu() cách nhau interval giây.
+    percentiles: kết quả HistogramReader.percentiles() của cùng interval, None nếu không có histogram.
+    """
+    throughput, latency, pps = compute_metrics(totals(v1), totals(v2), interval)
+    row = [round(throughput, 6), round(pps, 3), round(latency, 3), round(t_s, 6), round(interval, 6)]
+    if percentiles is not None:
+        row += [round(p, 3) for p in percentiles]
+    if percpu:
+        pps_c, lat_c = compute_percpu_metrics(v1, v2, interval)
+        for p, l in zip(pps_c.tolist(), lat_c.tolist()):
+            row += [round(p, 3), round(l, 3)]
+    return throughput, latency, pps, row
+
+
+# Một mẫu gửi cho subscriber. index 0 là mốc (lần đọc đầu), chưa có metric;
+# throughput/pps/latency/percentiles là None nếu Sampler chạy với metrics=False.
+# maps: {tên: StructReader.read()} của các map đọc thêm, cùng tick và cùng t_ns với values;
+# read_ns: thời gian đọc hết mọi map trong tick (độ lệch tối đa giữa các map).
+Sample = namedtuple("Sample", "index t_ns t_s interval_s values hist throughput pps latency percentiles "
+                              "maps read_ns")
+
+
+class Sampler:
+    """
+    Lấy mẫu accounting_map (+ histogram latency nếu có) ngay trong process gọi, tại các deadline
+    tuyệt đối t0 + k·interval (monotonic ns) nên chu kỳ không trôi; deadline bị lỡ thì bỏ qua
+    và đếm vào `missed`.
+
+    run() block tới khi hết duration / stop(); start() chạy trong thread, run_async() cho asyncio.
+    Mỗi mẫu gọi lần lượt các subscriber(sample) trong thread của sampler (ghi file, warm-up,
+    dashboard...), subscriber có thể gọi stop() để dừng sớm. reader/hist_reader: dùng lại
+    handle đang mở (vd. agent), Sampler không đóng chúng.
+    maps: list MapSpec (map_specs) đọc thêm ngay sau accounting_map trong cùng tick, chung timestamp
+    (nhiều map / nhiều iface không cần thêm process sampler).
+    Đọc map lỗi max_read_errors lần liên tiếp (map mất hẳn) thì run() raise OSError.
+    """
+
+    def __init__(self, map_path: str = None, interval: float = 1.0, duration: float = None,
+                 start_at: int = None, spin_us: float = 0.0, hist_map: str = None, hist_kind: str = "log2",
+                 hist_bucket_ns: float = 1.0, metrics: bool = True, reader=None, hist_reader=None,
+                 maps=None, max_read_errors: int = 5):
+        self.owns_readers = reader is None
+        self.reader = reader or AccountingReader(map_path)
+        self.hist = hist_reader
+        if self.hist is None and hist_map:
+            if os.path.exists(hist_map):
+                self.hist = HistogramReader(hist_map, hist_kind, hist_bucket_ns)
+            else:
+                print(f"[HIST] {hist_map} not found, writing average latency only")
+        self.map_readers = {}
+        for spec in maps or []:
+            if os.path.exists(spec.path):
+                self.map_readers[spec.name] = StructReader(spec.path, spec.layout)
+            else:
+                print(f"[MAPS] {spec.path} not found, skipping {spec.name}")
+        self.interval_ns = int(interval * 1e9)
+        self.n_samples = round(duration / interval) if duration is not None else None
+        self.start_at = start_at
+        self.spin_ns = int(spin_us * 1000)
+        self.metrics = metrics
+        self.subscribers = []
+        self.samples = 0
+        self.missed = 0
+        self.read_errors = 0
+        self.max_read_errors = max_read_errors
+        self.t_first = None
+        self.error = None
+        self.thread = None
+        self._stop = threading.Event()
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+        return callback
+
+    def stop(self):
+        self._stop.set()
+
+    def _sleep_until(self, deadline_ns):
+        """
+        Ngủ tới deadline tuyệt đối kiểu clock_nanosleep(TIMER_ABSTIME), spin_ns cuối busy-wait để
+        bớt jitter của sleep. Thức dậy ngay khi stop(); False nếu bị dừng.
+        """
+        remaining = deadline_ns - time.monotonic_ns()
+        if remaining > self.spin_ns and self._stop.wait((remaining - self.spin_ns) / 1e9):
+            return False
+        while time.monotonic_ns() < deadline_ns:
+            pass
+        return not self._stop.is_set()
+
+    def _publish(self, sample):
+        for callback in self.subscribers:
+            callback(sample)
+
+    def _read(self):
+        values = self.reader.read_percpu()
+        hist = self.hist.read() if self.hist else None
+        maps = {name: r.read() for name, r in self.map_readers.items()} if self.map_readers else None
+        return values, hist, maps
+
+    def run(self):
+        try:
+            self._loop()
+        finally:
+            if self.owns_readers:
+                self.reader.close()
+                if self.hist:
+                    self.hist.close()
+            for r in self.map_readers.values():
+                r.close()
+
+    def _loop(self):
+        if self.start_at is not None:
+            wait_ns = self.start_at - time.monotonic_ns()
+            if wait_ns > 0:
+                if not self._sleep_until(self.start_at):
+                    return
+            else:
+                print(f"[SYNC] Started {-wait_ns / 1e6:.1f} ms after the barrier")
+
+        t_read = time.monotonic_ns()
+        v_prev, h_prev, m_prev = self._read()
+        t_prev = self.t_first = time.monotonic_ns()
+        self._publish(Sample(0, self.t_first, 0.0, 0.0, v_prev, h_prev, None, None, None, None,
+                             m_prev, t_prev - t_read))
+        # Lưới deadline neo vào barrier (nếu có) để thẳng hàng với các collector khác
+        start_at = self.start_at
+        t_grid = start_at if start_at is not None and start_at >= self.t_first - self.interval_ns else self.t_first
+        k = 0
+
+        errors_in_row = 0
+        # Giới hạn theo chỉ số deadline, không theo số mẫu đọc được: map mất giữa chừng
+        # (XDP bị unload) thì vòng vẫn kết thúc đúng duration
+        while self.n_samples is None or k < self.n_samples:
+            k += 1
+            deadline = t_grid + k * self.interval_ns
+            now = time.monotonic_ns()
+            if now > deadline + self.interval_ns:
+                # Lỡ ít nhất một chu kỳ -> nhảy tới deadline kế tiếp, không dồn mẫu
+                skip = (now - deadline) // self.interval_ns
+                if self.n_samples is not None:
+                    skip = min(skip, self.n_samples - k)
+                self.missed += skip
+                k += skip
+                deadline = t_grid + k * self.interval_ns
+            if not self._sleep_until(deadline):
+                break
+            t_read = time.monotonic_ns()
+            try:
+                v_now, h_now, m_now = self._read()
+            except OSError as e:
+                self.read_errors += 1
+                errors_in_row += 1
+                print(f"[SAMPLER] Map read failed: {e}")
+                if errors_in_row >= self.max_read_errors:
+                    raise OSError(e.errno, f"{errors_in_row} consecutive map reads failed, giving up: "
+                                           f"{e.strerror or e}") from e
+                continue
+            errors_in_row = 0
+            t_now = time.monotonic_ns()
+            interval_s = (t_now - t_prev) / 1e9
+            throughput = pps = latency = pct = None
+            if self.metrics:
+                throughput, latency, pps = compute_metrics(totals(v_prev), totals(v_now), interval_s)
+                pct = self.hist.percentiles(h_prev, h_now) if self.hist else None
+            self.samples += 1
+            self._publish(Sample(self.samples, t_now, (t_now - self.t_first) / 1e9, interval_s, v_now, h_now,
+                                 throughput, pps, latency, pct, m_now, t_now - t_read))
+            v_prev, h_prev, t_prev = v_now, h_now, t_now
+
+    def _guard(self):
+        try:
+            self.run()
+        except Exception as e:
+            self.error = e
+
+    def start(self):
+        """Chạy run() trong thread nền; lỗi (nếu có) nằm ở self.error."""
+        self.thread = threading.Thread(target=self._guard, name="sampler", daemon=True)
+        self.thread.start()
+        return self
+
+    def join(self, timeout=None):
+        """Chờ thread; True nếu sampler đã kết thúc."""
+        if self.thread is not None:
+            self.thread.join(timeout)
+            return not self.thread.is_alive()
+        return True
+
+    async def run_async(self):
+        """run() trong thread của asyncio.to_thread; task bị huỷ thì dừng sampler."""
+        try:
+            await asyncio.to_thread(self.run)
+        except asyncio.CancelledError:
+            self.stop()
+            raise
+
+
+class CsvSink:
+    """Subscriber ghi CSV throughput/pps/latency (csv_header + metrics_row) từ counter thô của mẫu."""
+
+    def __init__(self, sampler, path, flush_every=1.0):
+        self.sampler = sampler
+        self.path = path
+        self.flush_every_ns = int(flush_every * 1e9)
+        self.f = None
+        self.writer = None
+        self.prev = None
+        self.next_flush = 0
+
+    def __call__(self, sample):
+        reader, hist = self.sampler.reader, self.sampler.hist
+        if self.f is None:
+            # Header sau lần đọc đầu: lúc đó mới biết map có per-CPU hay không
+            self.f = open(self.path, "w", newline="")
+            self.writer = csv.writer(self.f)
+            self.writer.writerow(csv_header(reader.ncpu if reader.percpu else 0, hist is not None))
+            self.next_flush = sample.t_ns + self.flush_every_ns
+        if sample.index > 0:
+            pct = sample.percentiles
+            if hist and pct is None:
+                pct = hist.percentiles(self.prev.hist, sample.hist)
+            *_, row = metrics_row(self.prev.values, sample.values, sample.interval_s, sample.t_s,
+                                  reader.percpu, pct)
+            self.writer.writerow([datetime.now().strftime("%Y-%m-%d %H:%M:%S")] + row)
+            if sample.t_ns >= self.next_flush:
+                self.f.flush()
+                self.next_flush = sample.t_ns + self.flush_every_ns
+        self.prev = sample
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+class BinSink:
+    """Subscriber ghi record nhị phân thô (ts_binary.TimeSeriesWriter), không tính metric."""
+
+    def __init__(self, sampler, path):
+        self.sampler = sampler
+        self.path = path
+        self.out = None
+
+    def __call__(self, sample):
+        if self.out is None:
+            from ts_binary import TimeSeriesWriter
+            reader, hist = self.sampler.reader, self.sampler.hist
+            self.out = TimeSeriesWriter(self.path, reader.ncpu, reader.percpu, hist.max_entries if hist else 0,
+                                        hist.kind if hist else None, hist.bucket_ns if hist else 1.0,
+                                        self.sampler.interval_ns, capacity=(self.sampler.n_samples or 4095) + 1)
+        self.out.append(sample.t_ns, sample.values, sample.hist)
+
+    def close(self):
+        if self.out is not None:
+            self.out.close()
+            self.out = None
+
+
+class MapsCsvSink:
+    """
+    Subscriber ghi counter thô (cộng mọi CPU) của các map đọc thêm, một dòng mỗi tick kể cả
+    mốc index 0, chung cột t_ns với CSV throughput. Cột `<map>.<field>`, map nhiều entry thì
+    `<map>[<key>].<field>`; read_us = thời gian đọc hết các map trong tick.
+    """
+
+    def __init__(self, sampler, path, flush_every=1.0):
+        self.sampler = sampler
+        self.path = path
+        self.flush_every_ns = int(flush_every * 1e9)
+        self.f = None
+        self.writer = None
+        self.next_flush = 0
+
+    def _header(self, maps):
+        cols = ["timestamp", "t_ns", "t_s", "read_us"]
+        for name, values in maps.items():
+            fields = self.sampler.map_readers[name].fields
+            if len(values) == 1:
+                cols += [f"{name}.{f}" for f in fields]
+            else:
+                cols += [f"{name}[{k}].{f}" for k in range(len(values)) for f in fields]
+        return cols
+
+    def __call__(self, sample):
+        if not sample.maps:
+            return
+        if self.f is None:
+            self.f = open(self.path, "w", newline="")
+            self.writer = csv.writer(self.f)
+            self.writer.writerow(self._header(sample.maps))
+            self.next_flush = sample.t_ns + self.flush_every_ns
+        row = [datetime.now().strftime("%Y-%m-%d %H:%M:%S"), sample.t_ns, round(sample.t_s, 6),
+               round(sample.read_ns / 1000, 3)]
+        for name, values in sample.maps.items():
+            cols = list(self.sampler.map_readers[name].totals(values).values())
+            row += [col[k] for k in range(len(values)) for col in cols]
+        self.writer.writerow(row)
+        if sample.t_ns >= self.next_flush:
+            self.f.flush()
+            self.next_flush = sample.t_ns + self.flush_every_ns
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+class ConsolePrinter:
+    """Subscriber in throughput/PPS/latency trung bình từ lần in trước, mỗi print_every giây."""
+
+    def __init__(self, print_every=1.0):
+        self.every_ns = int(print_every * 1e9)
+        self.last = None
+
+    def __call__(self, sample):
+        if self.last is None:
+            self.last = sample
+            return
+        if sample.t_ns - self.last.t_ns < self.every_ns:
+            return
+        throughput, latency, pps = compute_metrics(totals(self.last.values), totals(sample.values),
+                                                   (sample.t_ns - self.last.t_ns) / 1e9)
+        self.last = sample
+        print(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} | "
+              f"Throughput = {throughput:.3f} B/s | "
+              f"PPS = {pps:.1f} | "
+              f"Latency = {latency:.2f} ns")
+
+
 def main(map_path: str,
          csv_file: str = "throughput_latency.csv",
          interval: float = 1.0,
-         duration: float = None):
+         duration: float = None,
+         start_at: int = None,
+         spin_us: float = 0.0,
+         print_every: float = 1.0,
+         hist_map: str = None,
+         hist_kind: str = "log2",
+         hist_bucket_ns: float = 1.0,
+         fmt: str = "csv",
+         maps=None,
+         maps_csv: str = None):
     """
     map_path: đường dẫn pinned map
-    csv_file: file CSV đầu ra
-    interval: khoảng thời gian đo (giây)
+    csv_file: file CSV đầu ra (file .bin nếu fmt="bin")
+    interval: khoảng thời gian đo (giây), hỗ trợ tới 10 ms
     duration: tổng thời gian chạy (giây), None = chạy vô hạn
+    start_at: time.monotonic_ns() của barrier chung, chờ tới đó mới đọc mẫu đầu
+    spin_us: busy-wait bao nhiêu µs cuối mỗi chu kỳ (0 = chỉ sleep)
+    print_every: in ra console + flush CSV mỗi chừng ấy giây (interval nhỏ thì không in từng mẫu)
+    hist_map: pinned map histogram latency (tuỳ chọn), thêm cột p50/p90/p99/p99.9
+    hist_kind, hist_bucket_ns: cách chia bucket của histogram (xem hist_edges)
+    fmt: "csv" tính metric mỗi tick; "bin" chỉ ghi counter thô vào file mmap (ts_binary.py),
+         tính metric khi đổi sang CSV sau cửa sổ đo
+    maps: list MapSpec đọc thêm trong cùng tick, ghi counter thô ra maps_csv
+          (mặc định <csv_file>_maps.csv)
+
+    Vòng lấy mẫu nằm trong Sampler; script chỉ gắn các subscriber ghi file + in console.
     """
-    print(f"Đang đọc map {map_path}, ghi ra {csv_file} mỗi {interval:.1f}s...")
+    print(f"Đang đọc map {map_path}, ghi ra {csv_file} mỗi {interval * 1000:.0f} ms...")
     if duration:
         print(f"Thời gian chạy tối đa: {duration:.1f}s\n")
 
-    start_time = time.time()
-    with open(csv_file, "w", newline="") as f:
-        writer = csv.writer(f)
-        writer.writerow(["timestamp", "throughput_Bps", "pps", "latency_ns"])
-
-        ac_prev = read_accounting(map_path)
-        time_prev = start_time
-
-        while True:
-            time.sleep(interval)
-            ac_now = read_accounting(map_path)
-            time_now = time.time()
+    sampler = Sampler(map_path, interval, duration, start_at, spin_us, hist_map, hist_kind, hist_bucket_ns,
+                      metrics=False, maps=maps)
 
-            throughput, latency, pps = compute_metrics(ac_prev, ac_now, time_now - time_prev)
+    def on_first(sample):
+        if sample.index == 0:
+            print(f"[SYNC] first_read_ns={sample.t_ns}", flush=True)
+            if sampler.reader.percpu:
+                print(f"Map per-CPU: {sampler.reader.ncpu} CPU")
+            if sampler.hist:
+                print(f"Histogram {hist_map}: {sampler.hist.max_entries} bucket {hist_kind}")
+            for name, reader in sampler.map_readers.items():
+                print(f"Map {name}: {reader.map_path} ({reader.struct.__name__}, "
+                      f"{reader.max_entries} entries × {reader.ncpu} CPU)")
 
-            # Định dạng timestamp sang ngày giờ
-            timestamp_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    sinks = [BinSink(sampler, csv_file) if fmt == "bin" else CsvSink(sampler, csv_file, print_every)]
+    if sampler.map_readers:
+        maps_csv = maps_csv or os.path.splitext(csv_file)[0] + "_maps.csv"
+        sinks.append(MapsCsvSink(sampler, maps_csv, print_every))
+    for callback in (on_first, *sinks, ConsolePrinter(print_every)):
+        sampler.subscribe(callback)
+    try:
+        sampler.run()
+    finally:
+        for sink in sinks:
+            sink.close()
 
-            writer.writerow([
-                timestamp_str,
-                round(throughput, 6),  # B/s
-                round(pps, 3),
-                round(latency, 3)      # ns
-            ])
-            f.flush()
-
-            print(f"{timestamp_str} | "
-                  f"Throughput = {throughput:.3f} B/s | "
-                  f"PPS = {pps:.1f} | "
-                  f"Latency = {latency:.2f} ns")
-
-            ac_prev, time_prev = ac_now, time_now
-
-            if duration and (time_now - start_time) >= duration:
-                print(f"\nHoàn thành sau {duration:.1f}s, dữ liệu đã lưu tại {csv_file}")
-                break
+    if sampler.missed:
+        print(f"[SYNC] Missed {sampler.missed} sampling deadlines (interval {interval * 1000:.0f} ms)")
+    elapsed = (time.monotonic_ns() - sampler.t_first) / 1e9 if sampler.t_first else 0.0
+    print(f"\nHoàn thành sau {elapsed:.1f}s ({sampler.samples} mẫu), dữ liệu đã lưu tại {csv_file}")
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print(f"Usage: sudo {sys.argv[0]} /sys/fs/bpf/<iface>/accounting_map [output.csv] [duration_s]")
-        sys.exit(1)
-
-    map_path = sys.argv[1]
-    csv_file = sys.argv[2] if len(sys.argv) > 2 else "throughput_latency.csv"
-    duration = float(sys.argv[3]) if len(sys.argv) > 3 else None
-    main(map_path, csv_file, duration=duration)
+    parser = argparse.ArgumentParser(description="Đọc accounting_map mỗi interval giây, ghi CSV throughput/pps/latency")
+    parser.add_argument("map_path", help="/sys/fs/bpf/<iface>/accounting_map")
+    parser.add_argument("csv_file", nargs="?", default="throughput_latency.csv")
+    parser.add_argument("duration", nargs="?", type=float, default=None, help="Giây, bỏ trống = chạy vô hạn")
+    parser.add_argument("--interval", type=float, default=1.0, help="Giây giữa hai mẫu, vd 0.01 cho 100 Hz")
+    parser.add_argument("--spin-us", type=float, default=0.0,
+                        help="Busy-wait bao nhiêu µs cuối mỗi chu kỳ để giảm jitter (tốn CPU)")
+    parser.add_argument("--print-every", type=float, default=1.0, help="Giây giữa hai lần in ra console")
+    parser.add_argument("--start-at", type=int, default=None,
+                        help="time.monotonic_ns() của barrier chung (do collector_runtime truyền vào)")
+    parser.add_argument("--hist-map", default=None,
+                        help="Pinned map histogram latency mỗi gói (tuỳ chọn) -> cột p50/p90/p99/p99.9")
+    parser.add_argument("--hist-kind", choices=["log2", "linear"], default="log2")
+    parser.add_argument("--hist-bucket-ns", type=float, default=1.0,
+                        help="log2: đơn vị của bucket; linear: độ rộng mỗi bucket (ns)")
+    parser.add_argument("--format", choices=["csv", "bin"], default="csv",
+                        help="bin: record nhị phân thô qua mmap (xem ts_binary.py), nhẹ CPU hơn khi interval nhỏ")
+    parser.add_argument("--maps", default=None, metavar="FILE",
+                        help="YAML/JSON {layouts, maps} (như collectors.sampler trong config): đọc thêm các map "
+                             "trong cùng tick, ghi ra --maps-csv")
+    parser.add_argument("--maps-csv", default=None, help="Mặc định: <csv_file>_maps.csv")
+    parser.add_argument("--iface", default=None, help="Thay cho {iface} trong path của --maps")
+    parser.add_argument("--bench", type=int, default=None, metavar="N",
+                        help="Chỉ đo chi phí N lần đọc map (µs/mẫu) rồi thoát")
+    args = parser.parse_args()
+    if args.bench:
+        result = bench_reads(args.map_path, args.bench)
+        print(f"Map {args.map_path}: backend {result['backend']}, {result['max_entries']} entries × "
+              f"{result['ncpu']} CPU, {result['samples']} samples")
+        for mode in ("reopen", "persistent", "persistent_out", "batch", "per_key"):
+            if mode in result:
+                cost = "n/a" if result[mode] is None else f"{result[mode]:8.2f} us/sample"
+                print(f"  {mode:<15} {cost}")
+        raise SystemExit(0)
+    specs = None
+    if args.maps:
+        import yaml
+        with open(args.maps) as f:
+            specs = map_specs(yaml.safe_load(f), args.iface, os.path.dirname(args.map_path))
+    main(args.map_path, args.csv_file, interval=args.interval, duration=args.duration, start_at=args.start_at,
+         spin_us=args.spin_us, print_every=args.print_every, hist_map=args.hist_map, hist_kind=args.hist_kind,
+         hist_bucket_ns=args.hist_bucket_ns, fmt=args.format, maps=specs, maps_csv=args.maps_csv)
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Chạy một sweep trên nhiều DUT song song (thay cho chạy test.sh lần lượt trên từng máy).
+
+Danh sách DUT khai báo trong file YAML (xem fleet.yml). Mỗi DUT chạy autorun_all.py
+với config của nó qua `--cells-file`, cục bộ (local) hoặc qua ssh. Ma trận cell được chia
+thành batch (mặc định: mọi run của một (model, pps) để sequential stopping vẫn chạy trên cùng
+một DUT) rồi phân vòng tròn vào hàng đợi riêng của từng DUT. DUT nào hết việc thì lấy bớt
+batch cuối của hàng đợi dài nhất. Kết quả mỗi DUT nằm trong <out>/<dut>/, và index chung
+nằm ở <out>/index_<branch>_<param>.csv.
+
+Các DUT dùng chung một máy phát traffic (cùng host:port của api_url_run, app.py chỉ giữ một
+tcpreplay tại một thời điểm) không được phát cùng lúc: mỗi máy phát có một lock, DUT giữ lock
+suốt batch của nó.
+
+    python3 fleet.py --fleet ../fleet.yml --branch quickscore --param 1 --num-runs 3
+"""
+import argparse
+import csv
+import json
+import os
+import shlex
+import subprocess
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from urllib.parse import urlparse
+
+import yaml
+
+from logger import init_logger, log
+from sweep_plan import load_sweep_plan, expand_cells, write_cells, cell_tag
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- Giá trị mặc định cho mỗi DUT trong fleet.yml ---
+DEFAULT_DUT = {
+    "transport": "local",           # local | ssh
+    "host": None,                   # ssh: user@host
+    "workdir": None,                # ssh: thư mục src/ của autorun_estimate trên DUT
+    "python": ["sudo", "python3"],
+    "results_dir": None,            # ssh: thư mục kết quả trên DUT (tương đối với workdir)
+    "args": [],                     # tham số thêm cho autorun_all.py trên DUT này
+    "traffic_generator": None,      # tên máy phát; mặc định host:port của api_url_run trong config DUT
+}
+RESULT_KINDS = ("throughput", "power", "bpf", "manifest")
+
+
+class Dut:
+    def __init__(self, spec, fleet_dir, out_dir, defaults):
+        spec = {**DEFAULT_DUT, **defaults, **spec}
+        self.name = spec["name"]
+        self.transport = spec["transport"]
+        self.host = spec["host"]
+        self.python = spec["python"].split() if isinstance(spec["python"], str) else list(spec["python"])
+        self.extra_args = list(spec["args"])
+        self.local_dir = os.path.join(out_dir, self.name)
+        os.makedirs(self.local_dir, exist_ok=True)
+        if self.transport == "local":
+            self.workdir = SRC_DIR
+            self.config = os.path.abspath(os.path.join(fleet_dir, spec["config"]))
+            self.results_dir = self.local_dir
+        elif self.transport == "ssh":
+            if not self.host or not spec["workdir"]:
+                raise ValueError(f"DUT {self.name}: ssh transport needs `host` and `workdir`")
+            self.workdir = spec["workdir"]
+            self.config = spec["config"]
+            self.results_dir = spec["results_dir"] or f"fleet_results/{self.name}"
+        else:
+            raise ValueError(f"DUT {self.name}: unknown transport {self.transport!r}")
+        self.generator = spec["traffic_generator"]
+        self.cfg = {}
+        self.queue = deque()
+        self.failures = 0
+        self.busy_s = 0.0
+        self.cells_run = 0
+
+    # --- Thực thi ---
+    def _ssh(self, remote_cmd, **kw):
+        return subprocess.run(["ssh", self.host, remote_cmd], **kw)
+
+    def run_batch(self, batch_id, cells, common_args, log_file):
+        cells_name = f"cells_{batch_id}.jsonl"
+        args = ["--config", self.config, "--cells-file", None, "--results-dir", self.results_dir,
+                *common_args, *self.extra_args]
+        if self.transport == "local":
+            cells_path = os.path.join(self.local_dir, cells_name)
+            write_cells(cells_path, cells)
+            args[3] = cells_path
+            cmd = [*self.python, os.path.join(SRC_DIR, "autorun_all.py"), *args]
+            log('DEBUG', f"[{self.name}] {' '.join(cmd)}")
+            return subprocess.run(cmd, cwd=self.workdir, stdout=log_file, stderr=subprocess.STDOUT).returncode
+
+        cells_path = f"{self.results_dir}/{cells_name}"
+        payload = "".join(json.dumps(c) + "\n" for c in cells)
+        self._ssh(f"cd {shlex.quote(self.workdir)} && mkdir -p {shlex.quote(self.results_dir)} "
+                  f"&& cat > {shlex.quote(cells_path)}", input=payload, text=True, check=True)
+        args[3] = cells_path
+        remote = f"cd {shlex.quote(self.workdir)} && {shlex.join([*self.python, 'autorun_all.py', *args])}"
+        log('DEBUG', f"[{self.name}] ssh {self.host} {remote}")
+        ret = self._ssh(remote, stdout=log_file, stderr=subprocess.STDOUT).returncode
+        self.pull()
+        return ret
+
+    def load_config(self):
+        """Đọc config của DUT (ssh: cat trên DUT); {} nếu không đọc được."""
+        try:
+            if self.transport == "local":
+                with open(self.config) as f:
+                    text = f.read()
+            else:
+                text = self._ssh(f"cd {shlex.quote(self.workdir)} && cat {shlex.quote(self.config)}",
+                                 capture_output=True, text=True, check=True, timeout=30).stdout
+            self.cfg = yaml.safe_load(text) or {}
+        except (OSError, subprocess.SubprocessError, yaml.YAMLError) as e:
+            log('WARN', f"[FLEET] {self.name}: cannot read config {self.config}: {e}")
+            self.cfg = {}
+        if self.generator is None and self.cfg.get("api_url_run"):
+            self.generator = urlparse(self.cfg["api_url_run"]).netloc
+        return self.cfg
+
+    def pull(self):
+        """ssh: kéo kết quả về <out>/<dut>/ (rsync chỉ copy phần mới)."""
+        if self.transport != "ssh":
+            return
+        src = f"{self.host}:{self.workdir.rstrip('/')}/{self.results_dir.rstrip('/')}/"
+        subprocess.run(["rsync", "-az", src, self.local_dir + "/"], check=False)
+
+    def archive(self):
+        """--fresh: cất kết quả cũ sang <dir>.<timestamp> để journal không bỏ qua cell."""
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        if os.path.isdir(self.local_dir) and os.listdir(self.local_dir):
+            os.rename(self.local_dir, f"{self.local_dir}.{stamp}")
+        os.makedirs(self.local_dir, exist_ok=True)
+        if self.transport == "ssh":
+            d = shlex.quote(self.results_dir)
+            self._ssh(f"cd {shlex.quote(self.workdir)} && if [ -d {d} ]; then mv {d} {d}.{stamp}; fi", check=False)
+
+    def done_entries(self, branch, param):
+        path = os.path.join(self.local_dir, f"sweep_journal_{branch}_{param}.jsonl")
+        entries = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("status") == "done":
+                        entries[entry["tag"]] = entry
+        return entries
+
+    def result_dirs(self):
+        """Tên thư mục con theo mục `results:` của config DUT (nếu đọc được lúc khởi động)."""
+        names = {k: f"results_{k}" for k in RESULT_KINDS}
+        names.update({k: v for k, v in (self.cfg.get("results") or {}).items() if k in RESULT_KINDS})
+        return names
+
+
+# --- Chia việc ---
+def make_batches(cells, batch_by):
+    """Gom cell theo (model, pps) hoặc theo model, giữ thứ tự của plan."""
+    groups = OrderedDict()
+    for cell in cells:
+        key = (cell["m"], cell["sz"]) if batch_by == "model" else (cell["m"], cell["sz"], cell["pps"])
+        groups.setdefault(key, []).append(cell)
+    return [{"id": i, "cells": group, "attempts": 0, "failed_on": frozenset()}
+            for i, group in enumerate(groups.values())]
+
+
+class Scheduler:
+    """
+    Hàng đợi riêng cho mỗi DUT + work stealing + hàng đợi batch bị trả lại.
+    Batch bị trả lại không giao lại cho DUT vừa làm hỏng nó, trừ khi không còn DUT nào khác chạy.
+    """
+
+    def __init__(self, duts, batches, max_attempts):
+        self.duts = duts
+        self.lock = threading.Lock()
+        self.orphans = deque()
+        self.max_attempts = max_attempts
+        self.active = {d.name for d in duts}
+        # Một lock cho mỗi máy phát traffic dùng chung
+        self.generators = defaultdict(threading.Lock)
+        for i, batch in enumerate(batches):
+            duts[i % len(duts)].queue.append(batch)
+
+    def generator_lock(self, dut):
+        with self.lock:
+            return self.generators[dut.generator or f"dut:{dut.name}"]
+
+    def _take_orphan(self, dut):
+        others = self.active - {dut.name}
+        for batch in self.orphans:
+            if dut.name not in batch["failed_on"] or not others:
+                self.orphans.remove(batch)
+                return batch
+        return None
+
+    def take(self, dut):
+        with self.lock:
+            batch = self._take_orphan(dut)
+            if batch is not None:
+                return batch
+            if dut.queue:
+                return dut.queue.popleft()
+            victim = max(self.duts, key=lambda d: len(d.queue))
+            if victim.queue:
+                batch = victim.queue.pop()
+                log('INFO', f"[FLEET] {dut.name} steals batch {batch['id']} from {victim.name}")
+                return batch
+            return None
+
+    def give_back(self, batch, cells, dut):
+        with self.lock:
+            batch["attempts"] += 1
+            if batch["attempts"] >= self.max_attempts:
+                log('ERROR', f"[FLEET] Dropping batch {batch['id']} after {batch['attempts']} attempts: "
+                             f"{[cell_tag(c) for c in cells]}")
+                return
+            self.orphans.append({**batch, "cells": cells, "failed_on": batch["failed_on"] | {dut.name}})
+
+    def retire(self, dut):
+        with self.lock:
+            self.orphans.extend(dut.queue)
+            dut.queue.clear()
+            self.active.discard(dut.name)
+
+    def leave(self, dut):
+        with self.lock:
+            self.active.discard(dut.name)
+
+
+def worker(dut, sched, fargs, common_args):
+    log_path = os.path.join(dut.local_dir, "fleet_run.log")
+    with open(log_path, "a", buffering=1) as log_file:
+        while True:
+            batch = sched.take(dut)
+            if batch is None:
+                sched.leave(dut)
+                return
+            cells = batch["cells"]
+            log('INFO', f"[FLEET] {dut.name}: batch {batch['id']} ({len(cells)} cells, "
+                        f"{cell_tag(cells[0])}...)")
+            with sched.generator_lock(dut):
+                t0 = time.monotonic()
+                try:
+                    ret = dut.run_batch(batch["id"], cells, common_args, log_file)
+                except (OSError, subprocess.CalledProcessError) as e:
+                    log('ERROR', f"[FLEET] {dut.name}: cannot run batch {batch['id']}: {e}")
+                    ret = -1
+                dut.busy_s += time.monotonic() - t0
+
+            done = dut.done_entries(fargs.branch, fargs.param)
+            dut.cells_run += sum(1 for c in cells if cell_tag(c) in done)
+            if ret == 0:
+                # Cell không có trong journal khi ret == 0 là cell bị sequential stopping bỏ qua
+                continue
+            missing = [c for c in cells if cell_tag(c) not in done]
+            dut.failures += 1
+            log('WARN', f"[FLEET] {dut.name}: batch {batch['id']} exited with {ret}, "
+                        f"{len(missing)} cells to reschedule (see {log_path})")
+            if missing:
+                sched.give_back(batch, missing, dut)
+            if dut.failures >= fargs.max_failures:
+                log('ERROR', f"[FLEET] {dut.name}: {dut.failures} failed batches, removing DUT from fleet")
+                sched.retire(dut)
+                return
+
+
+# --- Index chung ---
+def write_index(out_dir, duts, branch, param):
+    rows = []
+    for dut in duts:
+        dirs = dut.result_dirs()
+        for tag, entry in sorted(dut.done_entries(branch, param).items()):
+            row = {"tag": tag, "dut": dut.name}
+            row.update({k: entry.get(k) for k in ("branch", "param", "pps", "run_idx", "m", "sz", "finished_at")})
+            row["throughput_csv"] = os.path.join(dut.name, dirs["throughput"], f"{tag}.csv")
+            row["power_csv"] = os.path.join(dut.name, dirs["power"], f"{tag}.csv")
+            row["bpf_log"] = os.path.join(dut.name, dirs["bpf"], f"log_{tag}.txt")
+            row["manifest"] = os.path.join(dut.name, dirs["manifest"], f"manifest_{tag}.json")
+            rows.append(row)
+
+    index_csv = os.path.join(out_dir, f"index_{branch}_{param}.csv")
+    fields = ["tag", "dut", "branch", "param", "pps", "run_idx", "m", "sz", "finished_at",
+              "throughput_csv", "power_csv", "bpf_log", "manifest"]
+    with open(index_csv, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    return index_csv, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chạy sweep song song trên nhiều DUT")
+    parser.add_argument("--fleet", required=True, help="File YAML danh sách DUT (xem fleet.yml)")
+    parser.add_argument("--branch", required=True)
+    parser.add_argument("--param", required=True)
+    parser.add_argument("--num-runs", type=int, default=None)
+    parser.add_argument("--max-time", type=int, default=None)
+    parser.add_argument("--out", default=None, help="Thư mục kết quả chung (mặc định: fleet.out_dir)")
+    parser.add_argument("--batch-by", choices=["pps", "model"], default="pps",
+                        help="pps: mỗi batch là mọi run của một (model, pps); model: mọi cell của một model")
+    parser.add_argument("--only", default=None, help="Chỉ dùng các DUT này (cách nhau bởi dấu phẩy)")
+    parser.add_argument("--max-failures", type=int, default=2, help="Số batch lỗi trước khi loại DUT")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Số lần thử lại một batch")
+    parser.add_argument("--fresh", action="store_true", help="Cất kết quả cũ, chạy lại toàn bộ")
+    parser.add_argument("autorun_args", nargs=argparse.REMAINDER,
+                        help="Tham số thêm cho autorun_all.py (sau --), vd: -- --load-once")
+    fargs = parser.parse_args()
+
+    fleet_path = os.path.abspath(fargs.fleet)
+    fleet_dir = os.path.dirname(fleet_path)
+    with open(fleet_path) as f:
+        fleet = yaml.safe_load(f)
+    out_dir = os.path.abspath(fargs.out or os.path.join(fleet_dir, fleet.get("out_dir", "fleet_results")))
+    os.makedirs(out_dir, exist_ok=True)
+    init_logger(os.path.join(out_dir, "fleet.log"))
+
+    specs = fleet["duts"]
+    if fargs.only:
+        wanted = set(fargs.only.split(","))
+        specs = [s for s in specs if s["name"] in wanted]
+    if not specs:
+        raise SystemExit("No DUT selected")
+    duts = [Dut(spec, fleet_dir, out_dir, fleet.get("defaults") or {}) for spec in specs]
+    if fargs.fresh:
+        for dut in duts:
+            dut.archive()
+
+    # DUT chung máy phát traffic thì chạy lần lượt (lock theo máy phát trong worker)
+    sharing = defaultdict(list)
+    for dut in duts:
+        dut.load_config()
+        if dut.generator is None:
+            log('WARN', f"[FLEET] {dut.name}: no api_url_run in its config and no traffic_generator in "
+                        f"{fargs.fleet}, assuming a traffic generator of its own")
+        sharing[dut.generator or f"dut:{dut.name}"].append(dut.name)
+    for generator, names in sharing.items():
+        if len(names) > 1:
+            log('WARN', f"[FLEET] {', '.join(names)} share traffic generator {generator}, "
+                        f"their batches run one at a time")
+
+    # Ma trận sweep: mục `sweep:` của fleet.yml, không có thì lấy từ config DUT local đầu tiên;
+    # không tìm thấy ở đâu thì báo lỗi thay vì âm thầm chạy giá trị mặc định
+    sweep_cfg = {"sweep": fleet["sweep"]} if fleet.get("sweep") else None
+    if sweep_cfg is None:
+        local = next((d for d in duts if d.transport == "local" and d.cfg), None)
+        if local is None:
+            raise SystemExit(f"{fargs.fleet}: no `sweep:` section and no local DUT config to take it from")
+        sweep_cfg = local.cfg
+        if not sweep_cfg.get("sweep"):
+            raise SystemExit(f"{fargs.fleet}: no `sweep:` section, and DUT {local.name} config "
+                             f"{local.config} has none either")
+        log('INFO', f"[FLEET] Sweep matrix from {local.config}")
+    plan = load_sweep_plan(sweep_cfg, fargs.branch, fargs.num_runs)
+    cells = expand_cells(plan, fargs.branch, fargs.param)
+
+    done = set()
+    for dut in duts:
+        done.update(dut.done_entries(fargs.branch, fargs.param))
+    pending = [c for c in cells if cell_tag(c) not in done]
+    batches = make_batches(pending, fargs.batch_by)
+    log('HEADER', f"=== FLEET {fargs.branch}/{fargs.param}: {len(cells)} cells, {len(cells) - len(pending)} done, "
+                  f"{len(batches)} batches on {len(duts)} DUTs ===")
+
+    common_args = ["--branch", fargs.branch, "--param", str(fargs.param), "--num-runs", str(plan["num_runs"])]
+    if fargs.max_time is not None:
+        common_args += ["--max-time", str(fargs.max_time)]
+    common_args += [a for a in fargs.autorun_args if a != "--"]
+
+    sched = Scheduler(duts, batches, fargs.max_attempts)
+    t0 = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(d, sched, fargs, common_args), name=d.name) for d in duts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.monotonic() - t0
+
+    index_csv, rows = write_index(out_dir, duts, fargs.branch, fargs.param)
+    for dut in duts:
+        util = dut.busy_s / wall if wall > 0 else 0.0
+        log('INFO', f"[FLEET] {dut.name}: {dut.cells_run} cells, busy {dut.busy_s:.0f}s ({util:.0%}), "
+                    f"{dut.failures} failed batches")
+    left = len(cells) - len(rows)
+    log('HEADER', f"=== FLEET done in {wall:.0f}s: {len(rows)}/{len(cells)} cells indexed in {index_csv} ===")
+    if left:
+        log('WARN', f"[FLEET] {left} cells not completed (failed or skipped by sequential stopping)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Công cụ hệ thống mà orchestrator gọi (sudo, xdp-loader, bpftool, make, bpffs...).
+
+Mặc định là công cụ thật trên DUT; sim_backend.py sinh config trỏ mục `tools:`
+sang executable giả để chạy cả sweep không cần root/DUT/LANforge.
+"""
+
+# --- Giá trị mặc định cho mục `tools:` trong config ---
+DEFAULT_TOOLS = {
+    "sudo": ["sudo"],                # [] khi không cần root (sim)
+    "xdp_loader_cli": "xdp-loader",  # dùng cho `unload <iface> --all`
+    "bpftool": "bpftool",
+    "make": "make",
+    "bpffs": "/sys/fs/bpf",
+    "accounting_backend": "bpf",     # "file": accounting_map giả do sim_backend.py ghi
+    "kill_strays": True,             # pkill bpftool/perf/server.py còn sót lúc khởi động
+    "unload_settle": 2.0,            # giây chờ sau khi unload XDP
+    "cell_gap": 3.0,                 # giây nghỉ giữa hai cell
+    "cmd_timeout": None,             # giây tối đa cho convert/make, None = không giới hạn
+}
+
+
+def load_tools_config(cfg):
+    """Gộp mục `tools:` của config với giá trị mặc định."""
+    tcfg = {**DEFAULT_TOOLS, **(cfg.get("tools") or {})}
+    if isinstance(tcfg["sudo"], str):
+        tcfg["sudo"] = tcfg["sudo"].split()
+    return tcfg
+
+
+def privileged(tcfg, *cmd):
+    """Lệnh cần root: thêm tiền tố sudo theo config."""
+    return list(tcfg["sudo"]) + [str(c) for c in cmd]
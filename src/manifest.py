@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Manifest JSON cho từng cell: tham số sweep, provenance (hash config, hash XDP object,
+commit của cây xdp-program, kernel), thời điểm bắt đầu/kết thúc, collector và artifact.
+
+Tổng hợp về sau đọc manifest thay vì regex tên file `{branch}_{param}_{pps}_{run_idx}_{m}_{sz}`:
+
+    python3 manifest.py all_results/results_manifest --csv index.csv
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from artifact_cache import hash_file
+
+SCHEMA_VERSION = 1
+
+
+def git_info(path):
+    """Commit + trạng thái dirty của repo chứa path; None nếu không phải git repo."""
+    try:
+        commit = subprocess.check_output(["git", "-C", path, "rev-parse", "HEAD"],
+                                         text=True, stderr=subprocess.DEVNULL).strip()
+        status = subprocess.check_output(["git", "-C", path, "status", "--porcelain", "--untracked-files=no"],
+                                         text=True, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return {"commit": commit, "dirty": bool(status.strip())}
+
+
+def host_info():
+    uname = platform.uname()
+    return {
+        "hostname": socket.gethostname(),
+        "kernel": uname.release,
+        "kernel_version": uname.version,
+        "machine": uname.machine,
+        "python": sys.version.split()[0],
+    }
+
+
+def file_info(path):
+    """Đường dẫn tuyệt đối + sha256 (None nếu file chưa có)."""
+    path = os.path.abspath(path)
+    return {"path": path, "sha256": hash_file(path) if os.path.exists(path) else None}
+
+
+def sweep_provenance(config_path, xdp_tree, argv=None):
+    """Phần provenance không đổi trong cả sweep, tính một lần lúc khởi động."""
+    return {
+        "config": file_info(config_path),
+        "xdp_git": git_info(xdp_tree),
+        "host": host_info(),
+        "argv": list(argv if argv is not None else sys.argv),
+    }
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts).isoformat(timespec="milliseconds")
+
+
+class CellManifest:
+    """Gom thông tin của một cell trong lúc chạy rồi ghi ra manifest_{tag}.json."""
+
+    def __init__(self, manifest_dir, tag, cell, sweep, provenance):
+        self.path = os.path.join(os.path.abspath(manifest_dir), f"manifest_{tag}.json")
+        self.record = {
+            "schema": SCHEMA_VERSION,
+            "tag": tag,
+            "cell": dict(cell),
+            "sweep": dict(sweep),
+            "provenance": dict(provenance),
+            "start_wall": time.time(),
+            "collectors": {},
+            "artifacts": {},
+        }
+
+    def set_xdp_obj(self, path):
+        # Hash sau khi build/load: object có thể đổi theo model
+        self.record["provenance"]["xdp_obj"] = file_info(path)
+
+    def add_artifacts(self, **paths):
+        self.record["artifacts"].update({k: os.path.abspath(v) for k, v in paths.items() if v})
+
+    def add_collectors(self, results):
+        """results: giá trị trả về của run_collectors()."""
+        for name, res in (results or {}).items():
+            self.record["collectors"][name] = {
+                "summary": res["summary"],
+                "timing": res["timing"],
+                "artifacts": [os.path.abspath(p) for p in res["artifacts"]],
+            }
+
+    def update(self, **fields):
+        self.record.update(fields)
+
+    def write(self, status):
+        end = time.time()
+        self.record.update({
+            "status": status,
+            "end_wall": end,
+            "start": _iso(self.record["start_wall"]),
+            "end": _iso(end),
+            "elapsed_s": round(end - self.record["start_wall"], 3),
+        })
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.record, f, indent=2, default=str)
+        os.replace(tmp, self.path)
+        return self.path
+
+
+# --- Đọc lại ---
+def load_manifests(paths):
+    """Đọc manifest từ các file/thư mục (thư mục: mọi manifest_*.json bên trong)."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "**", "manifest_*.json"), recursive=True)))
+        else:
+            files.append(path)
+    records = []
+    for path in files:
+        with open(path) as f:
+            rec = json.load(f)
+        rec["_path"] = os.path.abspath(path)
+        records.append(rec)
+    return records
+
+
+INDEX_FIELDS = ["tag", "status", "branch", "param", "pps", "run_idx", "m", "sz", "start", "end",
+                "elapsed_s", "hostname", "kernel", "xdp_commit", "xdp_dirty", "config_sha256",
+                "xdp_obj_sha256", "collectors", "manifest"]
+
+
+def index_row(rec):
+    prov = rec.get("provenance") or {}
+    git = prov.get("xdp_git") or {}
+    row = {k: rec.get(k) for k in ("tag", "status", "start", "end", "elapsed_s")}
+    row.update({k: rec["cell"].get(k) for k in ("branch", "param", "pps", "run_idx", "m", "sz")})
+    row.update({
+        "hostname": (prov.get("host") or {}).get("hostname"),
+        "kernel": (prov.get("host") or {}).get("kernel"),
+        "xdp_commit": git.get("commit"),
+        "xdp_dirty": git.get("dirty"),
+        "config_sha256": (prov.get("config") or {}).get("sha256"),
+        "xdp_obj_sha256": (prov.get("xdp_obj") or {}).get("sha256"),
+        "collectors": " ".join(sorted(rec.get("collectors") or {})),
+        "manifest": rec["_path"],
+    })
+    return row
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gộp manifest của các cell thành bảng index")
+    parser.add_argument("paths", nargs="+", help="File manifest_*.json hoặc thư mục chứa chúng")
+    parser.add_argument("--csv", default=None, help="Ghi index ra CSV (mặc định: in ra stdout)")
+    args = parser.parse_args()
+
+    rows = [index_row(rec) for rec in load_manifests(args.paths)]
+    out = open(args.csv, "w", newline="") if args.csv else sys.stdout
+    writer = csv.DictWriter(out, fieldnames=INDEX_FIELDS)
+    writer.writeheader()
+    writer.writerows(rows)
+    if args.csv:
+        out.close()
+        print(f"{len(rows)} manifests -> {args.csv}")
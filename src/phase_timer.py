@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Timeline theo phase cho từng cell của sweep (convert, make, load, warm-up, đo, unload,
+xoá pin, nghỉ giữa cell...).
+
+Orchestrator bọc từng bước bằng `with timeline.phase("build"):`; mỗi cell được ghi
+thành một dòng JSONL với start_wall (epoch) và thời điểm monotonic bắt đầu/kết thúc
+của mọi phase.
+Chạy file này để tóm tắt một hay nhiều timeline:
+
+    python3 phase_timer.py all_results/phase_timeline_quickscore_200.jsonl --top 5
+"""
+import argparse
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Phase được tính là thời gian đo thật (duty cycle)
+MEASURE_PHASES = ("measure",)
+
+
+class PhaseTimeline:
+    """Ghi các phase của cell hiện tại; phase ngoài cell được gom vào cell giả "_global"."""
+
+    def __init__(self, path):
+        # orchestrator có os.chdir() giữa chừng -> giữ đường dẫn tuyệt đối
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.cell = None
+
+    def begin_cell(self, tag, **meta):
+        if self.cell is not None:
+            self.end_cell("aborted")
+        self.cell = {"tag": tag, **meta, "start_wall": time.time(),
+                     "start": time.monotonic(), "phases": []}
+
+    def end_cell(self, status="done"):
+        if self.cell is None:
+            return
+        self.cell["end"] = time.monotonic()
+        self.cell["status"] = status
+        self._append(self.cell)
+        self.cell = None
+
+    @contextmanager
+    def phase(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            rec = {"name": name, "start": start, "end": time.monotonic()}
+            if self.cell is not None:
+                self.cell["phases"].append(rec)
+            else:
+                self._append({"tag": "_global", "start_wall": time.time() - (rec["end"] - start),
+                              "start": start, "end": rec["end"], "phases": [rec], "status": "done"})
+
+    def _append(self, rec):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(rec) + "\n")
+
+
+# --- Tóm tắt ---
+def load_timeline(paths):
+    records = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # dòng cuối có thể dở dang nếu sweep bị kill
+                    continue
+                rec["_source"] = path
+                records.append(rec)
+    return records
+
+
+def _merged_length(spans):
+    """Tổng độ dài của các khoảng sau khi gộp chỗ chồng nhau."""
+    total = 0.0
+    cur_start, cur_end = None, None
+    for start, end in sorted(spans):
+        if cur_end is None or start > cur_end:
+            if cur_end is not None:
+                total += cur_end - cur_start
+            cur_start, cur_end = start, end
+        else:
+            cur_end = max(cur_end, end)
+    if cur_end is not None:
+        total += cur_end - cur_start
+    return total
+
+
+def summarize(records):
+    """
+    Tổng thời gian theo phase, wall time, duty cycle đo và phần thời gian không được ghi nhận.
+
+    Khoảng của mỗi record đặt trên trục start_wall (epoch) + độ dài monotonic của nó: monotonic
+    của các DUT khác nhau, hay trước/sau khi reboot, không cùng gốc. wall_s = hợp các khoảng
+    trên mọi timeline; device_s = tổng hợp-khoảng của từng timeline (file), dùng làm mẫu số
+    cho duty cycle và untracked khi nhiều DUT chạy song song.
+    """
+    per_phase = defaultdict(float)
+    counts = defaultdict(int)
+    cells = 0
+    spans = defaultdict(list)
+    for rec in records:
+        if rec["tag"] != "_global":
+            cells += 1
+        # Record cũ không có start_wall: đành dùng monotonic
+        start = rec.get("start_wall", rec["start"])
+        spans[rec.get("_source")].append((start, start + rec["end"] - rec["start"]))
+        for ph in rec["phases"]:
+            per_phase[ph["name"]] += ph["end"] - ph["start"]
+            counts[ph["name"]] += 1
+
+    wall = _merged_length([span for source in spans.values() for span in source])
+    device = sum(_merged_length(source) for source in spans.values())
+    tracked = sum(per_phase.values())
+    measured = sum(per_phase[p] for p in MEASURE_PHASES)
+    return {
+        "cells": cells,
+        "timelines": len(spans),
+        "wall_s": wall,
+        "device_s": device,
+        "measure_s": measured,
+        "duty_cycle": measured / device if device > 0 else 0.0,
+        "untracked_s": max(0.0, device - tracked),
+        "phases": {name: {"total_s": per_phase[name], "count": counts[name]} for name in per_phase},
+    }
+
+
+def print_summary(summary, top):
+    wall = summary["wall_s"]
+    print(f"Cells: {summary['cells']}, wall time {wall / 3600:.2f} h ({wall:.0f}s)")
+    if summary["timelines"] > 1:
+        print(f"Timelines: {summary['timelines']}, {summary['device_s'] / 3600:.2f} h of DUT time")
+    # Tỉ lệ từng phase tính trên tổng thời gian DUT (= wall time khi chỉ có một timeline)
+    wall = summary["device_s"]
+    print(f"Measurement duty cycle: {summary['duty_cycle']:.1%} ({summary['measure_s']:.0f}s measuring)")
+    sinks = sorted(summary["phases"].items(), key=lambda kv: kv[1]["total_s"], reverse=True)
+    sinks.append(("(untracked)", {"total_s": summary["untracked_s"], "count": 0}))
+    sinks.sort(key=lambda kv: kv[1]["total_s"], reverse=True)
+    print(f"\nTop {top} time sinks:")
+    print(f"{'phase':<16}{'total_s':>12}{'share':>9}{'count':>8}{'avg_s':>10}")
+    for name, st in sinks[:top]:
+        share = st["total_s"] / wall if wall > 0 else 0.0
+        avg = st["total_s"] / st["count"] if st["count"] else 0.0
+        print(f"{name:<16}{st['total_s']:>12.1f}{share:>9.1%}{st['count']:>8}{avg:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tóm tắt phase timeline của sweep")
+    parser.add_argument("timelines", nargs="+", help="File phase_timeline_*.jsonl")
+    parser.add_argument("--top", type=int, default=8, help="Số phase tốn thời gian nhất cần in")
+    parser.add_argument("--json", default=None, help="Ghi thêm tóm tắt ra file JSON")
+    args = parser.parse_args()
+
+    summary = summarize(load_timeline(args.timelines))
+    print_summary(summary, args.top)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
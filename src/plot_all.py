@@ -88,6 +88,34 @@ def read_csv_metrics_throughput(filename):
 
     return throughputs, pps_list, latencies
 
+# Cột percentile do estimate_throughput_latency.py ghi khi có histogram latency trong kernel
+PERCENTILE_COLS = [("p50_ns", "p50"), ("p90_ns", "p90"), ("p99_ns", "p99"), ("p999_ns", "p99.9")]
+
+def read_csv_percentiles(filename):
+    """
+    Đọc p50/p90/p99/p99.9 (ns) mỗi interval, bỏ 15 dòng sau header như trên.
+    Trả về {} nếu CSV không có cột percentile.
+    """
+    pct = {col: [] for col, _ in PERCENTILE_COLS}
+
+    with open(filename, newline='') as f:
+        reader = csv.DictReader(f)
+        if PERCENTILE_COLS[0][0] not in (reader.fieldnames or []):
+            return {}
+
+        for _ in range(15):
+            next(reader, None)
+
+        for row in reader:
+            vals = [safe_float(row.get(col)) for col, _ in PERCENTILE_COLS]
+            # interval không có gói -> percentile 0, bỏ qua
+            if None in vals or not vals[0]:
+                continue
+            for (col, _), v in zip(PERCENTILE_COLS, vals):
+                pct[col].append(v)
+
+    return pct if pct[PERCENTILE_COLS[0][0]] else {}
+
 def aggregate_throughput(csv_dir):
     """
     Đọc tất cả file → summary_rows cho throughput/pps/latency.
@@ -103,6 +131,7 @@ def aggregate_throughput(csv_dir):
 
         branch, param, pps, solan, max_tree, max_leaves = m.groups()
         thr_list, pps_list_full, lat_list = read_csv_metrics_throughput(path)
+        pct = read_csv_percentiles(path)
 
         if not thr_list:
             continue
@@ -126,6 +155,11 @@ def aggregate_throughput(csv_dir):
             "throughput_std": statistics.stdev(thr_list) if len(thr_list) > 1 else 0,
             "pps_std": statistics.stdev(pps_list_full) if len(pps_list_full) > 1 else 0,
             "latency_std": statistics.stdev(lat_list) if len(lat_list) > 1 else 0,
+
+            # Trung bình percentile của các interval
+            "pct_avg": {col: statistics.mean(v) for col, v in pct.items()},
+            "pct_std": {col: statistics.stdev(v) if len(v) > 1 else 0 for col, v in pct.items()},
+            "pct_n": len(next(iter(pct.values()), [])),
         })
 
     return summary_rows
@@ -253,6 +287,69 @@ def plot_throughput(summary_rows, keys, out_thr, out_pps, out_lat):
 
     print(f"[DONE] Saved throughput plots → {out_thr}, {out_pps}, {out_lat}")
     
+def plot_percentile(summary_rows, keys, out_pct):
+    """
+    Latency percentile theo TX pps: mỗi percentile một ô, mỗi key một đường.
+    Chỉ dùng các file có cột p50_ns..p999_ns (sampler chạy với --hist-map).
+    """
+    fig, axes = plt.subplots(2, 2, figsize=(14, 9), sharex=True)
+    plotted = False
+
+    for key_dict in keys:
+        filtered = [r for r in summary_rows if
+                    r["branch"] == key_dict["branch"] and
+                    r["param"] == key_dict["param"] and
+                    r["max_tree"] == key_dict["max_tree"] and
+                    r["max_leaves"] == key_dict["max_leaves"] and
+                    r["pct_avg"]]
+
+        if not filtered:
+            print(f"[PERCENTILE] Missing key (or no histogram columns) {key_dict}")
+            continue
+
+        # gộp các lần chạy cùng pps
+        by_pps = defaultdict(list)
+        for r in filtered:
+            by_pps[r["pps"]].append(r)
+        pps_vals = sorted(by_pps)
+
+        label = pretty_label(key_dict["branch"], key_dict["param"],
+                             key_dict["max_tree"], key_dict["max_leaves"])
+        marker = BRANCH_MARKERS.get(key_dict["branch"], '.')
+
+        for ax, (col, name) in zip(axes.flat, PERCENTILE_COLS):
+            means = [statistics.mean(r["pct_avg"][col] for r in by_pps[p]) for p in pps_vals]
+            ci = []
+            for p in pps_vals:
+                rs = by_pps[p]
+                std = statistics.mean(r["pct_std"][col] for r in rs)
+                n = sum(r["pct_n"] for r in rs)
+                ci.append(1.96 * std / math.sqrt(n) if n > 1 else 0)
+
+            ax.plot(pps_vals, means, marker=marker, linestyle="--", label=label)
+            ax.fill_between(pps_vals, [m - c for m, c in zip(means, ci)],
+                            [m + c for m, c in zip(means, ci)], alpha=0.2)
+            plotted = True
+
+    if not plotted:
+        plt.close(fig)
+        print("[PERCENTILE] Nothing to plot")
+        return
+
+    for ax, (_, name) in zip(axes.flat, PERCENTILE_COLS):
+        ax.set_title(f"{name} latency")
+        ax.set_ylabel("Latency (ns)")
+        ax.set_yscale("log")
+        ax.grid(True, which="both")
+    for ax in axes[-1]:
+        ax.set_xlabel("TX pps")
+    axes.flat[0].legend()
+    plt.tight_layout()
+    plt.savefig(out_pct, dpi=300)
+    plt.close()
+
+    print(f"[DONE] Saved percentile plot → {out_pct}")
+
 # ================================================================
 #                  PIPELINE 2 — POWER / ENERGY
 # ================================================================
@@ -483,7 +580,7 @@ def plot_power_box(summary_rows, keys, pps_target, out_power="power_box.png"):
 # ================================================================
 def main():
     p = argparse.ArgumentParser()
-    p.add_argument("--mode", choices=["throughput", "power"], required=True)
+    p.add_argument("--mode", choices=["throughput", "percentile", "power"], required=True)
     p.add_argument("--csv-dir", required=True)
     p.add_argument("--keys", nargs="+", help="branch:param:max_tree:max_leaves")
     p.add_argument("--plot-type", choices=["line", "box"], default="line",
@@ -494,6 +591,7 @@ def main():
     p.add_argument("--out-thr", default="../img/thr.png")
     p.add_argument("--out-pps", default="../img/pps.png")
     p.add_argument("--out-lat", default="../img/latency.png")
+    p.add_argument("--out-pct", default="../img/latency_percentile.png")
     p.add_argument("--out-power", default="../img/power.png")
     p.add_argument("--out-energy", default="../img/energy.png")
 
@@ -523,6 +621,10 @@ def main():
         plot_throughput(summary_rows, keys,
                         args.out_thr, args.out_pps, args.out_lat)
 
+    elif args.mode == "percentile":
+        summary_rows = aggregate_throughput(args.csv_dir)
+        plot_percentile(summary_rows, keys, args.out_pct)
+
     elif args.mode == "power":
         summary_rows = aggregate_power(args.csv_dir)
         
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Tìm điểm bão hoà (knee) của một model: mức TX pps cao nhất mà RX pps vẫn bám theo.
+
+Bước 1: quét thô với bước coarse_step cho tới khi RX/TX < threshold.
+Bước 2: chia đôi (bisection) giữa mức đạt cuối cùng và mức hỏng đầu tiên
+        cho tới khi khoảng cách <= resolution.
+"""
+
+# --- Giá trị mặc định cho mục `search:` trong config ---
+DEFAULT_SEARCH = {
+    "coarse_step": 40000,   # bước quét thô (pps)
+    "threshold": 0.95,      # RX/TX tối thiểu để coi là "sustainable"
+    "resolution": 5000,     # dừng bisection khi khoảng [đạt, hỏng] <= resolution
+    "granularity": 1000,    # làm tròn mức pps khi chia đôi
+    "skip_rows": 5,         # số mẫu đầu bỏ qua khi tính RX pps trung bình
+}
+
+
+def load_search_config(cfg):
+    """Gộp mục `search:` của config với giá trị mặc định."""
+    return {**DEFAULT_SEARCH, **(cfg.get("search") or {})}
+
+
+def coarse_grid(pps_min, pps_max, step):
+    grid = list(range(pps_min, pps_max + 1, step))
+    if grid[-1] != pps_max:
+        grid.append(pps_max)
+    return grid
+
+
+def find_saturation(measure, pps_min, pps_max, scfg):
+    """
+    measure(pps) -> tỉ lệ RX/TX (hoặc None nếu cell lỗi).
+    Trả về (max_pps, probes): max_pps là mức cao nhất đạt threshold
+    (None nếu ngay pps_min đã hỏng), probes là dict {pps: ratio} đã đo.
+    """
+    threshold = scfg["threshold"]
+    probes = {}
+
+    def ok(pps):
+        if pps not in probes:
+            probes[pps] = measure(pps)
+        ratio = probes[pps]
+        return ratio is not None and ratio >= threshold
+
+    good, bad = None, None
+    for pps in coarse_grid(pps_min, pps_max, scfg["coarse_step"]):
+        if ok(pps):
+            good = pps
+        else:
+            bad = pps
+            break
+
+    if bad is None or good is None:
+        # Không bão hoà trong dải đo, hoặc bão hoà ngay từ pps_min
+        return good, probes
+
+    gran = scfg["granularity"]
+    while bad - good > scfg["resolution"]:
+        mid = (good + bad) // 2 // gran * gran
+        if mid <= good or mid >= bad:
+            break
+        if ok(mid):
+            good = mid
+        else:
+            bad = mid
+    return good, probes
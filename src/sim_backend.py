@@ -0,0 +1,751 @@
+#!/usr/bin/env python3
+"""
+Backend mô phỏng để chạy autorun_all.py trên laptop: không cần DUT, LANforge hay root.
+
+`init` sinh một cây thư mục tự chứa:
+  - executable giả cho xdp-loader, xdp_loader, bpftool, make, run_perf.sh (FlameGraph),
+    rf2qs.py / read_model_to_map.py và server.py (đo công suất),
+  - accounting_map giả: file 32 byte (cùng layout struct Accounting) trong bpffs giả,
+    kèm latency_hist giả (u64 mỗi bucket, layout mô tả trong latency_hist.info),
+  - /proc/stat và RAPL energy_uj giả,
+  - config_sim.yml trỏ mọi đường dẫn + mục `tools:` (sudo rỗng, backend "file") vào cây này.
+`run` bật stand-in HTTP cho /run, /stop, /run_acc của app.py cùng bộ sinh traffic
+rồi chạy autorun_all.py với config đó; `bench` chạy lặp lại và đo overhead orchestration
+mỗi cell (so với baseline để bắt regression).
+
+    python3 sim_backend.py --root /tmp/xdp_sim init
+    python3 sim_backend.py --root /tmp/xdp_sim run -- --branch quickscore --param sim --max-time 2
+    python3 sim_backend.py --root /tmp/xdp_sim bench --repeat 3 --baseline bench_base.json
+"""
+import argparse
+import json
+import math
+import os
+import random
+import re
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import yaml
+
+from logger import log
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_NAME = "config_sim.yml"
+PROG_NAME = "xdp_anomaly_detector"
+
+# time_in, proc_time, total_pkts, total_bytes -> khớp struct Accounting (4 × u64)
+ACCOUNTING_FMT = "=4Q"
+USER_HZ = 100
+
+# --- Giá trị mặc định cho mục `sim:` trong config_sim.yml ---
+DEFAULT_SIM = {
+    "port": 16099,
+    "iface": "sim0",
+    "tick": 0.1,              # chu kỳ cập nhật map / proc / RAPL (giây)
+    "pkt_size": 512,          # byte mỗi gói
+    "base_latency_ns": 300.0,
+    "per_tree_ns": 60.0,      # latency += per_tree_ns · max_tree · log2(max_leaves)
+    "jitter": 0.02,
+    "ncpus": 4,
+    "rx_cpu": 0,              # core xử lý XDP (map ARRAY dùng chung)
+    "percpu": False,          # True: accounting_map giả dạng PERCPU_ARRAY, ncpus × 32 byte
+    "rss_weights": [0.4, 0.3, 0.2, 0.1],  # tỉ lệ gói RSS chia cho từng core khi percpu
+    "latency_hist": True,     # pin thêm map histogram latency mỗi gói (cùng kiểu per-CPU với accounting_map)
+    "hist_kind": "log2",
+    "hist_buckets": 32,
+    "hist_bucket_ns": 1.0,
+    "latency_sigma": 0.35,    # độ trải lognormal của latency từng gói quanh giá trị trung bình
+    "idle_util": 0.02,
+    "idle_power_w": 2.7,
+    "busy_power_w": 6.4,
+    "convert_time": 0.02,     # giây giả lập cho rf2qs.py / make / load
+    "build_time": 0.05,
+    "load_time": 0.02,
+    "acc_time": 0.5,          # thời gian một lần /run_acc
+}
+
+TOOLS = {
+    # tên tool -> đường dẫn tương đối trong root
+    "xdp-loader": "bin/xdp-loader",
+    "bpftool": "bin/bpftool",
+    "make": "bin/make",
+    "perf": "bin/run_perf.sh",
+    "power-server": "server.py",
+    "loader": "xdp-program/xdp_prog/xdp_loader",
+    "convert": ["xdp-program/xdp_prog/rf2qs.py", "xdp-program/xdp_prog/read_model_to_map.py"],
+}
+
+
+# --- Cấu hình ---
+def load_sim_config(root):
+    path = os.path.join(root, CONFIG_NAME)
+    with open(path) as f:
+        cfg = yaml.safe_load(f)
+    return cfg, {**DEFAULT_SIM, **(cfg.get("sim") or {})}
+
+
+def sim_paths(root, scfg):
+    pin_dir = os.path.join(root, "bpffs", scfg["iface"])
+    return {
+        "pin_dir": pin_dir,
+        "map": os.path.join(pin_dir, "accounting_map"),
+        "hist": os.path.join(pin_dir, "latency_hist"),
+        "prog": os.path.join(pin_dir, "sim_prog.json"),
+        "proc_stat": os.path.join(root, "proc", "stat"),
+        "rapl": os.path.join(root, "rapl", "energy_uj"),
+        "next_id": os.path.join(root, "state", "next_prog_id"),
+    }
+
+
+def model_latency_ns(scfg, prog):
+    """Chi phí xử lý một gói của model đang load (0 nếu chưa load)."""
+    if not prog:
+        return 0.0
+    return scfg["base_latency_ns"] + scfg["per_tree_ns"] * prog["m"] * math.log2(max(prog["sz"], 2))
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_atomic(path, data):
+    tmp = f"{path}.tmp-{os.getpid()}"
+    with open(tmp, "w") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def read_map_rows(path):
+    """Mọi hàng của map giả (1 hàng với ARRAY, ncpus hàng với PERCPU_ARRAY)."""
+    size = struct.calcsize(ACCOUNTING_FMT)
+    with open(path, "rb") as f:
+        data = f.read()
+    return [list(struct.unpack_from(ACCOUNTING_FMT, data, off)) for off in range(0, len(data) - size + 1, size)]
+
+
+def read_map(path):
+    """Tổng các hàng, như read_accounting() thấy."""
+    return [sum(col) for col in zip(*read_map_rows(path))]
+
+
+def hist_bucket(scfg, latency_ns):
+    """Bucket của một gói, cùng cách chia với estimate_throughput_latency.hist_edges()."""
+    v = latency_ns / scfg["hist_bucket_ns"]
+    if scfg["hist_kind"] == "log2":
+        idx = 0 if v < 1 else int(math.log2(v)) + 1
+    else:
+        idx = int(v)
+    return min(idx, scfg["hist_buckets"] - 1)
+
+
+def hist_counts(scfg, n, latency_ns):
+    """Chia n gói vào các bucket theo latency lognormal quanh latency_ns (tối đa 64 mẫu mỗi tick)."""
+    counts = [0] * scfg["hist_buckets"]
+    draws = min(n, 64)
+    for i in range(draws):
+        lat = latency_ns * random.lognormvariate(0.0, scfg["latency_sigma"])
+        counts[hist_bucket(scfg, lat)] += n // draws + (1 if i < n % draws else 0)
+    return counts
+
+
+def rss_shares(scfg):
+    """Tỉ lệ gói mỗi core xử lý: one-hot rx_cpu, hoặc rss_weights khi map per-CPU."""
+    if not scfg["percpu"]:
+        return [1.0 if i == scfg["rx_cpu"] else 0.0 for i in range(scfg["ncpus"])]
+    weights = (list(scfg["rss_weights"]) + [0.0] * scfg["ncpus"])[:scfg["ncpus"]]
+    total = sum(weights) or 1.0
+    return [w / total for w in weights]
+
+
+# --- Bộ sinh traffic + counter ---
+class Simulator:
+    """Cập nhật accounting_map, /proc/stat và RAPL giả theo traffic đang replay."""
+
+    def __init__(self, root, scfg):
+        self.scfg = scfg
+        self.paths = sim_paths(root, scfg)
+        self.lock = threading.Lock()
+        self.traffic = None
+        self.carry = 0.0
+        self.busy = [0.0] * scfg["ncpus"]
+        self.total = [0.0] * scfg["ncpus"]
+        self.energy_uj = 0.0
+        self._stop = threading.Event()
+
+    def start_traffic(self, speed, duration, log_path):
+        with self.lock:
+            self.traffic = {"speed": speed, "until": time.monotonic() + duration, "log": log_path}
+        if log_path:
+            os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+            with open(log_path, "a") as f:
+                f.write(f"[SIM] replay speed={speed} pps duration={duration}s\n")
+
+    def stop_traffic(self):
+        with self.lock:
+            active = self.traffic is not None and time.monotonic() < self.traffic["until"]
+            self.traffic = None
+        return active
+
+    def rx_pps(self, prog):
+        with self.lock:
+            t = self.traffic
+        if not prog or t is None or time.monotonic() >= t["until"]:
+            return 0.0, 0.0
+        lat = model_latency_ns(self.scfg, prog)
+        capacity = 1e9 / lat
+        jitter = self.scfg["jitter"]
+        return min(t["speed"], capacity) * (1 + random.uniform(-jitter, jitter)), lat
+
+    def step(self, dt):
+        scfg, paths = self.scfg, self.paths
+        prog = _read_json(paths["prog"])
+        rx, lat = self.rx_pps(prog)
+
+        pkts = rx * dt + self.carry
+        n = int(pkts)
+        self.carry = pkts - n
+        shares = rss_shares(scfg)
+        if os.path.exists(paths["map"]):
+            try:
+                rows = read_map_rows(paths["map"])
+                # ARRAY: mọi gói cộng vào một hàng; PERCPU_ARRAY: chia theo RSS
+                row_shares = shares if len(rows) > 1 else [1.0]
+                out = b""
+                for (_, proc_time, total_pkts, total_bytes), share in zip(rows, row_shares):
+                    k = int(round(n * share))
+                    proc = k * lat * (1 + random.uniform(-scfg["jitter"], scfg["jitter"]))
+                    out += struct.pack(ACCOUNTING_FMT, time.monotonic_ns(), proc_time + int(proc),
+                                       total_pkts + k, total_bytes + k * scfg["pkt_size"])
+                with open(paths["map"], "r+b") as f:
+                    f.write(out)
+            except (OSError, struct.error):
+                pass
+        if n and lat and os.path.exists(paths["hist"]):
+            self._step_hist(n, lat, shares)
+
+        # CPU: core xử lý XDP bận theo phần rx·latency của nó, các core khác idle
+        utils = [min(1.0, scfg["idle_util"] + share * rx * lat / 1e9) for share in shares]
+        for i, u in enumerate(utils):
+            self.busy[i] += u * dt * USER_HZ
+            self.total[i] += dt * USER_HZ
+        lines = []
+        for name, busy, total in [("cpu", sum(self.busy), sum(self.total))] + [
+                (f"cpu{i}", b, t) for i, (b, t) in enumerate(zip(self.busy, self.total))]:
+            # user nice system idle iowait irq softirq steal: bận tính vào softirq (XDP)
+            lines.append(f"{name} 0 0 0 {int(total - busy)} 0 0 {int(busy)} 0 0 0")
+        _write_atomic(paths["proc_stat"], "\n".join(lines) + "\n")
+
+        power = scfg["idle_power_w"] + (scfg["busy_power_w"] - scfg["idle_power_w"]) * sum(utils) / len(utils)
+        self.energy_uj += power * dt * 1e6
+        _write_atomic(paths["rapl"], f"{int(self.energy_uj)}\n")
+
+    def _step_hist(self, n, lat, shares):
+        """Cộng gói của tick vào latency_hist giả (ncpus hàng nếu per-CPU, layout key × cpu)."""
+        scfg, path = self.scfg, self.paths["hist"]
+        nb = scfg["hist_buckets"]
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            ncpu = len(data) // (8 * nb)
+            vals = list(struct.unpack(f"={nb * ncpu}Q", data))
+            for cpu, share in enumerate(shares[:ncpu] if ncpu > 1 else [1.0]):
+                for b, c in enumerate(hist_counts(scfg, int(round(n * share)), lat)):
+                    vals[b * ncpu + cpu] += c
+            with open(path, "r+b") as f:
+                f.write(struct.pack(f"={nb * ncpu}Q", *vals))
+        except (OSError, struct.error):
+            pass
+
+    def run(self):
+        prev = time.monotonic()
+        while not self._stop.wait(self.scfg["tick"]):
+            now = time.monotonic()
+            self.step(now - prev)
+            prev = now
+
+    def stop(self):
+        self._stop.set()
+
+
+# --- Stand-in cho app.py (/run, /stop, /run_acc) ---
+class _AppHandler(BaseHTTPRequestHandler):
+    sim = None
+
+    def _reply(self, code, obj):
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}") if length else {}
+        except ValueError:
+            data = {}
+
+        if self.path == "/run":
+            speed = int(data.get("speed", 100000))
+            duration = int(data.get("duration", 125))
+            if not (10000 <= speed <= 200000):
+                return self._reply(400, {"status": "error", "message": "speed must be between 10000 and 100000"})
+            self.sim.start_traffic(speed, duration, data.get("log"))
+            return self._reply(200, {"status": "ok", "message": f"Started tcpreplay at {speed} PPS (simulated)"})
+        if self.path == "/stop":
+            stopped = self.sim.stop_traffic()
+            return self._reply(200, {"status": "stopped" if stopped else "no running process"})
+        if self.path == "/run_acc":
+            t0 = time.monotonic()
+            self.sim.start_traffic(100000, self.sim.scfg["acc_time"], None)
+            time.sleep(self.sim.scfg["acc_time"])
+            return self._reply(200, {"status": "ok", "stdout": "", "stderr": "", "exit_code": 0,
+                                     "elapsed_s": round(time.monotonic() - t0, 3)})
+        return self._reply(404, {"status": "error", "message": f"unknown endpoint {self.path}"})
+
+    def log_message(self, fmt, *fmt_args):
+        pass
+
+
+def start_backend(root):
+    """Bật Simulator + HTTP stand-in trong thread nền. Trả về hàm stop()."""
+    _, scfg = load_sim_config(root)
+    sim = Simulator(root, scfg)
+    handler = type("AppHandler", (_AppHandler,), {"sim": sim})
+    server = ThreadingHTTPServer(("127.0.0.1", scfg["port"]), handler)
+    threads = [threading.Thread(target=sim.run, daemon=True),
+               threading.Thread(target=server.serve_forever, daemon=True)]
+    for t in threads:
+        t.start()
+    log('INFO', f"[SIM] Backend on http://127.0.0.1:{scfg['port']} (root={root})")
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+        sim.stop()
+        for t in threads:
+            t.join(timeout=2)
+    return stop
+
+
+# --- Executable giả ---
+def _sleep_until_interrupt(seconds=None):
+    """Ngủ tới hết seconds hoặc tới khi nhận SIGINT (terminate() của collector_runtime)."""
+    t0 = time.monotonic()
+    try:
+        while seconds is None or time.monotonic() - t0 < seconds:
+            time.sleep(0.05)
+    except KeyboardInterrupt:
+        pass
+    return time.monotonic() - t0
+
+
+def tool_xdp_loader(root, scfg, argv):
+    paths = sim_paths(root, scfg)
+    if argv[:1] == ["unload"]:
+        # xdp-loader unload <iface> --all: gỡ program, pinned map vẫn còn như thật
+        if os.path.exists(paths["prog"]):
+            os.remove(paths["prog"])
+            print(f"Unloaded XDP programs from {argv[1] if len(argv) > 1 else scfg['iface']}")
+        return 0
+
+    parser = argparse.ArgumentParser(prog="xdp_loader")
+    parser.add_argument("--dev")
+    parser.add_argument("--progname", default=PROG_NAME)
+    parser.add_argument("-S", action="store_true")
+    opts, _ = parser.parse_known_args(argv)
+    time.sleep(scfg["load_time"])
+
+    model = _read_json("sim_model") or {"m": 1, "sz": 1}
+    os.makedirs(paths["pin_dir"], exist_ok=True)
+    os.makedirs(os.path.dirname(paths["next_id"]), exist_ok=True)
+    try:
+        with open(paths["next_id"]) as f:
+            prog_id = int(f.read())
+    except (OSError, ValueError):
+        prog_id = 100
+    with open(paths["next_id"], "w") as f:
+        f.write(str(prog_id + 1))
+    with open(paths["prog"], "w") as f:
+        json.dump({"id": prog_id, "name": opts.progname, "m": model["m"], "sz": model["sz"]}, f)
+    if not os.path.exists(paths["map"]):
+        with open(paths["map"], "wb") as f:
+            f.write(struct.pack(ACCOUNTING_FMT, 0, 0, 0, 0) * (scfg["ncpus"] if scfg["percpu"] else 1))
+    if scfg["latency_hist"] and not os.path.exists(paths["hist"]):
+        ncpu = scfg["ncpus"] if scfg["percpu"] else 1
+        with open(paths["hist"] + ".info", "w") as f:
+            # Như bpf_map_info: PERCPU_ARRAY = 6, ARRAY = 2
+            json.dump({"type": 6 if scfg["percpu"] else 2, "max_entries": scfg["hist_buckets"], "value_size": 8}, f)
+        with open(paths["hist"], "wb") as f:
+            f.write(bytes(8 * scfg["hist_buckets"] * ncpu))
+    print(f"Success: Loaded BPF-object and XDP prog {opts.progname} (id {prog_id}) on {opts.dev}")
+    return 0
+
+
+def tool_bpftool(root, scfg, argv):
+    paths = sim_paths(root, scfg)
+    prog = _read_json(paths["prog"])
+    if argv[:2] == ["prog", "show"]:
+        if prog:
+            print(f"{prog['id']}: ext  name {prog['name']}  tag 0000000000000000  gpl")
+        return 0
+
+    if argv[:2] == ["prog", "profile"]:
+        # bpftool prog profile id <id> <events...>: in counter khi bị SIGINT
+        events = argv[4:]
+        start = read_map(paths["map"]) if os.path.exists(paths["map"]) else [0] * 4
+        _sleep_until_interrupt()
+        end = read_map(paths["map"]) if os.path.exists(paths["map"]) else start
+        run_cnt = max(0, end[2] - start[2])
+        print(f"\n{run_cnt:>20} run_cnt")
+        for ev in events:
+            print(f"{int(run_cnt * random.uniform(0.5, 40)):>20} {ev}  ({random.uniform(95, 100):.2f}%)")
+        return 0
+
+    print(f"bpftool (sim): unsupported arguments {argv}", file=sys.stderr)
+    return 1
+
+
+def tool_make(root, scfg, argv):
+    parser = argparse.ArgumentParser(prog="make")
+    parser.add_argument("-C", dest="directory", default=".")
+    opts, _ = parser.parse_known_args(argv)
+    time.sleep(scfg["build_time"])
+    prog_dir = os.path.join(opts.directory, "xdp_prog")
+    model = _read_json(os.path.join(prog_dir, "sim_model")) or {"m": 1, "sz": 1}
+    with open(os.path.join(prog_dir, "xdp_prog_kern.o"), "w") as f:
+        f.write(f"SIMOBJ m={model['m']} sz={model['sz']}\n")
+    print(f"make: Entering directory '{opts.directory}'\n  CC xdp_prog_kern.o (simulated)")
+    return 0
+
+
+def tool_convert(root, scfg, argv):
+    """rf2qs.py --model ... / read_model_to_map.py --max_tree --max_leaves / --svm_model."""
+    parser = argparse.ArgumentParser(prog="convert")
+    parser.add_argument("--model")
+    parser.add_argument("--max_tree", type=int)
+    parser.add_argument("--max_leaves", type=int)
+    parser.add_argument("--svm_model")
+    opts, _ = parser.parse_known_args(argv)
+    time.sleep(scfg["convert_time"])
+    m, sz = 1, 1
+    if opts.max_tree and opts.max_leaves:
+        m, sz = opts.max_tree, opts.max_leaves
+    elif opts.model:
+        match = re.search(r"rf_(\d+)_(\d+)_model", os.path.basename(opts.model))
+        if match:
+            m, sz = int(match.group(1)), int(match.group(2))
+    with open("sim_model", "w") as f:
+        json.dump({"m": m, "sz": sz}, f)
+    print(f"Converted model m={m} sz={sz} (simulated)")
+    return 0
+
+
+def tool_perf(root, scfg, argv):
+    """run_perf.sh <tag> <duration> <core>: sinh FlameGraph SVG tối giản cho read_svg.py."""
+    tag, duration, core = argv[0], float(argv[1]), int(argv[2])
+    paths = sim_paths(root, scfg)
+    start = read_map(paths["map"]) if os.path.exists(paths["map"]) else [0] * 4
+    elapsed = _sleep_until_interrupt(duration)
+    end = read_map(paths["map"]) if os.path.exists(paths["map"]) else start
+    total = max(1, int(elapsed * 99))  # perf -F 99
+    share = 0.0
+    if elapsed > 0 and core < scfg["ncpus"]:
+        share = min(1.0, rss_shares(scfg)[core] * (end[1] - start[1]) / (elapsed * 1e9))
+    xdp = int(total * share)
+    with open(f"{tag}.svg", "w") as f:
+        f.write('<svg xmlns="http://www.w3.org/2000/svg">\n'
+                f"<g><title>all ({total:,} samples, 100%)</title></g>\n"
+                f"<g><title>do_xdp_generic ({xdp:,} samples, {share * 100:.2f}%)</title></g>\n"
+                "</svg>\n")
+    return 0
+
+
+def tool_power_server(root, scfg, argv):
+    """server.py --csv <file>: đọc RAPL giả mỗi giây tới khi bị SIGINT."""
+    parser = argparse.ArgumentParser(prog="server.py")
+    parser.add_argument("--csv", required=True)
+    opts, _ = parser.parse_known_args(argv)
+    rapl = sim_paths(root, scfg)["rapl"]
+
+    def energy():
+        try:
+            with open(rapl) as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    with open(opts.csv, "w", buffering=1) as f:
+        f.write("timestamp,power_W,energy_kWh\n")
+        prev_e, prev_t, total_j = energy(), time.monotonic(), 0.0
+        try:
+            while True:
+                time.sleep(1.0)
+                now_e, now_t = energy(), time.monotonic()
+                joules = (now_e - prev_e) / 1e6
+                total_j += joules
+                f.write(f"{time.time():.3f},{joules / (now_t - prev_t):.3f},{total_j / 3.6e6:.9f}\n")
+                prev_e, prev_t = now_e, now_t
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+TOOL_MAIN = {
+    "xdp-loader": tool_xdp_loader,
+    "loader": tool_xdp_loader,
+    "bpftool": tool_bpftool,
+    "make": tool_make,
+    "convert": tool_convert,
+    "perf": tool_perf,
+    "power-server": tool_power_server,
+}
+
+
+# --- init: sinh cây mô phỏng + config_sim.yml ---
+def _write_wrapper(path, root, tool):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(f"#!{sys.executable}\n"
+                "import sys\n"
+                f"sys.path.insert(0, {SRC_DIR!r})\n"
+                "import sim_backend\n"
+                f"sys.exit(sim_backend.main(['--root', {root!r}, 'tool', {tool!r}] + sys.argv[1:]))\n")
+    os.chmod(path, 0o755)
+
+
+def build_config(root, port):
+    """Config cùng cấu trúc config_pi.yml, mọi đường dẫn nằm trong root."""
+    scfg = {**DEFAULT_SIM, "port": port}
+    prog_dir = os.path.join(root, "xdp-program", "xdp_prog")
+    return {
+        "home_dir": root,
+        "base_dir": root,
+        "all_results_dir": os.path.join(root, "all_results"),
+        "iface": scfg["iface"],
+        "api_url_run_acc": f"http://127.0.0.1:{port}/run_acc",
+        "api_url_run": f"http://127.0.0.1:{port}/run",
+        "flamegraph_script": os.path.join(root, TOOLS["perf"]),
+        "xdp_prog_dir": os.path.join(root, "xdp-program"),
+        "xdp_prog_dir1": prog_dir,
+        "rf_model_dir": os.path.join(root, "models"),
+        "xdp_program": {
+            "kern_obj": os.path.join(prog_dir, "xdp_prog_kern.o"),
+            "stats_bin": os.path.join(prog_dir, "xdp_stats"),
+            "dump_bin": os.path.join(prog_dir, "dump_map_to_csv"),
+            "xdp_loader": os.path.join(root, TOOLS["loader"]),
+            "python_quickXDP": os.path.join(root, TOOLS["convert"][0]),
+            "python_RF": os.path.join(root, TOOLS["convert"][1]),
+            "throughput_script": os.path.join(SRC_DIR, "estimate_throughput_latency.py"),
+            "server_scripts": os.path.join(root, TOOLS["power-server"]),
+        },
+        "dataset": {"ground_truth": os.path.join(root, "data.csv"), "output_dir_acc": "run_accuracy"},
+        "logging": {"main_log": "sim_run.log"},
+        "results": {
+            "bpf": "results_bpf",
+            "perf": "results_perf",
+            "lanforge": os.path.join(root, "lanforge"),
+            "system_log": "log_all.log",
+            "throughput": "results_throughput",
+            "power": "results_power",
+            "timing": "results_timing",
+        },
+        "sweep": {
+            "pps": [20000, 100000, 180000],
+            "num_runs": 2,
+            "order": ["pps", "run", "model"],
+            "models": {"randforest": [[20, 64]], "quickscore": [[20, 64], [100, 32]], "default": [[1, 1]]},
+        },
+        "warmup": {"max_wait": 3, "min_wait": 0.3, "interval": 0.2, "window": 3,
+                   "tolerance": 0.1, "idle_max_wait": 1, "idle_pps": 100},
+        "sequential": {"ci_target": None, "min_runs": 2, "skip_rows": 0},
+        "search": {"coarse_step": 40000, "threshold": 0.95, "resolution": 5000,
+                   "granularity": 1000, "skip_rows": 0},
+        "cache": {"enabled": True, "dir": os.path.join(root, "artifact_cache"),
+                  "uncached_convert": ["randforest"]},
+        "collectors": {
+            "enabled": ["power_server", "cpu_power", "throughput", "perf", "bpftool"],
+            "start_lead": 0.5,
+            "throughput": {"hist_map": "latency_hist", "hist_kind": scfg["hist_kind"],
+                           "hist_bucket_ns": scfg["hist_bucket_ns"]},
+            "perf": {"cores": [0, 1]},
+            "cpu_power": {"interval": 0.5, "cpus": ["cpu"] + [f"cpu{i}" for i in range(scfg["ncpus"])],
+                          "proc_stat": os.path.join(root, "proc", "stat"),
+                          "rapl_energy": os.path.join(root, "rapl", "energy_uj")},
+        },
+        "tools": {
+            "sudo": [],
+            "xdp_loader_cli": os.path.join(root, TOOLS["xdp-loader"]),
+            "bpftool": os.path.join(root, TOOLS["bpftool"]),
+            "make": os.path.join(root, TOOLS["make"]),
+            "bpffs": os.path.join(root, "bpffs"),
+            "accounting_backend": "file",
+            "kill_strays": False,
+            "unload_settle": 0.0,
+            "cell_gap": 0.0,
+        },
+        "sim": scfg,
+    }
+
+
+def init_root(root, port=DEFAULT_SIM["port"], force=False):
+    root = os.path.abspath(root)
+    cfg_path = os.path.join(root, CONFIG_NAME)
+    if os.path.exists(cfg_path) and not force:
+        return cfg_path
+    if force:
+        shutil.rmtree(root, ignore_errors=True)
+
+    cfg = build_config(root, port)
+    for d in ["bpffs", "proc", "rapl", "state", "models", "lanforge", "all_results"]:
+        os.makedirs(os.path.join(root, d), exist_ok=True)
+    for tool, rel in TOOLS.items():
+        for r in (rel if isinstance(rel, list) else [rel]):
+            _write_wrapper(os.path.join(root, r), root, tool)
+
+    # Cây "mã nguồn" XDP cho artifact_cache: .o và sim_model là sản phẩm build
+    xdp_dir = cfg["xdp_prog_dir"]
+    with open(os.path.join(cfg["xdp_prog_dir1"], "xdp_prog_kern.c"), "w") as f:
+        f.write("/* simulated XDP program source */\n")
+    with open(os.path.join(xdp_dir, ".gitignore"), "w") as f:
+        f.write("*.o\nsim_model\n")
+    subprocess.run(["git", "init", "-q", xdp_dir], check=False,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    sim = Simulator(root, cfg["sim"])
+    sim.step(0.0)  # tạo proc/stat + RAPL ban đầu
+    with open(cfg_path, "w") as f:
+        yaml.safe_dump(cfg, f, sort_keys=False)
+    log('INFO', f"[SIM] Initialised simulation tree at {root}")
+    return cfg_path
+
+
+# --- run / bench ---
+DEFAULT_AUTORUN_ARGS = ["--branch", "quickscore", "--param", "sim", "--max-time", "2"]
+
+
+def run_autorun(root, autorun_args):
+    """Bật backend rồi chạy autorun_all.py với config_sim.yml. Trả về (returncode, wall_s)."""
+    cfg_path = init_root(root)
+    stop = start_backend(root)
+    try:
+        cmd = [sys.executable, os.path.join(SRC_DIR, "autorun_all.py"), "--config", cfg_path, *autorun_args]
+        log('DEBUG', f"Run autorun_all.py (simulated): {' '.join(cmd)}")
+        t0 = time.monotonic()
+        ret = subprocess.run(cmd, cwd=SRC_DIR).returncode
+        return ret, time.monotonic() - t0
+    finally:
+        stop()
+
+
+def bench(root, opts, extra):
+    """Chạy lặp sweep mô phỏng, overhead/cell = (wall - cells × max_time) / cells."""
+    autorun_args = ["--branch", opts.branch, "--param", opts.param,
+                    "--max-time", str(opts.max_time), "--fresh", *extra]
+    cfg_path = init_root(root)
+    with open(cfg_path) as f:
+        results_dir = yaml.safe_load(f)["all_results_dir"]
+    journal = os.path.join(results_dir, f"sweep_journal_{opts.branch}_{opts.param}.jsonl")
+
+    runs = []
+    for i in range(opts.repeat):
+        ret, wall = run_autorun(root, autorun_args)
+        if ret != 0:
+            log('ERROR', f"[BENCH] autorun_all.py exited with {ret}")
+            return ret
+        with open(journal) as f:
+            cells = sum(1 for line in f if line.strip())
+        overhead = (wall - cells * opts.max_time) / cells if cells else float("nan")
+        runs.append({"wall_s": round(wall, 3), "cells": cells, "overhead_per_cell_s": round(overhead, 3)})
+        log('INFO', f"[BENCH] Run {i + 1}/{opts.repeat}: {cells} cells in {wall:.1f}s, "
+                    f"overhead {overhead:.2f}s/cell")
+
+    result = {
+        "branch": opts.branch,
+        "max_time": opts.max_time,
+        "repeat": opts.repeat,
+        "overhead_per_cell_s": round(statistics.median(r["overhead_per_cell_s"] for r in runs), 3),
+        "runs": runs,
+    }
+    out = opts.out or os.path.join(root, f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+    log('INFO', f"[BENCH] Median overhead {result['overhead_per_cell_s']:.2f}s/cell -> {out}")
+
+    if opts.baseline:
+        with open(opts.baseline) as f:
+            base = json.load(f)["overhead_per_cell_s"]
+        limit = base * (1 + opts.tolerance)
+        if result["overhead_per_cell_s"] > limit:
+            log('ERROR', f"[BENCH] Regression: {result['overhead_per_cell_s']:.2f}s/cell > "
+                         f"baseline {base:.2f}s × {1 + opts.tolerance:.2f}")
+            return 1
+        log('INFO', f"[BENCH] Within baseline {base:.2f}s/cell (+{opts.tolerance:.0%})")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulated DUT/LANforge backend for autorun_all.py")
+    parser.add_argument("--root", default="/tmp/xdp_sim", help="Thư mục cây mô phỏng")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_init = sub.add_parser("init", help="Sinh cây mô phỏng + config_sim.yml")
+    p_init.add_argument("--port", type=int, default=DEFAULT_SIM["port"])
+    p_init.add_argument("--force", action="store_true", help="Xoá cây cũ rồi tạo lại")
+
+    sub.add_parser("serve", help="Chỉ bật HTTP stand-in + bộ sinh counter (Ctrl-C để dừng)")
+
+    p_run = sub.add_parser("run", help="Chạy autorun_all.py trên backend mô phỏng (tham số sau --)")
+    p_run.add_argument("autorun_args", nargs=argparse.REMAINDER)
+
+    p_bench = sub.add_parser("bench", help="Đo overhead orchestration mỗi cell")
+    p_bench.add_argument("--branch", default="quickscore")
+    p_bench.add_argument("--param", default="sim")
+    p_bench.add_argument("--max-time", type=int, default=2)
+    p_bench.add_argument("--repeat", type=int, default=1)
+    p_bench.add_argument("--out", default=None, help="File JSON kết quả")
+    p_bench.add_argument("--baseline", default=None, help="JSON bench cũ để so sánh")
+    p_bench.add_argument("--tolerance", type=float, default=0.2, help="Cho phép chậm hơn baseline (tỉ lệ)")
+    p_bench.add_argument("extra", nargs=argparse.REMAINDER, help="Tham số thêm cho autorun_all.py (sau --)")
+
+    p_tool = sub.add_parser("tool", help=argparse.SUPPRESS)
+    p_tool.add_argument("name", choices=sorted(TOOL_MAIN))
+    p_tool.add_argument("args", nargs=argparse.REMAINDER)
+
+    args = parser.parse_args(argv)
+    root = os.path.abspath(args.root)
+
+    if args.command == "init":
+        print(init_root(root, args.port, args.force))
+        return 0
+    if args.command == "tool":
+        _, scfg = load_sim_config(root)
+        return TOOL_MAIN[args.name](root, scfg, args.args)
+    if args.command == "serve":
+        init_root(root)
+        stop = start_backend(root)
+        _sleep_until_interrupt()
+        stop()
+        return 0
+    if args.command == "run":
+        extra = [a for a in args.autorun_args if a != "--"] or DEFAULT_AUTORUN_ARGS
+        ret, wall = run_autorun(root, extra)
+        log('INFO', f"[SIM] autorun_all.py finished with {ret} in {wall:.1f}s")
+        return ret
+    return bench(root, args, [a for a in args.extra if a != "--"])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
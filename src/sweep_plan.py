@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Sweep plan cho autorun_all.py:
+  - đọc ma trận sweep (pps × run × model) từ mục `sweep:` trong YAML config,
+  - bung ra danh sách cell theo thứ tự vòng lặp,
+  - ghi journal các cell đã chạy xong để lần chạy lại bỏ qua chúng.
+"""
+import itertools
+import json
+import os
+import time
+
+# --- Giá trị mặc định (giống vòng lặp hardcode cũ) ---
+DEFAULT_PPS = {"start": 10000, "stop": 200000, "step": 10000}
+DEFAULT_NUM_RUNS = 5
+DEFAULT_MODELS = {
+    "randforest": [[20, 64]],
+    "quickscore": [[20, 64], [100, 32]],
+    "default": [[1, 1]],
+}
+DEFAULT_ORDER = ["pps", "run", "model"]
+
+
+def expand_pps(spec):
+    """PPS có thể là list cụ thể hoặc dict {start, stop, step} (stop tính cả)."""
+    if isinstance(spec, dict):
+        return list(range(int(spec["start"]), int(spec["stop"]) + 1, int(spec["step"])))
+    return [int(p) for p in spec]
+
+
+def load_sweep_plan(cfg, branch, num_runs=None):
+    """
+    Đọc mục `sweep:` của config, trả về dict plan.
+    num_runs từ CLI (nếu có) được ưu tiên hơn giá trị trong config.
+    """
+    sweep = cfg.get("sweep") or {}
+    models = sweep.get("models") or DEFAULT_MODELS
+    model_keys = models.get(branch, models.get("default", DEFAULT_MODELS["default"]))
+    order = sweep.get("order", DEFAULT_ORDER)
+    if sorted(order) != sorted(DEFAULT_ORDER):
+        raise ValueError(f"sweep.order must be a permutation of {DEFAULT_ORDER}, got {order}")
+
+    return {
+        "pps": expand_pps(sweep.get("pps", DEFAULT_PPS)),
+        "num_runs": int(num_runs if num_runs is not None else sweep.get("num_runs", DEFAULT_NUM_RUNS)),
+        "models": [(int(m), int(sz)) for m, sz in model_keys],
+        "order": list(order),
+        "journal": sweep.get("journal"),
+    }
+
+
+def expand_cells(plan, branch, param):
+    """Bung plan thành list cell (dict), lồng vòng lặp theo plan["order"]."""
+    axes = {
+        "pps": [{"pps": p} for p in plan["pps"]],
+        "run": [{"run_idx": r} for r in range(1, plan["num_runs"] + 1)],
+        "model": [{"m": m, "sz": sz} for m, sz in plan["models"]],
+    }
+    cells = []
+    for combo in itertools.product(*(axes[a] for a in plan["order"])):
+        cell = {"branch": branch, "param": param}
+        for part in combo:
+            cell.update(part)
+        cells.append(cell)
+    return cells
+
+
+def write_cells(path, cells):
+    """Ghi list cell ra file JSONL (input cho autorun_all.py --cells-file)."""
+    with open(path, "w") as f:
+        for cell in cells:
+            f.write(json.dumps(cell) + "\n")
+
+
+def read_cells(path, branch=None, param=None):
+    """Đọc file cell JSONL; kiểm tra branch/param khớp với lần chạy hiện tại."""
+    cells = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            cell = json.loads(line)
+            if branch is not None and (cell["branch"] != branch or str(cell["param"]) != str(param)):
+                raise ValueError(f"Cell {cell_tag(cell)} does not belong to branch={branch} param={param}")
+            cells.append(cell)
+    return cells
+
+
+def cell_tag(cell):
+    """Tag của cell, trùng với pattern tên file {branch}_{param}_{pps}_{run_idx}_{m}_{sz}."""
+    return f"{cell['branch']}_{cell['param']}_{cell['pps']}_{cell['run_idx']}_{cell['m']}_{cell['sz']}"
+
+
+class SweepJournal:
+    """Journal JSONL: mỗi dòng là một cell đã hoàn thành."""
+
+    def __init__(self, path, fresh=False):
+        # autorun_all.py có os.chdir() giữa chừng -> giữ đường dẫn tuyệt đối
+        self.path = os.path.abspath(path)
+        self.done = {}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if fresh and os.path.exists(self.path):
+            os.rename(self.path, f"{self.path}.{time.strftime('%Y%m%d_%H%M%S')}")
+        if os.path.exists(self.path):
+            self._load()
+
+    def _load(self):
+        with open(self.path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Dòng cuối có thể bị cắt dở khi crash -> bỏ qua
+                    continue
+                if entry.get("status") == "done":
+                    self.done[entry["tag"]] = entry
+        # Đóng dòng bị cắt dở để entry tiếp theo không dính vào nó
+        with open(self.path, "rb+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def is_done(self, cell):
+        return cell_tag(cell) in self.done
+
+    def get(self, cell):
+        return self.done.get(cell_tag(cell))
+
+    def mark_done(self, cell, **extra):
+        entry = {"tag": cell_tag(cell), "status": "done", **cell,
+                 "finished_at": time.strftime("%Y-%m-%d %H:%M:%S"), **extra}
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.done[entry["tag"]] = entry
+        return entry
+
+    def pending(self, cells):
+        return [c for c in cells if not self.is_done(c)]
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Định dạng nhị phân cho chuỗi mẫu của estimate_throughput_latency.py (`--format bin`).
+
+Mỗi tick chỉ ghi một record u64 cố định vào file mmap cấp sẵn, không format chuỗi, không
+flush: [t_ns (monotonic), total_bytes, total_pkts, proc_time, (ncpu × 4 counter per-CPU),
+(số gói mỗi bucket histogram)]. Counter giữ nguyên giá trị cộng dồn, phía phân tích tự lấy hiệu.
+
+    python3 ts_binary.py info   results_throughput/<tag>.bin
+    python3 ts_binary.py to-csv results_throughput/<tag>.bin [<tag>.csv]
+
+Phân tích đọc thẳng bằng np.memmap qua load() / columns().
+"""
+import argparse
+import csv
+import mmap
+import os
+import struct
+import time
+from datetime import datetime
+
+import numpy as np
+
+MAGIC = b"XDPTS\x00\x00\x00"
+VERSION = 1
+HEADER_SIZE = 128
+# magic, version, header_size, record_words, ncpu, percpu, nbuckets, hist_kind, reserved,
+# capacity, count, mono0_ns, wall0_ns, interval_ns, bucket_ns
+HEADER = struct.Struct("<8s8I5Qd")
+COUNT_OFFSET = struct.calcsize("<8s8IQ")
+HIST_KINDS = {None: 0, "log2": 1, "linear": 2}
+# Cột cố định đầu mỗi record
+BASE_FIELDS = ("t_ns", "bytes", "pkts", "proc_time")
+
+
+def record_words(ncpu, percpu, nbuckets):
+    return len(BASE_FIELDS) + (ncpu * 4 if percpu else 0) + nbuckets
+
+
+class TimeSeriesWriter:
+    """
+    Ghi record vào file cấp sẵn `capacity` record qua mmap; đầy thì nhân đôi.
+    count trong header cập nhật sau mỗi record nên file đọc được cả khi sampler bị kill.
+    close() cắt file về đúng số record đã ghi.
+    """
+
+    def __init__(self, path, ncpu=1, percpu=False, nbuckets=0, hist_kind=None, bucket_ns=1.0,
+                 interval_ns=0, capacity=4096):
+        self.path = path
+        self.ncpu = ncpu
+        self.percpu = percpu
+        self.nbuckets = nbuckets
+        self.words = record_words(ncpu, percpu, nbuckets)
+        self.hist_off = len(BASE_FIELDS) + (ncpu * 4 if percpu else 0)
+        self.count = 0
+        self.capacity = 0
+        self.mm = None
+        self.records = None
+        self.f = open(path, "w+b")
+        self.header = [MAGIC, VERSION, HEADER_SIZE, self.words, ncpu, int(percpu), nbuckets,
+                       HIST_KINDS[hist_kind], 0, 0, 0, time.monotonic_ns(), time.time_ns(), interval_ns,
+                       float(bucket_ns)]
+        self._map(max(1, capacity))
+
+    def _map(self, capacity):
+        self._unmap()
+        os.ftruncate(self.f.fileno(), HEADER_SIZE + capacity * self.words * 8)
+        self.mm = mmap.mmap(self.f.fileno(), 0)
+        self.capacity = capacity
+        self.header[9] = capacity
+        self.header[10] = self.count
+        HEADER.pack_into(self.mm, 0, *self.header)
+        self.records = np.frombuffer(self.mm, dtype=np.uint64, count=capacity * self.words,
+                                     offset=HEADER_SIZE).reshape(capacity, self.words)
+
+    def _unmap(self):
+        # View numpy phải bỏ trước khi đóng mmap
+        self.records = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+    def append(self, t_ns, values, hist=None):
+        """values: ndarray ncpu × 4 của AccountingReader.read_percpu(); hist: HistogramReader.read()."""
+        if self.count == self.capacity:
+            self._map(self.capacity * 2)
+        rec = self.records[self.count]
+        rec[0] = t_ns
+        # Accounting: time_in, proc_time, total_pkts, total_bytes -> bytes, pkts, proc_time
+        rec[1:4] = values[:, 3:0:-1].sum(axis=0, dtype=np.uint64)
+        if self.percpu:
+            rec[4:self.hist_off] = values.ravel()
+        if self.nbuckets:
+            rec[self.hist_off:] = hist
+        self.count += 1
+        struct.pack_into("<Q", self.mm, COUNT_OFFSET, self.count)
+
+    def close(self):
+        if self.f is None:
+            return
+        self.header[9] = self.header[10] = self.count
+        HEADER.pack_into(self.mm, 0, *self.header)
+        self.mm.flush()
+        self._unmap()
+        os.ftruncate(self.f.fileno(), HEADER_SIZE + self.count * self.words * 8)
+        self.f.close()
+        self.f = None
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER.size or raw[:8] != MAGIC:
+        raise ValueError(f"{path}: not a sampler time-series file")
+    (_, version, header_size, words, ncpu, percpu, nbuckets, hist_kind, _, capacity, count,
+     mono0, wall0, interval_ns, bucket_ns) = HEADER.unpack_from(raw)
+    if version != VERSION:
+        raise ValueError(f"{path}: unsupported version {version}")
+    kinds = {v: k for k, v in HIST_KINDS.items()}
+    return {
+        "header_size": header_size, "record_words": words, "ncpu": ncpu, "percpu": bool(percpu),
+        "nbuckets": nbuckets, "hist_kind": kinds.get(hist_kind), "bucket_ns": bucket_ns,
+        "capacity": capacity, "count": count, "mono0_ns": mono0, "wall0_ns": wall0,
+        "interval_ns": interval_ns,
+    }
+
+
+def load(path):
+    """(header, records): records là np.memmap chỉ đọc, count × record_words uint64."""
+    hdr = read_header(path)
+    if hdr["count"] == 0:
+        return hdr, np.zeros((0, hdr["record_words"]), dtype=np.uint64)
+    records = np.memmap(path, dtype=np.uint64, mode="r", offset=hdr["header_size"],
+                        shape=(hdr["count"], hdr["record_words"]))
+    return hdr, records
+
+
+def columns(hdr, records):
+    """Tách records thành các cột; percpu: n × ncpu × 4, hist: n × nbuckets (None nếu không có)."""
+    cols = {name: records[:, i] for i, name in enumerate(BASE_FIELDS)}
+    off = len(BASE_FIELDS)
+    cols["percpu"] = None
+    if hdr["percpu"]:
+        cols["percpu"] = records[:, off:off + hdr["ncpu"] * 4].reshape(-1, hdr["ncpu"], 4)
+        off += hdr["ncpu"] * 4
+    cols["hist"] = records[:, off:off + hdr["nbuckets"]] if hdr["nbuckets"] else None
+    return cols
+
+
+def metrics(path):
+    """(throughput_Bps, pps, latency_ns) mỗi interval, ndarray — cùng công thức với compute_metrics()."""
+    hdr, records = load(path)
+    cols = columns(hdr, records)
+    dt = np.diff(cols["t_ns"].astype(np.int64)) / 1e9
+    d = {k: np.diff(cols[k].astype(np.int64)) for k in ("bytes", "pkts", "proc_time")}
+    throughput = np.divide(d["bytes"], dt, out=np.zeros(len(dt)), where=dt > 0)
+    pps = np.divide(d["pkts"], dt, out=np.zeros(len(dt)), where=dt > 0)
+    latency = np.divide(d["proc_time"], d["pkts"], out=np.zeros(len(dt)), where=d["pkts"] > 0)
+    return throughput, pps, latency
+
+
+def to_csv(bin_path, csv_path=None):
+    """Đổi sang đúng CSV mà chế độ `--format csv` ghi ra. Trả về đường dẫn CSV."""
+    from estimate_throughput_latency import csv_header, metrics_row, hist_edges, hist_percentiles
+
+    csv_path = csv_path or os.path.splitext(bin_path)[0] + ".csv"
+    hdr, records = load(bin_path)
+    cols = columns(hdr, records)
+    if cols["percpu"] is not None:
+        values = cols["percpu"]
+    else:
+        # Map thường: dựng lại mảng 1 × 4 (time_in, proc_time, total_pkts, total_bytes)
+        values = np.zeros((len(records), 1, 4), dtype=np.uint64)
+        values[:, 0, 1], values[:, 0, 2], values[:, 0, 3] = cols["proc_time"], cols["pkts"], cols["bytes"]
+    edges = hist_edges(hdr["nbuckets"], hdr["hist_kind"], hdr["bucket_ns"]) if cols["hist"] is not None else None
+    t = cols["t_ns"].astype(np.int64)
+
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(csv_header(hdr["ncpu"] if hdr["percpu"] else 0, edges is not None))
+        for i in range(1, len(records)):
+            pct = None
+            if edges is not None:
+                delta = np.clip(cols["hist"][i].astype(np.int64) - cols["hist"][i - 1].astype(np.int64), 0, None)
+                pct = hist_percentiles(delta, edges)
+            *_, row = metrics_row(values[i - 1], values[i], (t[i] - t[i - 1]) / 1e9, (t[i] - t[0]) / 1e9,
+                                  hdr["percpu"], pct)
+            wall = (hdr["wall0_ns"] + int(t[i]) - hdr["mono0_ns"]) / 1e9
+            writer.writerow([datetime.fromtimestamp(wall).strftime("%Y-%m-%d %H:%M:%S")] + row)
+    return csv_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Đọc/đổi file nhị phân của sampler throughput")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_info = sub.add_parser("info", help="In header và số record")
+    p_info.add_argument("path")
+    p_csv = sub.add_parser("to-csv", help="Đổi sang CSV của estimate_throughput_latency.py")
+    p_csv.add_argument("path")
+    p_csv.add_argument("csv_path", nargs="?", default=None, help="Mặc định: cùng tên, đuôi .csv")
+    args = parser.parse_args()
+
+    if args.cmd == "info":
+        for key, value in read_header(args.path).items():
+            print(f"{key:<12} {value}")
+    else:
+        print(f"{args.path} -> {to_csv(args.path, args.csv_path)}")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Warm-up theo trạng thái ổn định thay cho sleep cố định.
+
+Lấy mẫu pinned accounting_map bằng estimate_throughput_latency.Sampler ngay trong process,
+nhận PPS/latency mỗi interval qua callback và dừng ngay khi các giá trị ổn định trong tolerance.
+Thời gian sleep cũ (60s) chỉ còn là cận trên.
+"""
+import time
+
+from logger import log
+
+# --- Giá trị mặc định cho mục `warmup:` trong config ---
+DEFAULT_WARMUP = {
+    "max_wait": 60.0,       # cận trên, bằng sleep(60) cũ
+    "min_wait": 3.0,        # chờ tối thiểu sau khi traffic bắt đầu
+    "interval": 1.0,        # chu kỳ poll map (giây)
+    "window": 5,            # số mẫu liên tiếp dùng để đánh giá ổn định
+    "tolerance": 0.05,      # (max - min) / mean cho phép của PPS và latency
+    "idle_max_wait": 5.0,   # cận trên khi chờ traffic cũ dừng (thay sleep(5))
+    "idle_pps": 100.0,      # dưới ngưỡng này coi như không còn traffic
+}
+
+
+def load_warmup_config(cfg):
+    """Gộp mục `warmup:` của config với giá trị mặc định."""
+    return {**DEFAULT_WARMUP, **(cfg.get("warmup") or {})}
+
+
+# Đã cảnh báo việc lùi về sleep cố định chưa (chỉ WARN lần đầu, sau đó DEBUG)
+_fallback_warned = False
+
+
+def _sampler():
+    # Import muộn: estimate_throughput_latency cần numpy + quyền bpf(2), chỉ có trên DUT
+    from estimate_throughput_latency import Sampler
+    return Sampler
+
+
+def is_steady(values, tolerance):
+    """True nếu dải (max - min) của values nằm trong tolerance * mean."""
+    mean = sum(values) / len(values)
+    if mean <= 0:
+        return False
+    return (max(values) - min(values)) / mean <= tolerance
+
+
+def _poll(map_path, interval, max_wait, done):
+    """
+    Lấy mẫu map mỗi interval (Sampler chạy ngay trong process) cho tới khi
+    done(pps_hist, lat_hist, elapsed) trả True hoặc hết max_wait. Trả về (settled, elapsed).
+    Nếu không đọc được map thì sleep hết max_wait như hành vi cũ.
+    """
+    t_start = time.monotonic()
+    try:
+        sampler = _sampler()(map_path, interval=interval, duration=max_wait)
+        sampler.reader.read()
+    except (ImportError, OSError) as e:
+        global _fallback_warned
+        if not _fallback_warned:
+            log('WARN', f"[WARMUP] Cannot read {map_path} ({e}): steady-state detection disabled, "
+                        f"falling back to fixed sleeps (run the orchestrator as root / with CAP_BPF)")
+            _fallback_warned = True
+        else:
+            log('DEBUG', f"[WARMUP] Cannot read {map_path} ({e}), sleeping {max_wait:.0f}s")
+        time.sleep(max_wait)
+        return False, time.monotonic() - t_start
+
+    pps_hist, lat_hist = [], []
+    settled = []
+
+    def on_sample(sample):
+        if sample.index == 0:
+            return
+        pps_hist.append(sample.pps)
+        lat_hist.append(sample.latency)
+        if done(pps_hist, lat_hist, time.monotonic() - t_start):
+            settled.append(True)
+            sampler.stop()
+
+    sampler.subscribe(on_sample)
+    sampler.run()
+    return bool(settled), time.monotonic() - t_start
+
+
+def wait_for_idle(map_path, wcfg):
+    """Chờ traffic cũ dừng hẳn (PPS về ~0), tối đa idle_max_wait giây."""
+    settled, elapsed = _poll(
+        map_path, min(wcfg["interval"], 0.5), wcfg["idle_max_wait"],
+        lambda pps, lat, t: pps[-1] < wcfg["idle_pps"],
+    )
+    log('INFO', f"[WARMUP] Idle {'reached' if settled else 'not confirmed'} after {elapsed:.1f}s")
+    return settled, elapsed
+
+
+def wait_for_steady_state(map_path, wcfg):
+    """
+    Chờ PPS và latency ổn định trong `window` mẫu liên tiếp.
+    Trả về (settled, elapsed); settled=False nghĩa là đã chạm cận trên max_wait.
+    """
+    window = int(wcfg["window"])
+    tol = wcfg["tolerance"]
+
+    def done(pps, lat, t):
+        if t < wcfg["min_wait"] or len(pps) < window:
+            return False
+        return is_steady(pps[-window:], tol) and is_steady(lat[-window:], tol)
+
+    log('DEBUG', f"[WARMUP] Waiting for steady state on {map_path} "
+                 f"(window={window}, tol={tol:.0%}, max={wcfg['max_wait']:.0f}s)...")
+    settled, elapsed = _poll(map_path, wcfg["interval"], wcfg["max_wait"], done)
+    if settled:
+        log('INFO', f"[WARMUP] Steady state after {elapsed:.1f}s")
+    else:
+        log('WARN', f"[WARMUP] No steady state within {wcfg['max_wait']:.0f}s, starting measurement anyway")
+    return settled, elapsed